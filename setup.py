@@ -108,6 +108,8 @@ setup(name=name,
         'bin/trytond-console',
         'bin/trytond-cron',
         'bin/trytond-worker',
+        'bin/trytond-hub',
+        'bin/trytond-bus',
         'bin/trytond-stat',
         ],
     classifiers=[
@@ -176,6 +178,7 @@ setup(name=name,
         'coroutine': ['gevent>=1.1'],
         'image': ['pillow'],
         'completion': ['argcomplete'],
+        'orjson': ['orjson'],
         },
     dependency_links=dependency_links,
     zip_safe=False,
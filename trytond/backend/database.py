@@ -58,6 +58,10 @@ class DatabaseInterface(object):
     def nextid(self, connection, table):
         pass
 
+    def nextids(self, connection, table, count):
+        "Return a list of count new ids for the table or None"
+        pass
+
     def setnextid(self, connection, table, value):
         pass
 
@@ -74,6 +78,22 @@ class DatabaseInterface(object):
     def has_constraint(self, constraint):
         raise NotImplementedError
 
+    def savepoint(self, connection, name):
+        cursor = connection.cursor()
+        cursor.execute('SAVEPOINT "%s"' % name)
+
+    def rollback_savepoint(self, connection, name):
+        cursor = connection.cursor()
+        cursor.execute('ROLLBACK TO SAVEPOINT "%s"' % name)
+
+    def release_savepoint(self, connection, name):
+        cursor = connection.cursor()
+        cursor.execute('RELEASE SAVEPOINT "%s"' % name)
+
+    def stream_cursor(self, connection):
+        "Return a cursor fetching the rows by batch from the server"
+        return connection.cursor()
+
     def has_returning(self):
         return False
 
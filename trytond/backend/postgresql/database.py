@@ -4,6 +4,7 @@ import json
 import logging
 import os
 import time
+import uuid
 import warnings
 from collections import defaultdict
 from datetime import datetime
@@ -415,6 +416,13 @@ class Database(DatabaseInterface):
         cursor.execute("SELECT NEXTVAL(%s)", (table + '_id_seq',))
         return cursor.fetchone()[0]
 
+    def nextids(self, connection, table, count):
+        cursor = connection.cursor()
+        cursor.execute(
+            "SELECT NEXTVAL(%s) FROM generate_series(1, %s)",
+            (table + '_id_seq', count))
+        return [i for i, in cursor]
+
     def setnextid(self, connection, table, value):
         cursor = connection.cursor()
         cursor.execute("SELECT SETVAL(%s, %s)", (table + '_id_seq', value))
@@ -723,6 +731,10 @@ class Database(DatabaseInterface):
     def has_channel(self):
         return True
 
+    def stream_cursor(self, connection):
+        # A named cursor is declared on the server
+        return connection.cursor('stream_%s' % uuid.uuid4().hex)
+
     def has_extension(self, extension_name):
         if extension_name in self._extensions[self.name]:
             return self._extensions[self.name][extension_name]
@@ -578,6 +578,25 @@ class Database(DatabaseInterface):
         # This call is not thread safe
         return cursor.lastrowid
 
+    def nextids(self, connection, table, count):
+        # Reserve the ids in the AUTOINCREMENT sequence which takes the write
+        # lock of the database
+        cursor = connection.cursor()
+        cursor.execute(
+            'SELECT seq FROM sqlite_sequence WHERE name = ?', (table,))
+        row = cursor.fetchone()
+        if row:
+            start, = row
+            cursor.execute(
+                'UPDATE sqlite_sequence SET seq = ? WHERE name = ?',
+                (start + count, table))
+        else:
+            start = 0
+            cursor.execute(
+                'INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)',
+                (table, count))
+        return list(range(start + 1, start + count + 1))
+
     def lock(self, connection, table):
         pass
 
@@ -587,6 +606,12 @@ class Database(DatabaseInterface):
     def has_constraint(self, constraint):
         return False
 
+    def savepoint(self, connection, name):
+        # A savepoint outside a transaction would be committed on release
+        if not connection.in_transaction:
+            connection.execute('BEGIN %s' % (connection.isolation_level or ''))
+        super().savepoint(connection, name)
+
     def has_multirow_insert(self):
         return True
 
@@ -6,16 +6,23 @@ import json
 import logging
 import os
 import selectors
+import socket
+import sys
 import threading
 import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
 
 try:
     from http import HTTPStatus
 except ImportError:
     from http import client as HTTPStatus
 
-from urllib.parse import urljoin
+from urllib.parse import unquote_to_bytes, urljoin
+
+from sql import Table
+from sql.functions import CurrentTimestamp
 
 from werkzeug.exceptions import BadRequest
 from werkzeug.exceptions import NotImplemented as NotImplementedException
@@ -23,8 +30,9 @@ from werkzeug.utils import redirect
 from werkzeug.wrappers import Response
 
 from trytond import backend
-from trytond.config import config
-from trytond.protocols.jsonrpc import JSONDecoder, JSONEncoder
+from trytond.config import config, split_netloc
+from trytond.hub import listen, unlisten
+from trytond.protocols.jsonrpc import dumps, loads
 from trytond.tools import resolve
 from trytond.transaction import Transaction
 from trytond.wsgi import app
@@ -33,53 +41,78 @@ logger = logging.getLogger(__name__)
 
 _db_timeout = config.getint('database', 'timeout')
 _cache_timeout = config.getint('bus', 'cache_timeout')
+_cache_size = config.getint('bus', 'cache_size')
 _select_timeout = config.getint('bus', 'select_timeout')
 _long_polling_timeout = config.getint('bus', 'long_polling_timeout')
+# PostgreSQL limits the payload of notifications to 8000 bytes
+_notify_size = 7999
+_message_table = 'ir_bus_message'
 _allow_subscribe = config.getboolean('bus', 'allow_subscribe')
 _url_host = config.get('bus', 'url_host')
 _web_cache_timeout = config.getint('web', 'cache_timeout')
 
 
 class _MessageQueue:
+    "Ring buffer of the messages indexed by channel and message id"
 
     Message = collections.namedtuple('Message', 'channel content timestamp')
 
-    def __init__(self, timeout):
+    def __init__(self, timeout, size=None):
         super().__init__()
         self._lock = collections.defaultdict(threading.Lock)
         self._timeout = timeout
-        self._messages = []
+        self._size = size if size is not None else _cache_size
+        # The entries are (sequence, message) in increasing sequence
+        self._messages = collections.deque()
+        self._channels = collections.defaultdict(collections.deque)
+        self._ids = {}
+        self._sequence = 0
 
     def append(self, channel, element):
-        self._messages.append(
-            self.Message(channel, element, time.time()))
+        message = self.Message(channel, element, time.time())
+        with self._lock[os.getpid()]:
+            self._sequence += 1
+            entry = (self._sequence, message)
+            self._messages.append(entry)
+            self._channels[channel].append(entry)
+            message_id = element.get('message_id')
+            if message_id is not None:
+                self._ids[message_id] = self._sequence
+            self._expire(message.timestamp)
+
+    def _expire(self, now):
+        "Remove the oldest messages which are expired or over the size"
+        oldest = now - self._timeout
+        messages = self._messages
+        while messages and (
+                len(messages) > self._size
+                or messages[0][1].timestamp < oldest):
+            _, message = messages.popleft()
+            channel = self._channels[message.channel]
+            channel.popleft()
+            if not channel:
+                del self._channels[message.channel]
+            self._ids.pop(message.content.get('message_id'), None)
 
     def get_next(self, channels, from_id=None):
-        oldest = time.time() - self._timeout
-        to_delete_index = 0
-        found = False
-        first_message = None
-        message = self.Message(None, None, None)
-        for idx, item in enumerate(self._messages):
-            if item.timestamp < oldest:
-                to_delete_index = idx
-                continue
-            if item.channel not in channels:
-                continue
-            if not first_message:
-                first_message = item
-            if from_id is None or found:
-                message = item
-                break
-            found = item.content['message_id'] == from_id
-        else:
-            if first_message and not found:
-                message = first_message
-
         with self._lock[os.getpid()]:
-            del self._messages[:to_delete_index]
-
-        return message.channel, message.content
+            self._expire(time.time())
+            # Start from the first message if from_id is unknown or expired
+            after = self._ids.get(from_id, 0)
+            found = None
+            for channel in channels:
+                next_ = None
+                # Walk back only on the messages newer than from_id
+                for entry in reversed(self._channels.get(channel, ())):
+                    if entry[0] <= after:
+                        break
+                    next_ = entry
+                if next_ and (not found or next_[0] < found[0]):
+                    found = next_
+        if found:
+            _, message = found
+            return message.channel, message.content
+        return None, None
 
 
 class LongPollingBus:
@@ -92,15 +125,23 @@ class LongPollingBus:
 
     @classmethod
     def subscribe(cls, database, channels, last_message=None):
+        event = threading.Event()
+        response = cls._park(database, channels, last_message, event)
+        if response is not None:
+            return response
+        triggered = event.wait(_long_polling_timeout)
+        return cls._unpark(database, channels, last_message, triggered)
+
+    @classmethod
+    def _park(cls, database, channels, last_message, event):
+        """Return the response if a message is available
+        otherwise register the event to be set by the next message"""
         pid = os.getpid()
         with cls._queues_lock[pid]:
             start_listener = (pid, database) not in cls._queues
             cls._queues[pid, database]['timeout'] = time.time() + _db_timeout
             if start_listener:
-                listener = threading.Thread(
-                    target=cls._listen, args=(database,), daemon=True)
-                cls._queues[pid, database]['listener'] = listener
-                listener.start()
+                cls._start_listener(database)
 
         messages = cls._messages.get(database)
         if messages:
@@ -108,7 +149,6 @@ class LongPollingBus:
             if content:
                 return cls.create_response(channel, content)
 
-        event = threading.Event()
         for channel in channels:
             if channel in cls._queues[pid, database]['events']:
                 event_channel = cls._queues[pid, database]['events'][channel]
@@ -118,7 +158,10 @@ class LongPollingBus:
                         'events'][channel]
             event_channel.append(event)
 
-        triggered = event.wait(_long_polling_timeout)
+    @classmethod
+    def _unpark(cls, database, channels, last_message, triggered):
+        "Return the response of the parked subscription"
+        pid = os.getpid()
         if not triggered:
             response = cls.create_response(None, None)
         else:
@@ -143,6 +186,54 @@ class LongPollingBus:
         logger.debug('Bus: %s', response_data)
         return response_data
 
+    @classmethod
+    def _start_listener(cls, database):
+        pid = os.getpid()
+        listener = threading.Thread(
+            target=cls._listen, args=(database,), daemon=True)
+        cls._queues[pid, database]['listener'] = listener
+        listener.start()
+
+    @classmethod
+    def _dispatch(cls, database, notification):
+        pid = os.getpid()
+        payloads = loads(notification.payload)
+        if isinstance(payloads, dict):
+            payloads = [payloads]
+        ids = [p['id'] for p in payloads if 'channel' not in p]
+        if ids:
+            stored = cls._fetch(database, ids)
+            payloads = [
+                p if 'channel' in p else stored[p['id']]
+                for p in payloads if 'channel' in p or p['id'] in stored]
+
+        events = []
+        with cls._queues_lock[pid]:
+            for payload in payloads:
+                channel = payload['channel']
+                cls._messages[database].append(channel, payload['message'])
+                events.extend(cls._queues[pid, database]['events'][channel])
+                cls._queues[pid, database]['events'][channel].clear()
+        for event in events:
+            event.set()
+
+    @classmethod
+    def _fetch(cls, database, ids):
+        "Return the stored payloads of the ids"
+        db = backend.Database(database)
+        conn = db.get_connection(readonly=True, autocommit=True)
+        try:
+            cursor = conn.cursor()
+            table = Table(_message_table)
+            cursor.execute(*table.select(
+                    table.id, table.payload,
+                    where=table.id.in_(ids)))
+            return {
+                id_: loads(payload)
+                for id_, payload in cursor}
+        finally:
+            db.put_connection(conn)
+
     @classmethod
     def _listen(cls, database):
         db = backend.Database(database)
@@ -150,14 +241,11 @@ class LongPollingBus:
             raise NotImplementedException
 
         logger.info("listening on channel '%s'", cls._channel)
-        conn = db.get_connection(autocommit=True)
+        conn = listen(db, cls._channel)
         pid = os.getpid()
         selector = selectors.DefaultSelector()
         try:
-            cursor = conn.cursor()
-            cursor.execute('LISTEN "%s"' % cls._channel)
-
-            cls._messages[database] = messages = _MessageQueue(_cache_timeout)
+            cls._messages[database] = _MessageQueue(_cache_timeout)
 
             now = time.time()
             selector.register(conn, selectors.EVENT_READ)
@@ -165,20 +253,7 @@ class LongPollingBus:
                 selector.select(timeout=_select_timeout)
                 conn.poll()
                 while conn.notifies:
-                    notification = conn.notifies.pop()
-                    payload = json.loads(
-                        notification.payload,
-                        object_hook=JSONDecoder())
-                    channel = payload['channel']
-                    message = payload['message']
-                    messages.append(channel, message)
-
-                    with cls._queues_lock[pid]:
-                        events = cls._queues[pid, database][
-                            'events'][channel].copy()
-                        cls._queues[pid, database]['events'][channel].clear()
-                    for event in events:
-                        event.set()
+                    cls._dispatch(database, conn.notifies.pop())
                 now = time.time()
         except Exception:
             logger.error('bus listener on "%s" crashed', database,
@@ -189,17 +264,14 @@ class LongPollingBus:
             raise
         finally:
             selector.close()
-            db.put_connection(conn)
+            unlisten(db, conn)
 
         with cls._queues_lock[pid]:
             if cls._queues[pid, database]['timeout'] <= now:
                 del cls._queues[pid, database]
             else:
                 # A query arrived between the end of the while and here
-                listener = threading.Thread(
-                    target=cls._listen, args=(database,), daemon=True)
-                cls._queues[pid, database]['listener'] = listener
-                listener.start()
+                cls._start_listener(database)
 
     @classmethod
     def publish(cls, channel, message):
@@ -208,13 +280,229 @@ class LongPollingBus:
             logger.debug('Database backend do not support channels')
             return
 
-        cursor = transaction.connection.cursor()
         message['message_id'] = str(uuid.uuid4())
-        payload = json.dumps({
+        payload = dumps({
                 'channel': channel,
                 'message': message,
-                }, cls=JSONEncoder, separators=(',', ':'))
-        cursor.execute('NOTIFY "%s", %%s' % cls._channel, (payload,))
+                }).decode('utf-8')
+        datamanager = transaction.join(_PublishDataManager(cls))
+        datamanager.put(payload)
+
+    @classmethod
+    def _notify(cls, transaction, payloads):
+        "Send the payloads in as few notifications as possible"
+        cursor = transaction.connection.cursor()
+        payloads = [
+            json.dumps({'id': cls._store(transaction, p)})
+            if len(p.encode('utf-8')) + 2 > _notify_size else p
+            for p in payloads]
+        for batch in _batches(payloads, _notify_size):
+            cursor.execute(
+                'NOTIFY "%s", %%s' % cls._channel,
+                ('[%s]' % ','.join(batch),))
+
+    @classmethod
+    def _store(cls, transaction, payload):
+        "Store the payload too large for a notification and return its id"
+        table = Table(_message_table)
+        values = [
+            [payload, CurrentTimestamp(), transaction.user]]
+        columns = [table.payload, table.create_date, table.create_uid]
+        if transaction.readonly:
+            # The payload must be stored even if the transaction can not write
+            database = transaction.database
+            conn = database.get_connection(autocommit=True)
+            try:
+                cursor = conn.cursor()
+                cursor.execute(*table.insert(
+                        columns, values, returning=[table.id]))
+                id_, = cursor.fetchone()
+            finally:
+                database.put_connection(conn)
+        else:
+            cursor = transaction.connection.cursor()
+            cursor.execute(*table.insert(
+                    columns, values, returning=[table.id]))
+            id_, = cursor.fetchone()
+        return id_
+
+
+def _batches(payloads, size):
+    "Yield lists of payloads which fit as JSON array in size bytes"
+    batch, length = [], 1
+    for payload in payloads:
+        payload_length = len(payload.encode('utf-8')) + 1
+        if batch and length + payload_length > size:
+            yield batch
+            batch, length = [], 1
+        batch.append(payload)
+        length += payload_length
+    if batch:
+        yield batch
+
+
+class _PublishDataManager:
+    "Send the messages published in the transaction at commit"
+
+    def __init__(self, bus):
+        self.bus = bus
+        self.payloads = []
+
+    def put(self, payload):
+        self.payloads.append(payload)
+
+    def __eq__(self, other):
+        if not isinstance(other, _PublishDataManager):
+            return NotImplemented
+        return self.bus == other.bus
+
+    def abort(self, trans):
+        self.payloads = []
+
+    def savepoint(self, trans):
+        return len(self.payloads)
+
+    def rollback_savepoint(self, trans, state):
+        del self.payloads[state:]
+
+    def tpc_begin(self, trans):
+        pass
+
+    def commit(self, trans):
+        # The notifications are sent by the database at commit
+        payloads, self.payloads = self.payloads, []
+        if payloads:
+            self.bus._notify(trans, payloads)
+
+    def tpc_vote(self, trans):
+        pass
+
+    def tpc_finish(self, trans):
+        pass
+
+    def tpc_abort(self, trans):
+        self.payloads = []
+
+
+class SelectorBus(LongPollingBus):
+    """Long polling bus with a single thread per process listening on the
+    channel of all the databases
+
+    Only the listeners are merged, the subscriptions wait as with
+    LongPollingBus."""
+
+    _queues_lock = collections.defaultdict(threading.Lock)
+    _queues = collections.defaultdict(
+        lambda: {'timeout': None, 'events': collections.defaultdict(list)})
+    _messages = {}
+    _hubs = {}
+
+    @classmethod
+    def _start_listener(cls, database):
+        pid = os.getpid()
+        hub = cls._hubs.get(pid)
+        if not hub:
+            reader, writer = socket.socketpair()
+            reader.setblocking(False)
+            selector = selectors.DefaultSelector()
+            selector.register(reader, selectors.EVENT_READ)
+            cls._hubs[pid] = hub = {
+                'selector': selector,
+                'reader': reader,
+                'writer': writer,
+                'pending': [],
+                }
+            hub['listener'] = threading.Thread(
+                target=cls._loop, args=(hub,), daemon=True)
+            hub['listener'].start()
+        hub['pending'].append(database)
+        # Wake up the selector to listen immediately on the database
+        hub['writer'].send(b'\0')
+
+    @classmethod
+    def _open(cls, hub, database):
+        db = backend.Database(database)
+        if not db.has_channel():
+            logger.error(
+                "database '%s' does not support channels", database)
+            return False
+        logger.info(
+            "listening on channel '%s' of '%s'", cls._channel, database)
+        conn = listen(db, cls._channel)
+        try:
+            cls._messages[database] = _MessageQueue(_cache_timeout)
+            hub['selector'].register(
+                conn, selectors.EVENT_READ, (database, db))
+        except Exception:
+            unlisten(db, conn)
+            raise
+        return True
+
+    @classmethod
+    def _close(cls, hub, conn):
+        _, db = hub['selector'].get_key(conn).data
+        hub['selector'].unregister(conn)
+        unlisten(db, conn)
+
+    @classmethod
+    def _loop(cls, hub):
+        pid = os.getpid()
+        selector, reader = hub['selector'], hub['reader']
+        while True:
+            for key, _ in selector.select(timeout=_select_timeout):
+                if key.fileobj is reader:
+                    try:
+                        reader.recv(4096)
+                    except BlockingIOError:
+                        pass
+                    continue
+                conn, (database, _) = key.fileobj, key.data
+                try:
+                    conn.poll()
+                    while conn.notifies:
+                        cls._dispatch(database, conn.notifies.pop())
+                except Exception:
+                    logger.error('bus listener on "%s" crashed', database,
+                        exc_info=True)
+                    with cls._queues_lock[pid]:
+                        cls._queues.pop((pid, database), None)
+                    cls._close(hub, conn)
+
+            with cls._queues_lock[pid]:
+                pending, hub['pending'] = hub['pending'], []
+            for database in pending:
+                try:
+                    opened = cls._open(hub, database)
+                except Exception:
+                    logger.error('bus listener on "%s" crashed', database,
+                        exc_info=True)
+                    opened = False
+                if not opened:
+                    with cls._queues_lock[pid]:
+                        cls._queues.pop((pid, database), None)
+
+            now = time.time()
+            for key in list(selector.get_map().values()):
+                if key.fileobj is reader:
+                    continue
+                database, _ = key.data
+                with cls._queues_lock[pid]:
+                    queue = cls._queues.get((pid, database))
+                    if queue and queue['timeout'] > now:
+                        continue
+                    cls._queues.pop((pid, database), None)
+                cls._close(hub, key.fileobj)
+
+            # Remove the queues recreated for databases not listened
+            listened = {
+                k.data[0] for k in selector.get_map().values()
+                if k.fileobj is not reader}
+            with cls._queues_lock[pid]:
+                for key in list(cls._queues):
+                    if (key[0] == pid
+                            and key[1] not in listened
+                            and key[1] not in hub['pending']):
+                        del cls._queues[key]
 
 
 if config.get('bus', 'class'):
@@ -249,9 +537,14 @@ def subscribe(request, database_name):
         "getting bus messages from %s@%s%s for %s since %s",
         request.authorization.username, request.remote_addr, request.path,
         channels, last_message)
+    park = request.environ.get('trytond.bus.park')
+    if park is not None:
+        # The bus server answers once a message is received
+        park(database_name, channels, last_message)
+        return Response(content_type='application/json')
     bus_response = Bus.subscribe(database_name, channels, last_message)
     return Response(
-        json.dumps(bus_response, cls=JSONEncoder, separators=(',', ':')),
+        dumps(bus_response),
         content_type='application/json')
 
 
@@ -276,3 +569,311 @@ def notify(title, body=None, priority=1, user=None, client=None):
             'body': body,
             'priority': priority,
             })
+
+
+class _Parked:
+    "Event of a subscription parked in the bus server"
+
+    def __init__(self, server, client):
+        self._server = server
+        self._client = client
+        self._flag = False
+
+    def set(self):
+        self._flag = True
+        self._server._post(('message', self._client))
+
+    def is_set(self):
+        return self._flag
+
+
+class _Client:
+    "Connection of a client to the bus server"
+
+    def __init__(self, sock, address):
+        self.sock = sock
+        self.address = address
+        self.input = bytearray()
+        self.output = bytearray()
+        self.calling = False
+        self.closing = False
+        self.headers = []
+        # (database, channels, last_message) of the parked subscription
+        self.parked = None
+        self.event = None
+        self.deadline = None
+
+
+class BusServer:
+    """Answer the bus subscriptions from a single thread
+
+    The requests are authenticated by the application in a pool of threads
+    and the waiting subscriptions are parked as sockets in a selector instead
+    of holding a thread."""
+    # Maximum number of bytes of a request
+    max_request_size = 64 * 1024
+    _skip_headers = {'connection', 'content-encoding', 'content-length'}
+
+    def __init__(self, application=None, bus=None, threads=4):
+        self.application = application or app
+        self.bus = bus or Bus
+        self.selector = selectors.DefaultSelector()
+        self.executor = ThreadPoolExecutor(threads)
+        self.clients = {}
+        self._ready = collections.deque()
+        self._reader, self._writer = socket.socketpair()
+        self._reader.setblocking(False)
+        self._writer.setblocking(False)
+        self._running = False
+
+    def serve(self, server):
+        "Serve the subscriptions on the listening socket until stop"
+        server.setblocking(False)
+        self.selector.register(server, selectors.EVENT_READ, 'server')
+        self.selector.register(self._reader, selectors.EVENT_READ, 'wake')
+        self._running = True
+        try:
+            while self._running:
+                for key, events in self.selector.select(
+                        timeout=self._timeout()):
+                    if key.data == 'server':
+                        self._accept(server)
+                    elif key.data == 'wake':
+                        try:
+                            self._reader.recv(4096)
+                        except BlockingIOError:
+                            pass
+                    else:
+                        client = key.data
+                        if events & selectors.EVENT_WRITE:
+                            self._flush(client)
+                        if (events & selectors.EVENT_READ
+                                and client.sock in self.clients):
+                            self._read(client)
+                self._process()
+                self._expire()
+        finally:
+            for client in list(self.clients.values()):
+                self._drop(client)
+            self.selector.close()
+            self._reader.close()
+            self._writer.close()
+            self.executor.shutdown(wait=False)
+
+    def stop(self):
+        self._running = False
+        self._wake()
+
+    def _wake(self):
+        try:
+            self._writer.send(b'\0')
+        except OSError:
+            # A wake up is already pending or the server is stopped
+            pass
+
+    def _post(self, item):
+        "Queue an item for the selector thread"
+        self._ready.append(item)
+        self._wake()
+
+    def _timeout(self):
+        deadlines = [
+            c.deadline for c in self.clients.values() if c.deadline]
+        if deadlines:
+            return max(min(deadlines) - time.monotonic(), 0)
+        return _select_timeout
+
+    def _accept(self, server):
+        try:
+            sock, address = server.accept()
+        except BlockingIOError:
+            return
+        sock.setblocking(False)
+        client = _Client(sock, address)
+        self.clients[sock] = client
+        self.selector.register(sock, selectors.EVENT_READ, client)
+
+    def _read(self, client):
+        try:
+            chunk = client.sock.recv(65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            chunk = b''
+        if not chunk:
+            self._drop(client)
+            return
+        if client.calling or client.parked or client.closing:
+            # Only one request is answered per connection
+            return
+        client.input += chunk
+        if len(client.input) > self.max_request_size:
+            self._respond(
+                client, '413 Request Entity Too Large', [], b'')
+            return
+        try:
+            environ = self._environ(client)
+        except ValueError:
+            self._respond(client, '400 Bad Request', [], b'')
+            return
+        if environ is not None:
+            client.calling = True
+            self.executor.submit(self._call, client, environ)
+
+    def _environ(self, client):
+        "Return the WSGI environ of the request or None if it is incomplete"
+        head, sep, body = bytes(client.input).partition(b'\r\n\r\n')
+        if not sep:
+            return
+        request_line, *lines = head.decode('latin1').split('\r\n')
+        method, target, protocol = request_line.split(' ', 2)
+        headers = {}
+        for line in lines:
+            name, sep, value = line.partition(':')
+            if not sep:
+                raise ValueError("invalid header %r" % line)
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.pop('content-length', 0) or 0)
+        if len(body) < length:
+            return
+        path, _, query = target.partition('?')
+        host, port = client.sock.getsockname()[:2]
+        environ = {
+            'REQUEST_METHOD': method,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': unquote_to_bytes(path).decode('latin1'),
+            'QUERY_STRING': query,
+            'SERVER_NAME': host,
+            'SERVER_PORT': str(port),
+            'SERVER_PROTOCOL': protocol,
+            'REMOTE_ADDR': client.address[0] if client.address else '',
+            'CONTENT_LENGTH': str(length),
+            'CONTENT_TYPE': headers.pop('content-type', ''),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': BytesIO(body[:length]),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+            }
+        for name, value in headers.items():
+            environ['HTTP_' + name.upper().replace('-', '_')] = value
+        return environ
+
+    def _call(self, client, environ):
+        "Run the application on the request from the pool of threads"
+        parked = []
+        environ['trytond.bus.park'] = lambda *args: parked.append(args)
+        started = []
+
+        def start_response(status, headers, exc_info=None):
+            started[:] = [status, headers]
+
+        try:
+            result = self.application(environ, start_response)
+            try:
+                body = b''.join(result)
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+            status, headers = started
+        except Exception:
+            logger.error("bus server request failed", exc_info=True)
+            status, headers, body = '500 Internal Server Error', [], b''
+        self._post(('call', client, status, headers, body, parked))
+
+    def _process(self):
+        "Process the items posted to the selector thread"
+        while self._ready:
+            kind, client, *args = self._ready.popleft()
+            if client.sock not in self.clients:
+                continue
+            if kind == 'call':
+                client.calling = False
+                status, headers, body, parked = args
+                if not parked or not status.startswith('200'):
+                    self._respond(client, status, headers, body)
+                    continue
+                client.headers = headers
+                database, channels, last_message = parked[0]
+                client.event = _Parked(self, client)
+                response = self.bus._park(
+                    database, channels, last_message, client.event)
+                if response is not None:
+                    self._answer(client, response)
+                else:
+                    client.parked = database, channels, last_message
+                    client.deadline = (
+                        time.monotonic() + _long_polling_timeout)
+            elif kind == 'message':
+                if client.parked and client.event.is_set():
+                    self._unpark(client, True)
+
+    def _expire(self):
+        now = time.monotonic()
+        for client in list(self.clients.values()):
+            if client.parked and client.deadline <= now:
+                self._unpark(client, False)
+
+    def _unpark(self, client, triggered):
+        database, channels, last_message = client.parked
+        client.parked = client.deadline = None
+        self._answer(client, self.bus._unpark(
+                database, channels, last_message, triggered))
+
+    def _answer(self, client, response):
+        self._respond(client, '200 OK', client.headers, dumps(response))
+
+    def _respond(self, client, status, headers, body):
+        headers = [(n, v) for n, v in headers
+            if n.lower() not in self._skip_headers]
+        headers += [
+            ('Content-Length', str(len(body))),
+            ('Connection', 'close'),
+            ]
+        head = ''.join(
+            ['HTTP/1.1 %s\r\n' % status]
+            + ['%s: %s\r\n' % h for h in headers]
+            + ['\r\n'])
+        client.output += head.encode('latin1') + body
+        client.closing = True
+        self._flush(client)
+
+    def _flush(self, client):
+        try:
+            sent = client.sock.send(client.output)
+        except BlockingIOError:
+            sent = 0
+        except OSError:
+            self._drop(client)
+            return
+        del client.output[:sent]
+        if not client.output and client.closing:
+            self._drop(client)
+            return
+        events = selectors.EVENT_READ
+        if client.output:
+            events |= selectors.EVENT_WRITE
+        if self.selector.get_key(client.sock).events != events:
+            self.selector.modify(client.sock, events, client)
+
+    def _drop(self, client):
+        if self.clients.pop(client.sock, None) is None:
+            return
+        self.selector.unregister(client.sock)
+        client.sock.close()
+
+
+def serve():
+    hostname, port = split_netloc(config.get('bus', 'listen'))
+    family = socket.AF_INET6 if ':' in hostname else socket.AF_INET
+    server = socket.socket(family)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind((hostname, port))
+    server.listen()
+    logger.info("bus server listening on '%s:%s'", hostname, port)
+    try:
+        BusServer(threads=config.getint('bus', 'threads')).serve(server)
+    finally:
+        server.close()
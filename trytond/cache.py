@@ -16,6 +16,7 @@ from sql.functions import CurrentTimestamp, Function
 
 from trytond import backend
 from trytond.config import config
+from trytond.hub import listen, unlisten
 from trytond.pool import Pool
 from trytond.tools import grouped_slice, resolve
 from trytond.transaction import Transaction
@@ -62,6 +63,15 @@ def _get_modules(cursor):
     return {m for m, in cursor}
 
 
+def _get_database_modules(database):
+    connection = database.get_connection(readonly=True, autocommit=True)
+    try:
+        with connection.cursor() as cursor:
+            return _get_modules(cursor)
+    finally:
+        database.put_connection(connection)
+
+
 class BaseCache(object):
     _instances = {}
 
@@ -106,6 +116,13 @@ class BaseCache(object):
     def set(self, key, value):
         raise NotImplementedError
 
+    def peek(self, dbname, key, default=None):
+        "Return the value of key for the database without transaction"
+        return default
+
+    def delete(self, key):
+        self.clear()
+
     def clear(self):
         raise NotImplementedError
 
@@ -139,6 +156,7 @@ class MemoryCache(BaseCache):
     A key value LRU cache with size limit.
     """
     _reset = WeakKeyDictionary()
+    _reset_keys = WeakKeyDictionary()
     _clean_last = dt.datetime.now()
     _default_lower = Transaction.monotonic_time()
     _listener = {}
@@ -196,6 +214,39 @@ class MemoryCache(BaseCache):
             pass
         return value
 
+    def peek(self, dbname, key, default=None):
+        if self.context:
+            return default
+        cache = self._database_cache.get(dbname)
+        # Without notifications, the cache is synchronized only at the start
+        # of transactions
+        if cache and (_clear_timeout
+                or not backend.Database(dbname).has_channel()):
+            return default
+        try:
+            (expire, result) = cache[key]
+            if expire and expire < dt.datetime.now():
+                self.miss += 1
+                return default
+            self.hit += 1
+            return result
+        except (KeyError, TypeError):
+            self.miss += 1
+            return default
+
+    def delete(self, key):
+        if self.context:
+            # The context can not be sent to the other processes
+            self.clear()
+            return
+        transaction = Transaction()
+        try:
+            self._get_cache().pop(key, None)
+        except TypeError:
+            return
+        self._reset_keys.setdefault(transaction, {}).setdefault(
+            self._name, set()).add(key)
+
     def clear(self):
         transaction = Transaction()
         self._reset.setdefault(transaction, set()).add(self._name)
@@ -209,6 +260,17 @@ class MemoryCache(BaseCache):
             Transaction.monotonic_time(),
             self._transaction_lower.get(dbname, self._default_lower))
 
+    def _delete(self, dbname, keys, timestamp=None):
+        logger.debug("deleting keys of cache '%s' of '%s'", self._name, dbname)
+        if timestamp:
+            self._timestamp[dbname] = timestamp
+        cache = self._database_cache[dbname]
+        for key in keys:
+            cache.pop(key, None)
+        self._transaction_lower[dbname] = max(
+            Transaction.monotonic_time(),
+            self._transaction_lower.get(dbname, self._default_lower))
+
     @classmethod
     def _clear_all(cls, dbname):
         for inst in cls._instances.values():
@@ -260,9 +322,11 @@ class MemoryCache(BaseCache):
 
     @classmethod
     def commit(cls, transaction):
-        table = Table(cls._table)
-        reset = cls._reset.pop(transaction, None)
-        if not reset:
+        reset = cls._reset.pop(transaction, set())
+        keys = {
+            n: k for n, k in cls._reset_keys.pop(transaction, {}).items()
+            if n not in reset}
+        if not reset and not keys:
             return
         database = transaction.database
         dbname = database.name
@@ -274,47 +338,72 @@ class MemoryCache(BaseCache):
                     cursor.execute(
                         'NOTIFY "%s", %%s' % cls._channel,
                         (json.dumps(list(sub_reset), separators=(',', ':')),))
+                # The count computed as
+                # 8000 (max notify size) / 160 (expected key data len)
+                for name, sub_keys in keys.items():
+                    for sub_keys in grouped_slice(sub_keys, 50):
+                        cursor.execute(
+                            'NOTIFY "%s", %%s' % cls._channel,
+                            (json.dumps({name: list(sub_keys)},
+                                    separators=(',', ':')),))
+            if reset:
+                # The timestamps are used as validator of the entity tags
+                connection = database.get_connection(
+                    readonly=False, autocommit=True)
+                try:
+                    with connection.cursor() as cursor:
+                        for name in reset:
+                            cls._touch(cursor, name)
+                    connection.commit()
+                finally:
+                    database.put_connection(connection)
         else:
             connection = database.get_connection(
                 readonly=False, autocommit=True)
             try:
                 with connection.cursor() as cursor:
-                    for name in reset:
-                        cursor.execute(*table.select(table.name, table.id,
-                                table.timestamp,
-                                where=table.name == name,
-                                limit=1))
-                        if cursor.fetchone():
-                            # It would be better to insert only
-                            cursor.execute(*table.update([table.timestamp],
-                                    [CurrentTimestamp()],
-                                    where=table.name == name))
-                        else:
-                            cursor.execute(*table.insert(
-                                    [table.timestamp, table.name],
-                                    [[CurrentTimestamp(), name]]))
-
-                        cursor.execute(*table.select(
-                                Max(table.timestamp),
-                                where=table.name == name))
-                        timestamp, = cursor.fetchone()
-
-                        cursor.execute(*table.select(
-                                _cast(Max(table.timestamp)),
-                                where=table.name == name))
-                        timestamp, = cursor.fetchone()
-
+                    for name in reset | keys.keys():
+                        timestamp = cls._touch(cursor, name)
                         inst = cls._instances[name]
-                        inst._clear(dbname, timestamp)
+                        if name in reset:
+                            inst._clear(dbname, timestamp)
+                        else:
+                            # The other processes can only clear everything
+                            inst._delete(dbname, keys[name], timestamp)
                 connection.commit()
             finally:
                 database.put_connection(connection)
             cls._clean_last = dt.datetime.now()
         reset.clear()
 
+    @classmethod
+    def _touch(cls, cursor, name):
+        "Update the timestamp of the named cache and return it"
+        table = Table(cls._table)
+        cursor.execute(*table.select(table.name, table.id,
+                table.timestamp,
+                where=table.name == name,
+                limit=1))
+        if cursor.fetchone():
+            # It would be better to insert only
+            cursor.execute(*table.update([table.timestamp],
+                    [CurrentTimestamp()],
+                    where=table.name == name))
+        else:
+            cursor.execute(*table.insert(
+                    [table.timestamp, table.name],
+                    [[CurrentTimestamp(), name]]))
+
+        cursor.execute(*table.select(
+                _cast(Max(table.timestamp)),
+                where=table.name == name))
+        timestamp, = cursor.fetchone()
+        return timestamp
+
     @classmethod
     def rollback(cls, transaction):
         cls._reset.pop(transaction, None)
+        cls._reset_keys.pop(transaction, None)
 
     @classmethod
     def drop(cls, dbname):
@@ -364,15 +453,12 @@ class MemoryCache(BaseCache):
 
             logger.info(
                 "listening on channel '%s' of '%s'", cls._channel, dbname)
-            conn = database.get_connection(autocommit=True)
+            conn = listen(database, cls._channel)
             selector = selectors.DefaultSelector()
-
-            cursor = conn.cursor()
-            cursor.execute('LISTEN "%s"' % cls._channel)
             current_thread.listening = True
 
             # Clear everything in case we missed a payload
-            Pool(dbname).refresh(_get_modules(cursor))
+            Pool(dbname).refresh(_get_database_modules(database))
             cls._clear_all(dbname)
 
             selector.register(conn, selectors.EVENT_READ)
@@ -382,9 +468,14 @@ class MemoryCache(BaseCache):
                 while conn.notifies:
                     notification = conn.notifies.pop()
                     if notification.payload == 'refresh pool':
-                        Pool(dbname).refresh(_get_modules(cursor))
+                        Pool(dbname).refresh(_get_database_modules(database))
                     elif notification.payload:
                         reset = json.loads(notification.payload)
+                        if isinstance(reset, dict):
+                            for name, keys in reset.items():
+                                inst = cls._instances[name]
+                                inst._delete(dbname, map(freeze, keys))
+                            continue
                         for name in reset:
                             inst = cls._instances[name]
                             inst._clear(dbname)
@@ -397,7 +488,7 @@ class MemoryCache(BaseCache):
             if selector:
                 selector.close()
             if conn:
-                database.put_connection(conn)
+                unlisten(database, conn)
             with cls._listener_lock[pid]:
                 if cls._listener.get((pid, dbname)) == current_thread:
                     del cls._listener[pid, dbname]
@@ -78,10 +78,12 @@ def get_parser_daemon():
 
 def get_parser_worker():
     parser = get_parser_daemon()
-    parser.add_argument("--name", dest='name',
-        help="work only on the named queue")
+    parser.add_argument("--name", dest='names', nargs='+', metavar='NAME',
+        help="work only on the named queues")
     parser.add_argument("-n", dest='processes', type=int,
-        help="number of processes to use")
+        help="number of processes (or threads) to use")
+    parser.add_argument("--threads", dest='threads', action='store_true',
+        help="run the tasks in threads instead of processes")
     parser.add_argument("--max", dest='maxtasksperchild', type=int,
         help="number of tasks a worker process before being replaced")
     parser.add_argument("-t", "--timeout", dest='timeout', default=60,
@@ -93,6 +95,31 @@ def get_parser_cron():
     parser = get_parser_daemon()
     parser.add_argument("-1", "--once", dest='once', action='store_true',
         help="run pending tasks and halt")
+    parser.add_argument("-n", dest='workers', type=int, default=1,
+        help="number of crons to run concurrently")
+    parser.add_argument("--processes", dest='processes',
+        action='store_true',
+        help="run the crons in processes instead of threads")
+    parser.add_argument("--queue", dest='queue', action='store_true',
+        help="push the due crons into the task queue instead of running them")
+    return parser
+
+
+def get_parser_hub():
+    parser = get_base_parser()
+    parser.add_argument("-v", "--verbose", action='count',
+        dest="verbose", default=0, help="enable verbose mode")
+    parser.add_argument("--logconf", dest="logconf", metavar='FILE',
+        help="logging configuration file (ConfigParser format)")
+    parser.add_argument("--pidfile", dest="pidfile", metavar='FILE',
+        help="file where the server pid will be stored")
+    return parser
+
+
+def get_parser_bus():
+    parser = get_parser()
+    parser.add_argument("--pidfile", dest="pidfile", metavar='FILE',
+        help="file where the server pid will be stored")
     return parser
 
 
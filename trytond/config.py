@@ -55,6 +55,8 @@ class TrytonConfigParser(configparser.ConfigParser):
         self.set('web', 'root', os.path.join(os.path.expanduser('~'), 'www'))
         self.set('web', 'num_proxies', '0')
         self.set('web', 'cache_timeout', str(60 * 60 * 12))
+        self.set('web', 'compression_level', '6')
+        self.set('web', 'compression_min_size', '1024')
         self.add_section('database')
         self.set('database', 'uri',
             os.environ.get('TRYTOND_DATABASE_URI', 'sqlite://'))
@@ -93,7 +95,10 @@ class TrytonConfigParser(configparser.ConfigParser):
         self.set('bus', 'allow_subscribe', 'False')
         self.set('bus', 'long_polling_timeout', str(5 * 60))
         self.set('bus', 'cache_timeout', '5')
+        self.set('bus', 'cache_size', '10000')
         self.set('bus', 'select_timeout', '5')
+        self.set('bus', 'listen', 'localhost:8001')
+        self.set('bus', 'threads', '4')
         self.add_section('html')
         self.update_environ()
         self.update_etc()
@@ -1,11 +1,15 @@
 # This file is part of Tryton.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
+import datetime as dt
 import logging
 import threading
 import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 from trytond.pool import Pool
 from trytond.transaction import Transaction
+from trytond.worker import initializer
 
 __all__ = ['run']
 logger = logging.getLogger(__name__)
@@ -20,28 +24,82 @@ def run(options):
     for thread in threads:
         thread.join()
 
-    threads = {}
+    if options.queue:
+        return enqueue(options)
+
+    workers = options.workers or 1
+    if options.processes:
+        executor = ProcessPoolExecutor(
+            workers, initializer=initializer,
+            initargs=(options.database_names,))
+    else:
+        executor = ThreadPoolExecutor(workers)
+    logger.info("start %d cron workers", workers)
+
+    futures = defaultdict(list)
+    try:
+        while True:
+            for db_name in options.database_names:
+                running = futures[db_name] = [
+                    f for f in futures[db_name] if not f.done()]
+                if len(running) >= workers:
+                    logger.info(
+                        'skip "%s" as previous cron still running', db_name)
+                    continue
+                logger.info('start cron for "%s"', db_name)
+                # Each call runs the due crons until there is no more
+                for _ in range(workers - len(running)):
+                    running.append(executor.submit(run_crons, db_name))
+            if options.once:
+                break
+            time.sleep(60)
+    finally:
+        executor.shutdown(wait=True)
+
+
+def enqueue(options):
+    "Push the due crons into the queue when they are due"
+    logger.info("start cron dispatcher")
     while True:
+        next_calls = []
         for db_name in options.database_names:
-            thread = threads.get(db_name)
-            if thread and thread.is_alive():
-                logger.info(
-                    'skip "%s" as previous cron still running', db_name)
-                continue
-            database_list = Pool.database_list()
-            pool = Pool(db_name)
-            if db_name not in database_list:
-                with Transaction().start(db_name, 0, readonly=True):
-                    pool.init()
-            Cron = pool.get('ir.cron')
-            thread = threading.Thread(
-                    target=Cron.run,
-                    args=(db_name,), kwargs={})
-            logger.info('start thread for "%s"', db_name)
-            thread.start()
-            threads[db_name] = thread
+            next_call = enqueue_crons(db_name)
+            if next_call:
+                next_calls.append(next_call)
         if options.once:
             break
-        time.sleep(60)
-    for thread in threads.values():
-        thread.join()
+        # Wake up at the next call but check at least every minute for
+        # the modified crons
+        timeout = 60
+        if next_calls:
+            delay = min(next_calls) - dt.datetime.now()
+            timeout = min(max(delay.total_seconds(), 1), timeout)
+        time.sleep(timeout)
+
+
+def enqueue_crons(database_name):
+    try:
+        database_list = Pool.database_list()
+        pool = Pool(database_name)
+        if database_name not in database_list:
+            with Transaction().start(database_name, 0, readonly=True):
+                pool.init()
+        Cron = pool.get('ir.cron')
+        return Cron.enqueue(database_name)
+    except Exception:
+        logger.critical(
+            'cron dispatch failed for "%s"', database_name, exc_info=True)
+
+
+def run_crons(database_name):
+    try:
+        database_list = Pool.database_list()
+        pool = Pool(database_name)
+        if database_name not in database_list:
+            with Transaction().start(database_name, 0, readonly=True):
+                pool.init()
+        Cron = pool.get('ir.cron')
+        Cron.run(database_name)
+    except Exception:
+        logger.critical(
+            'cron failed for "%s"', database_name, exc_info=True)
@@ -0,0 +1,334 @@
+# This file is part of Tryton.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+"""Host-local hub relaying the database notifications to the processes.
+
+The hub keeps a single listening connection per database and relays the
+notifications to the local processes subscribed on its Unix socket.
+A subscription is a connection on the socket on which the client sends a JSON
+line with the ``database`` and the ``channel`` and receives an empty line
+once the hub listens followed by a JSON line per notification.
+"""
+import errno
+import json
+import logging
+import os
+import selectors
+import socket
+from collections import defaultdict, namedtuple
+
+from trytond import backend
+from trytond.config import config
+
+logger = logging.getLogger(__name__)
+address = 'trytond-hub.socket'
+
+Notify = namedtuple('Notify', ['channel', 'payload'])
+
+
+def _path():
+    path = config.get('database', 'path')
+    if path and hasattr(socket, 'AF_UNIX'):
+        return os.path.join(path, address)
+
+
+class Connection:
+    "Subscription to the hub with the interface of a listening connection"
+
+    def __init__(self, sock, data=b''):
+        self._sock = sock
+        self._sock.setblocking(False)
+        self._data = data
+        self.notifies = []
+        self._parse()
+
+    def fileno(self):
+        return self._sock.fileno()
+
+    def _parse(self):
+        *lines, self._data = self._data.split(b'\n')
+        for line in lines:
+            notification = json.loads(line)
+            self.notifies.append(
+                Notify(notification['channel'], notification['payload']))
+
+    def poll(self):
+        try:
+            data = self._sock.recv(65536)
+        except BlockingIOError:
+            return
+        if not data:
+            raise ConnectionError("hub closed the subscription")
+        self._data += data
+        self._parse()
+
+    def close(self):
+        self._sock.close()
+
+
+def connect(database_name, channel, timeout=5):
+    "Return a subscription to the hub or None if it is not available"
+    path = _path()
+    if not path:
+        return
+    sock = socket.socket(socket.AF_UNIX)
+    try:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        sock.sendall(json.dumps({
+                    'database': database_name,
+                    'channel': channel,
+                    }).encode('utf-8') + b'\n')
+        data = b''
+        while b'\n' not in data:
+            chunk = sock.recv(1024)
+            if not chunk:
+                raise ConnectionError("hub refused the subscription")
+            data += chunk
+    except OSError:
+        logger.debug("hub not available on '%s'", path, exc_info=True)
+        sock.close()
+        return
+    line, data = data.split(b'\n', 1)
+    if line:
+        logger.warning(
+            "hub can not listen on '%s' of '%s': %s",
+            channel, database_name, line.decode('utf-8'))
+        sock.close()
+        return
+    return Connection(sock, data)
+
+
+def listen(database, channel):
+    """Return a connection notified on the channel of the database
+    The connection must be released with unlisten"""
+    if config.getboolean('database', 'notification_hub'):
+        conn = connect(database.name, channel)
+        if conn:
+            return conn
+    conn = database.get_connection(autocommit=True)
+    try:
+        cursor = conn.cursor()
+        cursor.execute('LISTEN "%s"' % channel)
+    except Exception:
+        database.put_connection(conn)
+        raise
+    return conn
+
+
+def unlisten(database, conn):
+    if isinstance(conn, Connection):
+        conn.close()
+    else:
+        database.put_connection(conn)
+
+
+def _remove_stale(path):
+    "Remove the socket file left by a crashed hub"
+    if not os.path.exists(path):
+        return
+    with socket.socket(socket.AF_UNIX) as sock:
+        try:
+            sock.connect(path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            pass
+        else:
+            raise OSError(errno.EADDRINUSE, "hub already listening", path)
+    logger.info("remove stale socket '%s'", path)
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+class Hub:
+    "Relay the notifications of the databases to the subscribed clients"
+    # Maximum number of bytes pending for a client before it is dropped
+    max_buffer = 1024 * 1024
+
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        # database name -> (database, connection)
+        self.databases = {}
+        # (database name, channel) -> set of sockets
+        self.subscriptions = defaultdict(set)
+        # socket -> (database name, channel)
+        self.clients = {}
+        # socket -> bytes received but not yet parsed
+        self.inputs = {}
+        # socket -> bytes not yet sent
+        self.outputs = {}
+
+    def serve(self, path, timeout=60):
+        _remove_stale(path)
+        server = socket.socket(socket.AF_UNIX)
+        server.bind(path)
+        try:
+            server.listen()
+            server.setblocking(False)
+            self.selector.register(server, selectors.EVENT_READ, 'server')
+            logger.info("hub listening on '%s'", path)
+            while True:
+                for key, events in self.selector.select(timeout=timeout):
+                    if key.data == 'server':
+                        sock, _ = server.accept()
+                        sock.setblocking(False)
+                        self.inputs[sock] = b''
+                        self.outputs[sock] = bytearray()
+                        self.selector.register(
+                            sock, selectors.EVENT_READ, 'client')
+                    elif key.data == 'client':
+                        if events & selectors.EVENT_WRITE:
+                            self._flush(key.fileobj)
+                        if (events & selectors.EVENT_READ
+                                and key.fileobj in self.outputs):
+                            self._read(key.fileobj)
+                    else:
+                        self._notify(key.data[1])
+        finally:
+            self.selector.close()
+            server.close()
+            os.unlink(path)
+
+    def _read(self, sock):
+        try:
+            chunk = sock.recv(1024)
+        except BlockingIOError:
+            return
+        except OSError:
+            chunk = b''
+        if not chunk:
+            self._drop(sock)
+            return
+        if sock in self.clients:
+            # A subscribed client has nothing more to send
+            return
+        data = self.inputs[sock] + chunk
+        if b'\n' not in data:
+            self.inputs[sock] = data
+            return
+        line = data.split(b'\n', 1)[0]
+        try:
+            request = json.loads(line)
+            self._subscribe(sock, request['database'], request['channel'])
+        except Exception as exception:
+            logger.error("hub subscription failed", exc_info=True)
+            self._send(sock, str(exception).encode('utf-8'))
+            self._drop(sock)
+        else:
+            self._send(sock, b'')
+
+    def _subscribe(self, sock, database_name, channel):
+        if database_name not in self.databases:
+            database = backend.Database(database_name)
+            if not database.has_channel():
+                raise NotImplementedError(
+                    "database '%s' has no channel" % database_name)
+            conn = database.get_connection(autocommit=True)
+            self.databases[database_name] = database, conn
+            self.selector.register(
+                conn, selectors.EVENT_READ, ('database', database_name))
+        _, conn = self.databases[database_name]
+        subscribers = self.subscriptions[database_name, channel]
+        if not subscribers:
+            logger.info(
+                "hub listening on channel '%s' of '%s'",
+                channel, database_name)
+            cursor = conn.cursor()
+            cursor.execute('LISTEN "%s"' % channel)
+        subscribers.add(sock)
+        self.clients[sock] = database_name, channel
+
+    def _send(self, sock, line):
+        "Queue the line for the client and send what can be sent"
+        output = self.outputs.get(sock)
+        if output is None:
+            return False
+        output += line + b'\n'
+        if len(output) > self.max_buffer:
+            logger.warning("hub dropped a client too slow to receive")
+            self._drop(sock)
+            return False
+        return self._flush(sock)
+
+    def _flush(self, sock):
+        output = self.outputs[sock]
+        try:
+            sent = sock.send(output)
+        except BlockingIOError:
+            sent = 0
+        except OSError:
+            self._drop(sock)
+            return False
+        del output[:sent]
+        events = selectors.EVENT_READ
+        if output:
+            events |= selectors.EVENT_WRITE
+        if self.selector.get_key(sock).events != events:
+            self.selector.modify(sock, events, 'client')
+        return True
+
+    def _notify(self, database_name):
+        database, conn = self.databases[database_name]
+        try:
+            conn.poll()
+        except Exception:
+            logger.error(
+                "hub listener on '%s' crashed", database_name, exc_info=True)
+            self._close(database_name)
+            return
+        while conn.notifies:
+            notification = conn.notifies.pop(0)
+            line = json.dumps({
+                    'channel': notification.channel,
+                    'payload': notification.payload,
+                    }, separators=(',', ':')).encode('utf-8')
+            for sock in list(
+                    self.subscriptions.get(
+                        (database_name, notification.channel), ())):
+                self._send(sock, line)
+
+    def _drop(self, sock):
+        if sock.fileno() >= 0:
+            self.selector.unregister(sock)
+        sock.close()
+        self.inputs.pop(sock, None)
+        self.outputs.pop(sock, None)
+        key = self.clients.pop(sock, None)
+        if not key:
+            return
+        database_name, channel = key
+        subscribers = self.subscriptions[key]
+        subscribers.discard(sock)
+        if not subscribers:
+            del self.subscriptions[key]
+            if database_name not in self.databases:
+                return
+            _, conn = self.databases[database_name]
+            try:
+                cursor = conn.cursor()
+                cursor.execute('UNLISTEN "%s"' % channel)
+            except Exception:
+                logger.error(
+                    "hub unlisten on '%s' failed", database_name,
+                    exc_info=True)
+                self._close(database_name)
+                return
+        if not any(d == database_name for d, _ in self.subscriptions):
+            self._close(database_name)
+
+    def _close(self, database_name):
+        database, conn = self.databases.pop(database_name)
+        self.selector.unregister(conn)
+        database.put_connection(conn)
+        # The clients must subscribe again
+        for key in [k for k in self.subscriptions if k[0] == database_name]:
+            for sock in self.subscriptions.pop(key):
+                self.clients.pop(sock, None)
+                self._drop(sock)
+
+
+def serve():
+    path = _path()
+    if not path:
+        raise ValueError("the hub requires an AF_UNIX socket in a path")
+    Hub().serve(path)
@@ -3,9 +3,9 @@
 from trytond.pool import Pool
 
 from . import (
-    action, attachment, avatar, cache, calendar_, configuration, cron, date,
-    email_, error, export, lang, message, model, module, note, queue_, routes,
-    rule, sequence, session, translation, trigger, ui)
+    action, attachment, avatar, bus, cache, calendar_, configuration, cron,
+    date, email_, error, export, lang, message, model, module, note, queue_,
+    routes, rule, sequence, session, translation, trigger, ui)
 
 __all__ = ['register', 'routes']
 
@@ -78,6 +78,7 @@ def register():
         trigger.TriggerLog,
         session.Session,
         session.SessionWizard,
+        bus.BusMessage,
         queue_.Queue,
         calendar_.Month,
         calendar_.Day,
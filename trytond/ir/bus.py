@@ -0,0 +1,29 @@
+# This file is part of Tryton.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+import datetime
+
+from trytond.model import Index, ModelSQL, fields
+from trytond.tools import delete_by_chunk
+
+
+class BusMessage(ModelSQL):
+    "Bus Message"
+    __name__ = 'ir.bus.message'
+
+    payload = fields.Text("Payload", required=True)
+
+    @classmethod
+    def __setup__(cls):
+        super().__setup__()
+        table = cls.__table__()
+        cls.__rpc__ = {}
+        cls._sql_indexes.add(
+            Index(table, (table.create_date, Index.Range())))
+
+    @classmethod
+    def clean(cls, date=None):
+        "Delete the messages created before date"
+        if date is None:
+            date = datetime.datetime.now() - datetime.timedelta(hours=1)
+        table = cls.__table__()
+        delete_by_chunk(table, table.create_date < date)
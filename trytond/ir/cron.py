@@ -2,9 +2,13 @@
 # this repository contains the full copyright notices and license terms.
 import datetime
 import logging
+import threading
 import time
+from collections import defaultdict
 
 from dateutil.relativedelta import relativedelta
+from sql import Literal, Null
+from sql.aggregate import Min
 
 from trytond import backend
 from trytond.config import config
@@ -19,6 +23,9 @@ from trytond.transaction import Transaction
 from trytond.worker import run_task
 
 logger = logging.getLogger(__name__)
+# The cron ids currently running in the process per database
+_running = defaultdict(set)
+_running_lock = threading.Lock()
 
 
 class Cron(DeactivableMixin, ModelSQL, ModelView):
@@ -26,6 +33,7 @@ class Cron(DeactivableMixin, ModelSQL, ModelView):
     __name__ = "ir.cron"
     interval_number = fields.Integer('Interval Number', required=True)
     interval_type = fields.Selection([
+            ('seconds', "Seconds"),
             ('minutes', 'Minutes'),
             ('hours', 'Hours'),
             ('days', 'Days'),
@@ -38,7 +46,7 @@ class Cron(DeactivableMixin, ModelSQL, ModelView):
             [('minute', '>=', 0), ('minute', '<=', 59)],
             ],
         states={
-            'invisible': Eval('interval_type').in_(['minutes']),
+            'invisible': Eval('interval_type').in_(['seconds', 'minutes']),
             },
         depends=['interval_type'])
     hour = fields.Integer("Hour",
@@ -47,14 +55,15 @@ class Cron(DeactivableMixin, ModelSQL, ModelView):
             [('hour', '>=', 0), ('hour', '<=', 23)],
             ],
         states={
-            'invisible': Eval('interval_type').in_(['minutes', 'hours']),
+            'invisible': Eval('interval_type').in_(
+                ['seconds', 'minutes', 'hours']),
             },
         depends=['interval_type'])
     weekday = fields.Many2One(
         'ir.calendar.day', "Day of Week",
         states={
             'invisible': Eval('interval_type').in_(
-                ['minutes', 'hours', 'days']),
+                ['seconds', 'minutes', 'hours', 'days']),
             },
         depends=['interval_type'])
     day = fields.Integer("Day",
@@ -64,7 +73,7 @@ class Cron(DeactivableMixin, ModelSQL, ModelView):
             ],
         states={
             'invisible': Eval('interval_type').in_(
-                ['minutes', 'hours', 'days', 'weeks']),
+                ['seconds', 'minutes', 'hours', 'days', 'weeks']),
             },
         depends=['interval_type'])
     timezone = fields.Function(fields.Char("Timezone"), 'get_timezone')
@@ -74,6 +83,9 @@ class Cron(DeactivableMixin, ModelSQL, ModelView):
             ('ir.trigger|trigger_time', "Run On Time Triggers"),
             ('ir.queue|clean', "Clean Task Queue"),
             ('ir.error|clean', "Clean Errors"),
+            ('ir.session|clean', "Clean Sessions"),
+            ('ir.trigger.log|clean', "Clean Trigger Logs"),
+            ('ir.bus.message|clean', "Clean Bus Messages"),
             ], "Method", required=True)
 
     @classmethod
@@ -113,7 +125,8 @@ class Cron(DeactivableMixin, ModelSQL, ModelView):
     def view_attributes(cls):
         return [(
                 '//label[@id="time_label"]', 'states', {
-                    'invisible': Eval('interval_type') == 'minutes',
+                    'invisible': Eval('interval_type').in_(
+                        ['seconds', 'minutes']),
                 }),
             ]
 
@@ -122,24 +135,26 @@ class Cron(DeactivableMixin, ModelSQL, ModelView):
             + relativedelta(**{self.interval_type: self.interval_number})
             + relativedelta(
                 microsecond=0,
-                second=0,
+                second=0 if self.interval_type != 'seconds' else None,
                 minute=(
                     self.minute
-                    if self.interval_type != 'minutes'
+                    if self.interval_type not in {'seconds', 'minutes'}
                     else None),
                 hour=(
                     self.hour
-                    if self.interval_type not in {'minutes', 'hours'}
+                    if self.interval_type not in {
+                        'seconds', 'minutes', 'hours'}
                     else None),
                 day=(
                     self.day
                     if self.interval_type not in {
-                        'minutes', 'hours', 'days', 'weeks'}
+                        'seconds', 'minutes', 'hours', 'days', 'weeks'}
                     else None),
                 weekday=(
                     int(self.weekday.index)
                     if self.weekday
-                    and self.interval_type not in {'minutes', 'hours', 'days'}
+                    and self.interval_type not in {
+                        'seconds', 'minutes', 'hours', 'days'}
                     else None))).astimezone(tz.UTC).replace(tzinfo=None)
 
     @dualmethod
@@ -152,21 +167,138 @@ class Cron(DeactivableMixin, ModelSQL, ModelView):
             getattr(Model, method)()
 
     @classmethod
-    def run(cls, db_name):
+    def _claim(cls, now, exclude=None):
+        "Return the next cron to run and lock it"
+        transaction = Transaction()
+        database = transaction.database
+        cursor = transaction.connection.cursor()
+        table = cls.__table__()
+
+        with _running_lock:
+            running = _running[database.name]
+            where = ((table.active == Literal(True))
+                & ((table.next_call <= now) | (table.next_call == Null)))
+            if running or exclude:
+                where &= ~table.id.in_(list(running | set(exclude or [])))
+            query = table.select(
+                table.id, where=where,
+                order_by=[table.next_call.nulls_first, table.id],
+                limit=1)
+            if database.has_select_for():
+                For = database.get_select_for_skip_locked()
+                query.for_ = For('UPDATE')
+            cursor.execute(*query)
+            row = cursor.fetchone()
+            if not row:
+                return None
+            cron_id, = row
+            running.add(cron_id)
+        return cls(cron_id)
+
+    @classmethod
+    def _release(cls, db_name, cron):
+        with _running_lock:
+            _running[db_name].discard(cron.id)
+
+    @classmethod
+    def enqueue(cls, db_name):
+        """Push the due crons into the queue and return the next call
+
+        The next call of the pushed crons is computed at once so the worker
+        runs them."""
+        transaction = Transaction()
+        now = datetime.datetime.now()
+        with transaction.start(db_name, 0):
+            next_call = cls._enqueue(now)
+        while transaction.tasks:
+            task_id = transaction.tasks.pop()
+            run_task(db_name, task_id)
+        return next_call
+
+    @classmethod
+    def _enqueue(cls, now):
         transaction = Transaction()
+        database = transaction.database
+        cursor = transaction.connection.cursor()
+        table = cls.__table__()
+
+        query = table.select(
+            table.id,
+            where=(table.active == Literal(True))
+            & ((table.next_call <= now) | (table.next_call == Null)),
+            order_by=[table.next_call.nulls_first, table.id])
+        if database.has_select_for():
+            For = database.get_select_for_skip_locked()
+            query.for_ = For('UPDATE')
+        cursor.execute(*query)
+        crons = cls.browse([i for i, in cursor])
+        pending = cls._pending_ids()
+        for cron in crons:
+            # Each cron has its own task to be run in its own transaction
+            if cron.id not in pending:
+                with transaction.set_context(queue_name='cron'):
+                    cls.__queue__.run_once([cron])
+            cron.next_call = cron.compute_next_call(now)
+            logger.info(
+                '<Cron %s@%s %s> pushed', cron.id, database.name, cron.method)
+        cls.save(crons)
+
+        cursor.execute(*table.select(
+                Min(table.next_call),
+                where=table.active == Literal(True)))
+        next_call, = cursor.fetchone()
+        if isinstance(next_call, str):
+            next_call = datetime.datetime.fromisoformat(next_call)
+        return next_call
+
+    @classmethod
+    def _pending_ids(cls):
+        "Return the ids of the crons with a pending task"
+        pool = Pool()
+        Queue = pool.get('ir.queue')
+        ids = set()
+        tasks = Queue.search([
+                ('name', '=', 'cron'),
+                ('dequeued_at', '=', None),
+                ])
+        for task in tasks:
+            if (task.data['model'] == cls.__name__
+                    and task.data['method'] == 'run_once'):
+                instances = task.data['instances']
+                if isinstance(instances, int):
+                    instances = [instances]
+                ids.update(instances)
+        return ids
+
+    @classmethod
+    def run(cls, db_name):
         logger.info('cron started for "%s"', db_name)
+        done = set()
+        while True:
+            cron_id = cls._run_next(db_name, exclude=done)
+            if cron_id is None:
+                break
+            done.add(cron_id)
+        logger.info('cron finished for "%s"', db_name)
+
+    @classmethod
+    def _run_next(cls, db_name, exclude=None):
+        "Run the next due cron and return its id"
+        transaction = Transaction()
         now = datetime.datetime.now()
         retry = config.getint('database', 'retry')
-        with transaction.start(db_name, 0, context={'_skip_warnings': True}):
-            pool = Pool()
-            Error = pool.get('ir.error')
-            cls.lock()
-            crons = cls.search(['OR',
-                    ('next_call', '<=', now),
-                    ('next_call', '=', None),
-                    ])
-
-            for cron in crons:
+        cron = None
+        try:
+            with transaction.start(
+                    db_name, 0, context={'_skip_warnings': True}):
+                pool = Pool()
+                Error = pool.get('ir.error')
+                # The record stays locked until the end of the transaction
+                # so other processes skip it
+                cron = cls._claim(now, exclude=exclude)
+                if not cron:
+                    return None
+
                 def duration():
                     return (time.monotonic() - started) * 1000
                 started = time.monotonic()
@@ -195,7 +327,10 @@ class Cron(DeactivableMixin, ModelSQL, ModelView):
                     cron.save()
                     break
                 logger.info("%s in %i ms", name, duration())
+        finally:
+            if cron:
+                cls._release(db_name, cron)
         while transaction.tasks:
             task_id = transaction.tasks.pop()
             run_task(db_name, task_id)
-        logger.info('cron finished for "%s"', db_name)
+        return cron.id
@@ -9,7 +9,7 @@ from trytond.exceptions import UserError, UserWarning
 from trytond.model import Index, ModelSQL, ModelView, Workflow, fields
 from trytond.pool import Pool
 from trytond.pyson import Eval
-from trytond.tools import firstline
+from trytond.tools import delete_by_chunk, firstline
 from trytond.transaction import Transaction
 
 logger = logging.getLogger(__name__)
@@ -79,11 +79,13 @@ class Error(Workflow, ModelView, ModelSQL):
         super().__setup__()
         table = cls.__table__()
 
-        cls._sql_indexes.add(
-            Index(
-                table,
-                (table.state, Index.Equality()),
-                where=table.state.in_(['open', 'processing'])))
+        cls._sql_indexes.update({
+                Index(
+                    table,
+                    (table.state, Index.Equality()),
+                    where=table.state.in_(['open', 'processing'])),
+                Index(table, (table.create_date, Index.Range())),
+                })
         cls._transitions |= {
             ('open', 'processing'),
             ('processing', 'solved'),
@@ -143,8 +145,8 @@ class Error(Workflow, ModelView, ModelSQL):
         if date is None:
             date = (
                 dt.datetime.now() - dt.timedelta(days=clean_days))
-        errors = cls.search([('create_date', '<', date)])
-        cls.delete(errors)
+        table = cls.__table__()
+        delete_by_chunk(table, table.create_date < date)
 
     @classmethod
     @ModelView.button
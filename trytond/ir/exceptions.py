@@ -10,6 +10,7 @@ from .sequence import AffixError as SequenceAffixError
 from .sequence import MissingError as SequenceMissingError
 from .translation import OverriddenError as TranslationOverriddenError
 from .trigger import ConditionError as TriggerConditionError
+from .trigger import DomainError as TriggerDomainError
 
 __all__ = [
     DeactivateDependencyError,
@@ -21,4 +22,5 @@ __all__ = [
     SequenceMissingError,
     TranslationOverriddenError,
     TriggerConditionError,
+    TriggerDomainError,
     ]
@@ -1,15 +1,19 @@
 # This file is part of Tryton.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
 import datetime
+import hashlib
+import json
 
 from sql import Literal, Null, With
-from sql.aggregate import Min
+from sql.aggregate import Avg, Count, Max, Min, Sum
+from sql.conditionals import Case, Coalesce
 from sql.functions import CurrentTimestamp, Extract
 
 from trytond.config import config
 from trytond.model import Index, ModelSQL, fields
 from trytond.pool import Pool
-from trytond.tools import grouped_slice
+from trytond.protocols.jsonrpc import JSONEncoder
+from trytond.tools import delete_by_chunk, grouped_slice, reduce_ids
 from trytond.transaction import Transaction
 
 has_worker = config.getboolean('queue', 'worker', default=False)
@@ -32,24 +36,48 @@ class Queue(ModelSQL):
         help="When the task can start.")
     expected_at = fields.Timestamp("Expected at",
         help="When the task should be done.")
+    priority = fields.Integer(
+        "Priority", required=True,
+        help="The tasks with the highest priority are run first.")
+    key = fields.Char(
+        "Key", readonly=True,
+        help="The pending tasks with the same key are coalesced.")
 
     @classmethod
     def __setup__(cls):
         super().__setup__()
         table = cls.__table__()
 
-        cls._sql_indexes.add(
+        cls._sql_indexes.update({
             Index(
                 table,
                 (table.scheduled_at, Index.Range(nulls_first=True)),
                 (table.expected_at, Index.Range(nulls_first=True)),
                 (table.dequeued_at, Index.Equality()),
-                (table.name, Index.Equality())))
+                (table.name, Index.Equality())),
+            Index(
+                table,
+                (table.priority, Index.Range(order='DESC')),
+                (table.scheduled_at, Index.Range(nulls_first=True)),
+                (table.expected_at, Index.Range(nulls_first=True)),
+                where=table.dequeued_at == Null),
+            Index(
+                table,
+                (table.key, Index.Equality()),
+                (table.name, Index.Equality()),
+                where=(table.dequeued_at == Null) & (table.key != Null)),
+            Index(table, (table.dequeued_at, Index.Range())),
+            Index(table, (table.finished_at, Index.Range())),
+            })
 
     @classmethod
     def default_enqueued_at(cls):
         return datetime.datetime.now()
 
+    @classmethod
+    def default_priority(cls):
+        return 0
+
     @classmethod
     def copy(cls, records, default=None):
         if default is None:
@@ -62,16 +90,63 @@ class Queue(ModelSQL):
         return super(Queue, cls).copy(records, default=default)
 
     @classmethod
-    def push(cls, name, data, scheduled_at=None, expected_at=None):
+    def _pending(cls, name, key, exclude=None):
+        "Return the ids of the pending tasks with the key locked"
+        transaction = Transaction()
+        database = transaction.database
+        cursor = transaction.connection.cursor()
+        table = cls.__table__()
+        where = ((table.name == name)
+            & (table.key == key)
+            & (table.dequeued_at == Null))
+        if exclude is not None:
+            where &= table.id != exclude
+        query = table.select(table.id, where=where, order_by=[table.id])
+        if database.has_select_for():
+            For = database.get_select_for_skip_locked()
+            query.for_ = For('UPDATE')
+        cursor.execute(*query)
+        return [i for i, in cursor]
+
+    @classmethod
+    def _coalesce_key(cls, data):
+        "Return the key of the data with all but the instances"
+        data = {k: v for k, v in data.items() if k != 'instances'}
+        data = json.dumps(
+            data, cls=JSONEncoder, separators=(',', ':'), sort_keys=True)
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def push(cls, name, data, scheduled_at=None, expected_at=None,
+            priority=None, coalesce=False):
+        """Push a task and return its id
+
+        If coalesce is set, the instances are merged into a pending task with
+        the same name and data except the instances. If coalesce is an
+        integer, it is the maximum number of instances of the merged task."""
         transaction = Transaction()
         database = transaction.database
         cursor = transaction.connection.cursor()
+        if priority is None:
+            priority = cls.default_priority()
+        key = cls._coalesce_key(data) if coalesce else None
         with transaction.set_user(0):
+            if key:
+                size = None if coalesce is True else coalesce
+                record = cls._merge(
+                    name, key, data, size=size, scheduled_at=scheduled_at,
+                    expected_at=expected_at, priority=priority)
+                if record:
+                    if not has_worker and record.id not in transaction.tasks:
+                        transaction.tasks.append(record.id)
+                    return record.id
             record, = cls.create([{
                         'name': name,
                         'data': data,
                         'scheduled_at': scheduled_at,
                         'expected_at': expected_at,
+                        'priority': priority,
+                        'key': key,
                         }])
         if database.has_channel():
             cursor.execute('NOTIFY "%s"', (cls.__name__,))
@@ -80,32 +155,78 @@ class Queue(ModelSQL):
         return record.id
 
     @classmethod
-    def pull(cls, database, connection, name=None):
+    def _merge(cls, name, key, data, size=None,
+            scheduled_at=None, expected_at=None, priority=0):
+        "Merge data into a pending task with the key and return it"
+        instances = data['instances']
+        for task in cls.browse(cls._pending(name, key)):
+            pending = task.data['instances']
+            if isinstance(instances, int) or isinstance(pending, int):
+                if pending == instances:
+                    break
+                continue
+            pending_ids = set(pending)
+            missing = [i for i in instances if i not in pending_ids]
+            if not missing:
+                break
+            if size is None or len(pending) + len(missing) <= size:
+                task.data = dict(
+                    task.data, instances=list(pending) + missing)
+                break
+        else:
+            return
+        if task.scheduled_at and (
+                not scheduled_at or scheduled_at < task.scheduled_at):
+            task.scheduled_at = scheduled_at
+        if expected_at and (
+                not task.expected_at or expected_at < task.expected_at):
+            task.expected_at = expected_at
+        task.priority = max(task.priority, priority)
+        task.save()
+        return task
+
+    @classmethod
+    def pull(cls, database, connection, name=None, limit=1, exclude=None):
+        """Return the ids of at most limit tasks and the next timeout
+
+        name is a queue name or a list of queue names to pull from and
+        exclude a list of queue names to skip."""
         cursor = connection.cursor()
         queue = cls.__table__()
         queue_c = cls.__table__()
         queue_s = cls.__table__()
+        if isinstance(name, str):
+            name = [name]
+
+        def where_name(table):
+            where = Literal(True)
+            if name:
+                where &= table.name.in_(list(name))
+            if exclude:
+                where &= ~table.name.in_(list(exclude))
+            return where
 
         candidates = With('id', 'scheduled_at', 'expected_at',
             query=queue_c.select(
                 queue_c.id,
                 queue_c.scheduled_at,
                 queue_c.expected_at,
-                where=((queue_c.name == name) if name else Literal(True))
+                where=where_name(queue_c)
                 & (queue_c.dequeued_at == Null),
                 order_by=[
                     queue_c.scheduled_at.nulls_first,
                     queue_c.expected_at.nulls_first]))
         selected = queue_s.select(
             queue_s.id,
-            where=((queue_s.name == name) if name else Literal(True))
+            where=where_name(queue_s)
             & (queue_s.dequeued_at == Null)
             & ((queue_s.scheduled_at <= CurrentTimestamp())
                 | (queue_s.scheduled_at == Null)),
             order_by=[
+                queue_s.priority.desc,
                 queue_s.scheduled_at.nulls_first,
                 queue_s.expected_at.nulls_first],
-            limit=1)
+            limit=limit)
         if database.has_select_for():
             For = database.get_select_for_skip_locked()
             selected.for_ = For('UPDATE')
@@ -116,7 +237,7 @@ class Queue(ModelSQL):
                     ),
                 where=candidates.scheduled_at >= CurrentTimestamp()))
 
-        task_id, seconds = None, None
+        task_ids, seconds = [], None
         if database.has_returning():
             query = queue.update([queue.dequeued_at], [CurrentTimestamp()],
                 where=queue.id.in_(selected),
@@ -124,29 +245,28 @@ class Queue(ModelSQL):
                 returning=[
                     queue.id, next_timeout.select(next_timeout.seconds)])
             cursor.execute(*query)
-            row = cursor.fetchone()
-            if row:
-                task_id, seconds = row
+            for task_id, seconds in cursor:
+                task_ids.append(task_id)
         else:
             query = queue.select(queue.id,
                 where=queue.id.in_(selected),
                 with_=[candidates])
             cursor.execute(*query)
-            row = cursor.fetchone()
-            if row:
-                task_id, = row
+            task_ids = [i for i, in cursor]
+            if task_ids:
                 query = queue.update([queue.dequeued_at], [CurrentTimestamp()],
-                    where=queue.id == task_id)
+                    where=reduce_ids(queue.id, task_ids))
                 cursor.execute(*query)
-            query = next_timeout.select(next_timeout.seconds)
+            query = next_timeout.select(
+                next_timeout.seconds, with_=[candidates, next_timeout])
             cursor.execute(*query)
             row = cursor.fetchone()
             if row:
                 seconds, = row
 
-        if not task_id and database.has_channel():
+        if not task_ids and database.has_channel():
             cursor.execute('LISTEN "%s"', (cls.__name__,))
-        return task_id, seconds
+        return task_ids, seconds
 
     def run(self):
         transaction = Transaction()
@@ -173,6 +293,8 @@ class Queue(ModelSQL):
                         [i for i in instances if i in ids])
                 else:
                     instances = None
+                if self.key:
+                    instances = self._coalesce(Model, instances)
             if instances is not None:
                 getattr(Model, self.data['method'])(
                     instances, *self.data['args'], **self.data['kwargs'])
@@ -181,16 +303,84 @@ class Queue(ModelSQL):
         self.finished_at = datetime.datetime.now()
         self.save()
 
+    def _coalesce(self, Model, instances):
+        "Add to instances those of the due pending tasks with the same key"
+        now = datetime.datetime.now()
+        # As for _merge, a single instance is not called as a list
+        tasks = [t for t in self.browse(
+                self._pending(self.name, self.key, exclude=self.id))
+            if (not t.scheduled_at or t.scheduled_at <= now)
+            and not isinstance(t.data['instances'], int)]
+        if not tasks:
+            return instances
+        ids = [i.id for i in instances or []]
+        others = set()
+        for task in tasks:
+            others.update(task.data['instances'])
+        others.difference_update(ids)
+        with Transaction().set_context(active_test=False):
+            for sub_ids in grouped_slice(others):
+                records = Model.search([('id', 'in', list(sub_ids))])
+                ids.extend(map(int, records))
+        for task in tasks:
+            task.dequeued_at = task.finished_at = now
+        self.__class__.save(tasks)
+        return Model.browse(ids) if ids else None
+
+    @classmethod
+    def summary(cls, names=None, since=None):
+        """Return the statistics of the tasks per queue name
+
+        The latency is the number of seconds between the enqueue (or the
+        schedule) and the dequeue of the task and the duration is the number
+        of seconds to run it."""
+        cursor = Transaction().connection.cursor()
+        table = cls.__table__()
+        now = CurrentTimestamp()
+
+        def count(condition):
+            return Sum(Case((condition, 1), else_=0))
+
+        def seconds(end, start):
+            return Extract('EPOCH', end) - Extract('EPOCH', start)
+
+        latency = seconds(
+            table.dequeued_at,
+            Coalesce(table.scheduled_at, table.enqueued_at))
+        duration = seconds(table.finished_at, table.dequeued_at)
+        where = Literal(True)
+        if names:
+            where &= table.name.in_(list(names))
+        if since:
+            where &= table.enqueued_at >= since
+        cursor.execute(*table.select(
+                table.name,
+                Count(Literal('*')),
+                count(table.dequeued_at == Null),
+                count((table.dequeued_at != Null)
+                    & (table.finished_at == Null)),
+                count(table.finished_at != Null),
+                count(table.expected_at < Coalesce(table.finished_at, now)),
+                Avg(latency),
+                Max(latency),
+                Avg(duration),
+                Max(duration),
+                where=where,
+                group_by=[table.name],
+                order_by=[table.name]))
+        keys = [
+            'name', 'count', 'pending', 'running', 'done', 'missed',
+            'latency', 'latency_max', 'duration', 'duration_max']
+        return [dict(zip(keys, row)) for row in cursor]
+
     @classmethod
     def clean(cls, date=None):
         if date is None:
             date = (
                 datetime.datetime.now() - datetime.timedelta(days=clean_days))
-        tasks = cls.search(['OR',
-                ('dequeued_at', '<', date),
-                ('finished_at', '<', date),
-                ])
-        cls.delete(tasks)
+        table = cls.__table__()
+        delete_by_chunk(
+            table, (table.dequeued_at < date) | (table.finished_at < date))
 
     @classmethod
     def caller(cls, model):
@@ -222,6 +412,8 @@ class _Method(object):
             scheduled_at = now + scheduled_at
         expected_at = context.pop('queue_expected_at', None)
         queue_batch = context.pop('queue_batch', None)
+        priority = context.pop('queue_priority', None)
+        coalesce = context.pop('queue_coalesce', False)
         context.pop('_check_access', None)
         context.pop('language', None)
         if expected_at is not None:
@@ -231,7 +423,7 @@ class _Method(object):
         except TypeError:
             instances = int(instances)
 
-        def _push(instances):
+        def _push(instances, size=None):
             data = {
                 'model': self.__model.__name__,
                 'method': self.__name,
@@ -243,7 +435,8 @@ class _Method(object):
                 }
             return self.__queue.push(
                 name, data,
-                scheduled_at=scheduled_at, expected_at=expected_at)
+                scheduled_at=scheduled_at, expected_at=expected_at,
+                priority=priority, coalesce=coalesce and (size or True))
 
         if isinstance(instances, list):
             if has_worker and queue_batch:
@@ -251,11 +444,13 @@ class _Method(object):
                     count = queue_batch
                 else:
                     count = batch_size
+                size = count
             else:
                 count = len(instances)
+                size = None
             task_ids = []
             for sub_instances in grouped_slice(instances, count=count):
-                task_ids.append(_push(list(sub_instances)))
+                task_ids.append(_push(list(sub_instances), size))
             return task_ids
         else:
             return _push(instances)
@@ -27,6 +27,7 @@ SOURCE = config.get(
     'html', 'src', default='https://cloud.tinymce.com/stable/tinymce.min.js')
 AVATAR_TIMEOUT = config.getint(
     'web', 'avatar_timeout', default=7 * 24 * 60 * 60)
+STREAM_CHUNK_SIZE = 64 * 1024
 
 
 def get_token(record):
@@ -240,44 +241,82 @@ def data(request, pool, model):
     try:
         header = bool(int(request.args.get('h', True)))
         locale_format = bool(int(request.args.get('loc', False)))
+        stream = bool(int(request.args.get('stream', False)))
     except ValueError:
         abort(HTTPStatus.BAD_REQUEST)
 
-    with transaction.set_context(**context):
-        lang = Lang.get(transaction.language)
-
-        def format_(row):
-            for i, value in enumerate(row):
-                if locale_format:
-                    if isinstance(value, Number):
-                        value = lang.format('%.12g', value)
-                    elif isinstance(value, (dt.date, dt.datetime)):
-                        value = lang.strftime(value)
-                elif isinstance(value, bool):
-                    value = int(value)
-                row[i] = value
-            return row
+    def format_(row, lang):
+        for i, value in enumerate(row):
+            if locale_format:
+                if isinstance(value, Number):
+                    value = lang.format('%.12g', value)
+                elif isinstance(value, (dt.date, dt.datetime)):
+                    value = lang.strftime(value)
+            elif isinstance(value, bool):
+                value = int(value)
+            row[i] = value
+        return row
 
-        try:
-            if domain and isinstance(domain[0], (int, float)):
-                rows = Model.export_data(domain, fields_names, header)
-            else:
-                rows = Model.export_data_domain(
-                    domain, fields_names,
-                    limit=limit, offset=offset, order=order, header=header)
-        except (ValueError, KeyError):
-            abort(HTTPStatus.BAD_REQUEST)
+    def write(rows, lang, size=None):
         data = io.StringIO(newline='')
         writer = csv.writer(data, delimiter=delimiter, quotechar=quotechar)
         for row in rows:
-            writer.writerow(format_(row))
-        data = data.getvalue().encode(encoding)
+            writer.writerow(format_(row, lang))
+            if size and data.tell() >= size:
+                yield data.getvalue().encode(encoding)
+                data.seek(0)
+                data.truncate()
+        yield data.getvalue().encode(encoding)
+
+    def export_stream(context):
+        # The response is iterated once the request transaction is closed
+        with Transaction(new=True).start(
+                pool.database_name, transaction.user, readonly=True,
+                context=context) as stream_transaction:
+            lang = Lang.get(stream_transaction.language)
+            if domain and isinstance(domain[0], (int, float)):
+                records = Model.browse(domain)
+            else:
+                records = Model.search_iter(
+                    domain, limit=limit, offset=offset, order=order)
+            rows = Model.export_data_iter(records, fields_names, header)
+            yield from write(rows, lang, STREAM_CHUNK_SIZE)
+
+    def resume(first, data):
+        # A generator propagates close to data unlike chain
+        yield first
+        yield from data
+
+    with transaction.set_context(**context):
+        lang = Lang.get(transaction.language)
         filename = slugify(Model.__names__()['model']) + '.csv'
         filename = filename.encode('latin-1', 'ignore')
+
+        if stream:
+            data = export_stream(transaction.context)
+            try:
+                # Start the export to report the errors of the arguments
+                first = next(data)
+            except (ValueError, KeyError):
+                abort(HTTPStatus.BAD_REQUEST)
+            data = resume(first, data)
+        else:
+            try:
+                if domain and isinstance(domain[0], (int, float)):
+                    rows = Model.export_data(domain, fields_names, header)
+                else:
+                    rows = Model.export_data_domain(
+                        domain, fields_names,
+                        limit=limit, offset=offset, order=order,
+                        header=header)
+            except (ValueError, KeyError):
+                abort(HTTPStatus.BAD_REQUEST)
+            data = b''.join(write(rows, lang))
         response = Response(data, mimetype='text/csv; charset=' + encoding)
         response.headers.add(
             'Content-Disposition', 'attachment', filename=filename)
-        response.headers.add('Content-Length', len(data))
+        if not stream:
+            response.headers.add('Content-Length', len(data))
         return response
 
 
@@ -4,9 +4,12 @@ import datetime
 import json
 from secrets import token_hex
 
+from sql import Null
+
 from trytond.cache import Cache
 from trytond.config import config
 from trytond.model import Index, ModelSQL, fields
+from trytond.tools import delete_by_chunk
 
 _session_timeout = datetime.timedelta(
     seconds=config.getint('session', 'timeout'))
@@ -20,6 +23,9 @@ class Session(ModelSQL):
 
     key = fields.Char("Key", required=True, strip=False)
     _session_reset_cache = Cache('ir_session.session_reset', context=False)
+    _session_check_cache = Cache(
+        'ir_session.session_check', context=False,
+        duration=config.getint('session', 'check_cache_timeout', default=60))
 
     @classmethod
     def __setup__(cls):
@@ -37,6 +43,8 @@ class Session(ModelSQL):
                 Index(table,
                     (table.key, Index.Equality()),
                     (table.write_date, Index.Equality())),
+                Index(table, (table.create_date, Index.Range())),
+                Index(table, (table.write_date, Index.Range())),
                 })
 
     @classmethod
@@ -50,6 +58,14 @@ class Session(ModelSQL):
             for session in sessions:
                 cls._session_reset_cache.set(session.key, session.write_date)
 
+    @classmethod
+    def delete(cls, sessions):
+        keys = [(s.create_uid.id, s.key) for s in sessions]
+        super().delete(sessions)
+        # Invalidate the checked sessions of all the processes
+        for key in keys:
+            cls._session_check_cache.delete(key)
+
     @classmethod
     def new(cls, values=None):
         "Create a new session for the transaction user and return the key."
@@ -76,32 +92,43 @@ class Session(ModelSQL):
     @classmethod
     def check(cls, user, key, domain=None):
         """
-        Check user key against max_age and delete old one.
+        Check user key against max_age.
         Return True if key is still valid, False if the key is expired and None
         if the key does not exist.
+        The expired keys are deleted by the clean scheduled action.
         """
         now = datetime.datetime.now()
+        if domain is None:
+            expire = cls._session_check_cache.get((user, key))
+            if expire and expire > now:
+                return True
         timeout = datetime.timedelta(
             seconds=config.getint('session', 'max_age'))
         sessions = cls.search([
                 ('create_uid', '=', user),
+                ('key', '=', key),
                 domain or [],
-                ])
-        find, last_reset = None, None
-        to_delete = []
-        for session in sessions:
-            if abs(session.create_date - now) < timeout:
-                if session.key == key:
-                    find = True
-                    last_reset = session.write_date or session.create_date
-            else:
-                if find is None and session.key == key:
-                    find = False
-                to_delete.append(session)
-        cls.delete(to_delete)
-        if find:
-            cls._session_reset_cache.set(key, last_reset)
-        return find
+                ], limit=1)
+        if not sessions:
+            return
+        session, = sessions
+        if abs(session.create_date - now) >= timeout:
+            return False
+        cls._session_reset_cache.set(
+            key, session.write_date or session.create_date)
+        if domain is None:
+            cls._session_check_cache.set(
+                (user, key), session.create_date + timeout)
+        return True
+
+    @classmethod
+    def check_cached(cls, dbname, user, key):
+        """
+        Return True if user key of the database has already been checked valid.
+        It does not need a transaction.
+        """
+        expire = cls._session_check_cache.peek(dbname, (user, key))
+        return bool(expire and expire > datetime.datetime.now())
 
     @classmethod
     def check_timeout(cls, user, key, domain=None):
@@ -149,6 +176,21 @@ class Session(ModelSQL):
                 ])
         cls.delete(sessions)
 
+    @classmethod
+    def clean(cls, date=None):
+        "Delete the sessions created before date or timed out"
+        now = datetime.datetime.now()
+        if date is None:
+            date = now - datetime.timedelta(
+                seconds=config.getint('session', 'max_age'))
+        timestamp = now - _session_timeout
+        table = cls.__table__()
+        # The checked sessions are cached at most max_age and they are reset
+        # by each request so they do not time out
+        delete_by_chunk(table, (table.create_date < date)
+            | (table.write_date < timestamp)
+            | ((table.write_date == Null) & (table.create_date < timestamp)))
+
     @classmethod
     def create(cls, vlist):
         vlist = [v.copy() for v in vlist]
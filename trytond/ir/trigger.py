@@ -9,21 +9,28 @@ from sql.functions import CurrentTimestamp
 from sql.operators import Concat
 
 from trytond.cache import Cache
+from trytond.config import config
 from trytond.i18n import gettext
 from trytond.model import (
     Check, DeactivableMixin, EvalEnvironment, Index, ModelSQL, ModelView,
     fields)
 from trytond.model.exceptions import ValidationError
 from trytond.pool import Pool
-from trytond.pyson import Eval, PYSONDecoder, TimeDelta
-from trytond.tools import grouped_slice, reduce_ids
+from trytond.pyson import PYSON, Eval, PYSONDecoder, TimeDelta
+from trytond.tools import delete_by_chunk, grouped_slice, reduce_ids
 from trytond.transaction import Transaction
 
+clean_days = config.getint('trigger', 'clean_days', default=30)
+
 
 class ConditionError(ValidationError):
     pass
 
 
+class DomainError(ValidationError):
+    pass
+
+
 class Trigger(DeactivableMixin, ModelSQL, ModelView):
     "Trigger"
     __name__ = 'ir.trigger'
@@ -46,6 +53,10 @@ class Trigger(DeactivableMixin, ModelSQL, ModelView):
     condition = fields.Char('Condition', required=True,
         help='A PYSON statement evaluated with record represented by '
         '"self"\nIt triggers the action if true.')
+    domain = fields.Char(
+        "Domain",
+        help="A PYSON domain to filter the records in the database.\n"
+        "It is evaluated with a PYSON context containing \"context\".")
     limit_number = fields.Integer('Limit Number', required=True,
         help='Limit the number of call to "Action Function" by records.\n'
         '0 for no limit.')
@@ -118,6 +129,7 @@ class Trigger(DeactivableMixin, ModelSQL, ModelView):
     def validate_fields(cls, triggers, field_names):
         super().validate_fields(triggers, field_names)
         cls.check_condition(triggers, field_names)
+        cls.check_domain(triggers, field_names)
 
     @classmethod
     def check_condition(cls, triggers, field_names=None):
@@ -135,6 +147,24 @@ class Trigger(DeactivableMixin, ModelSQL, ModelView):
                         condition=trigger.condition,
                         trigger=trigger.rec_name))
 
+    @classmethod
+    def check_domain(cls, triggers, field_names=None):
+        if field_names and 'domain' not in field_names:
+            return
+        for trigger in triggers:
+            if not trigger.domain:
+                continue
+            try:
+                value = trigger.get_domain()
+                if not isinstance(value, list):
+                    raise ValueError
+                fields.domain_validate(value)
+            except Exception:
+                raise DomainError(
+                    gettext('ir.msg_trigger_invalid_domain',
+                        domain=trigger.domain,
+                        trigger=trigger.rec_name))
+
     @staticmethod
     def default_limit_number():
         return 0
@@ -184,6 +214,14 @@ class Trigger(DeactivableMixin, ModelSQL, ModelView):
         cls._get_triggers_cache.set(key, list(map(int, triggers)))
         return triggers
 
+    def get_domain(self):
+        "Return the domain to filter the records"
+        if not self.domain:
+            return []
+        env = {}
+        env['context'] = Transaction().context
+        return PYSONDecoder(env).decode(self.domain)
+
     def eval(self, record):
         """
         Evaluate the condition of trigger
@@ -206,63 +244,40 @@ class Trigger(DeactivableMixin, ModelSQL, ModelView):
         """
         Trigger the action define on trigger for the records
         """
+        pool = Pool()
+        Model = pool.get(self.model.model)
+        domain = self.get_domain()
+        if domain:
+            records = []
+            # Like browse, do not filter the inactive or hidden records
+            with Transaction().set_context(
+                    active_test=False, _check_access=False):
+                for sub_ids in grouped_slice(ids):
+                    records.extend(Model.search([
+                                ('id', 'in', list(sub_ids)),
+                                domain,
+                                ], order=[]))
+            ids = records
+        self._trigger_action(ids)
+
+    def _trigger_action(self, ids):
         pool = Pool()
         TriggerLog = pool.get('ir.trigger.log')
         Model = pool.get(self.model.model)
         model, method = self.action.split('|')
         ActionModel = pool.get(model)
-        cursor = Transaction().connection.cursor()
-        trigger_log = TriggerLog.__table__()
 
-        ids = [r.id for r in Model.browse(ids) if self.eval(r)]
+        condition = PYSONDecoder(noeval=True).decode(self.condition)
+        if isinstance(condition, PYSON):
+            ids = [r.id for r in Model.browse(ids) if self.eval(r)]
+        elif not condition:
+            ids = []
+        else:
+            ids = list(map(int, ids))
 
-        # Filter on limit_number
-        if self.limit_number:
-            new_ids = []
-            for sub_ids in grouped_slice(ids):
-                sub_ids = list(sub_ids)
-                red_sql = reduce_ids(trigger_log.record_id, sub_ids)
-                cursor.execute(*trigger_log.select(
-                        trigger_log.record_id, Count(Literal(1)),
-                        where=red_sql & (trigger_log.trigger == self.id),
-                        group_by=trigger_log.record_id))
-                number = dict(cursor)
-                for record_id in sub_ids:
-                    if record_id not in number:
-                        new_ids.append(record_id)
-                        continue
-                    if number[record_id] < self.limit_number:
-                        new_ids.append(record_id)
-            ids = new_ids
-
-        # Filter on minimum_time_delay
-        if self.minimum_time_delay:
-            new_ids = []
-            # Use now from the transaction to compare with create_date
-            timestamp_cast = self.__class__.create_date.sql_cast
-            cursor.execute(*Select([timestamp_cast(CurrentTimestamp())]))
-            now, = cursor.fetchone()
-            if isinstance(now, str):
-                now = datetime.datetime.fromisoformat(now)
-            for sub_ids in grouped_slice(ids):
-                sub_ids = list(sub_ids)
-                red_sql = reduce_ids(trigger_log.record_id, sub_ids)
-                cursor.execute(*trigger_log.select(
-                        trigger_log.record_id, Max(trigger_log.create_date),
-                        where=(red_sql & (trigger_log.trigger == self.id)),
-                        group_by=trigger_log.record_id))
-                delay = dict(cursor)
-                for record_id in sub_ids:
-                    if record_id not in delay:
-                        new_ids.append(record_id)
-                        continue
-                    # SQLite return string for MAX
-                    if isinstance(delay[record_id], str):
-                        delay[record_id] = datetime.datetime.fromisoformat(
-                            delay[record_id])
-                    if now - delay[record_id] >= self.minimum_time_delay:
-                        new_ids.append(record_id)
-            ids = new_ids
+        if ids and (self.limit_number or self.minimum_time_delay):
+            exceeded = self._exceeded_record_ids(ids)
+            ids = [i for i in ids if i not in exceeded]
 
         records = Model.browse(ids)
         if records:
@@ -277,6 +292,39 @@ class Trigger(DeactivableMixin, ModelSQL, ModelView):
             if to_create:
                 TriggerLog.create(to_create)
 
+    def _exceeded_record_ids(self, ids):
+        "Return the ids among ids that reached the limit number or delay"
+        pool = Pool()
+        TriggerLog = pool.get('ir.trigger.log')
+        cursor = Transaction().connection.cursor()
+        trigger_log = TriggerLog.__table__()
+
+        having = Literal(False)
+        if self.limit_number:
+            having |= Count(Literal(1)) >= self.limit_number
+        if self.minimum_time_delay:
+            # Use now from the transaction to compare with create_date
+            timestamp_cast = self.__class__.create_date.sql_cast
+            cursor.execute(*Select([timestamp_cast(CurrentTimestamp())]))
+            now, = cursor.fetchone()
+            if isinstance(now, str):
+                now = datetime.datetime.fromisoformat(now)
+            try:
+                start = now - self.minimum_time_delay
+            except OverflowError:
+                start = datetime.datetime.min
+            having |= Max(trigger_log.create_date) > start
+        exceeded = set()
+        for sub_ids in grouped_slice(ids):
+            cursor.execute(*trigger_log.select(
+                    trigger_log.record_id,
+                    where=(trigger_log.trigger == self.id)
+                    & reduce_ids(trigger_log.record_id, sub_ids),
+                    group_by=trigger_log.record_id,
+                    having=having))
+            exceeded.update(r for r, in cursor)
+        return exceeded
+
     @classmethod
     def trigger_time(cls):
         '''
@@ -288,9 +336,8 @@ class Trigger(DeactivableMixin, ModelSQL, ModelView):
                 ])
         for trigger in triggers:
             Model = pool.get(trigger.model.model)
-            # TODO add a domain
-            records = Model.search([])
-            trigger.trigger_action(records)
+            records = Model.search(trigger.get_domain(), order=[])
+            trigger._trigger_action(records)
 
     @classmethod
     def create(cls, vlist):
@@ -324,8 +371,39 @@ class TriggerLog(ModelSQL):
         super().__setup__()
 
         table = cls.__table__()
-        cls._sql_indexes.add(
-            Index(
-                table,
-                (table.trigger, Index.Equality()),
-                (table.record_id, Index.Range())))
+        cls._sql_indexes.update({
+                Index(
+                    table,
+                    (table.trigger, Index.Equality()),
+                    (table.record_id, Index.Range())),
+                Index(
+                    table,
+                    (table.trigger, Index.Equality()),
+                    (table.create_date, Index.Range())),
+                })
+
+    @classmethod
+    def clean(cls, date=None):
+        """Delete the logs created before date which are no more needed
+        by triggers without limit number
+
+        The logs of triggers with a minimum time delay are kept until the
+        delay has passed.
+        The default date keeps the logs of the last clean days."""
+        pool = Pool()
+        Trigger = pool.get('ir.trigger')
+        table = cls.__table__()
+        now = datetime.datetime.now()
+        if date is None:
+            date = now - datetime.timedelta(days=clean_days)
+        with Transaction().set_context(active_test=False):
+            triggers = Trigger.search([('limit_number', '=', 0)])
+        for trigger in triggers:
+            start = date
+            if trigger.minimum_time_delay:
+                try:
+                    start = min(start, now - trigger.minimum_time_delay)
+                except OverflowError:
+                    continue
+            delete_by_chunk(table,
+                (table.trigger == trigger.id) & (table.create_date < start))
@@ -74,7 +74,8 @@ class View(ModelSQL, ModelView):
         super(View, cls).__setup__()
         table = cls.__table__()
 
-        cls.__rpc__['view_get'] = RPC(instantiate=0, cache=dict(days=1))
+        cls.__rpc__['view_get'] = RPC(
+            instantiate=0, cache=dict(days=1), etag=True)
         cls._order.insert(0, ('priority', 'ASC'))
         cls._buttons.update({
                 'show': {
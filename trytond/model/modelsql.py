@@ -2,14 +2,15 @@
 # this repository contains the full copyright notices and license terms.
 import datetime
 from collections import OrderedDict, defaultdict
+from decimal import Decimal
 from functools import wraps
 from itertools import chain, groupby, islice, product, repeat
 
 from sql import (
     Asc, Column, Desc, Expression, For, Literal, Null, NullsFirst, NullsLast,
-    Table, Union, With)
+    Table, Union, Values, With)
 from sql.aggregate import Count, Max
-from sql.conditionals import Coalesce
+from sql.conditionals import Case, Coalesce
 from sql.functions import CurrentTimestamp, Extract, Substring
 from sql.operators import And, Concat, Equal, Operator, Or
 
@@ -27,8 +28,8 @@ from trytond.transaction import Transaction, record_cache_size
 from . import fields
 from .descriptors import dualmethod
 from .modelstorage import (
-    AccessError, ModelStorage, RequiredValidationError, SizeValidationError,
-    ValidationError, is_leaf)
+    AccessError, DomainParameter, ModelStorage, RequiredValidationError,
+    SizeValidationError, ValidationError, is_leaf)
 from .modelview import ModelView
 
 
@@ -874,6 +875,251 @@ class ModelSQL(ModelStorage):
         cls.trigger_create(records)
         return records
 
+    @classmethod
+    def copy(cls, records, default=None):
+        if default is None:
+            default = {}
+        ids = list(map(int, records))
+        if (not ids
+                or len(set(ids)) != len(ids)
+                or not cls.__copy_by_sql_supported(default)):
+            return super().copy(records, default=default)
+        try:
+            with Transaction().savepoint():
+                new_ids = cls.__copy_by_sql(ids, default)
+        except (backend.DatabaseIntegrityError, backend.DatabaseDataError):
+            # Let the generic copy raise the error with the values
+            return super().copy(records, default=default)
+        return cls.browse(new_ids)
+
+    @classmethod
+    def __copy_by_sql_supported(cls, default):
+        "Test if the records can be copied by INSERT ... SELECT"
+        pool = Pool()
+        ModelFieldAccess = pool.get('ir.model.field.access')
+        overridden = any(
+            'copy' in vars(c) or 'create' in vars(c)
+            for c in cls.__mro__ if c not in {ModelSQL, ModelStorage})
+        if (overridden
+                or callable(cls.table_query)
+                or cls._history
+                or cls._path_fields
+                or cls._mptt_fields):
+            return False
+        for name, value in default.items():
+            if '.' in name:
+                continue
+            field = cls._fields.get(name)
+            if not field or callable(value):
+                return False
+            if isinstance(field, (fields.One2Many, fields.Many2Many)):
+                if value:
+                    return False
+        names = []
+        for name, field in cls._fields.items():
+            if isinstance(field, fields.Function):
+                if isinstance(field, fields.MultiValue):
+                    return False
+                continue
+            if (getattr(field, 'translate', False)
+                    or isinstance(field, fields.One2One)):
+                return False
+            names.append(name)
+        if (Transaction().context.get('_check_access')
+                and not ModelFieldAccess.check(
+                    cls.__name__, names, 'write', raise_exception=False)):
+            # The generic copy checks only the values which are not default
+            return False
+        return True
+
+    @classmethod
+    def __copy_by_sql(cls, ids, default, remap=None):
+        """Copy the rows of ids with INSERT ... SELECT and return the new ids
+
+        remap is a dictionary of field name and mapping from the copied id to
+        the value of the new row."""
+        pool = Pool()
+        ModelAccess = pool.get('ir.model.access')
+        ModelFieldAccess = pool.get('ir.model.field.access')
+        transaction = Transaction()
+        database = transaction.database
+        cursor = transaction.connection.cursor()
+        table = cls.__table__()
+        if remap is None:
+            remap = {}
+
+        def is_readonly(Model):
+            return (not issubclass(Model, ModelStorage)
+                or callable(getattr(Model, 'table_query', None)))
+
+        columns, one2many, many2many = [], [], []
+        for name, field in cls._fields.items():
+            if name in {
+                    'id', 'create_uid', 'create_date',
+                    'write_uid', 'write_date'}:
+                continue
+            elif isinstance(field, fields.Function):
+                continue
+            elif isinstance(field, fields.One2Many):
+                if (not default.get(name, True)
+                        or is_readonly(field.get_target())):
+                    continue
+                one2many.append(name)
+            elif isinstance(field, fields.Many2Many):
+                if (not default.get(name, True)
+                        or is_readonly(field.get_relation())):
+                    continue
+                many2many.append(name)
+            elif (not hasattr(field, 'set')
+                    or isinstance(field, fields.Binary)):
+                columns.append(name)
+
+        ModelFieldAccess.check(cls.__name__, columns, 'read')
+        # Check also the access and the rules to read the records
+        values = {
+            r['id']: r for r in cls.read(ids, fields_names=['id'] + many2many)}
+        ModelAccess.check(cls.__name__, 'create')
+        transaction.counter += 1
+        cls._count_cache.set(cls.__name__, None)
+
+        insert_columns = [table.create_uid, table.create_date]
+        select_columns = [Literal(transaction.user), CurrentTimestamp()]
+        for name in columns:
+            insert_columns.append(Column(table, name))
+            if name in default:
+                field = cls._fields[name]
+                value = default[name]
+                if (isinstance(value, ModelStorage)
+                        and isinstance(field, fields.Many2One)):
+                    value = value.id
+                select_columns.append(Literal(field.sql_format(value)))
+            else:
+                select_columns.append(Column(table, name))
+
+        def select(sub_ids, id2new=None):
+            expressions = list(select_columns)
+            for name, mapping in remap.items():
+                idx = 2 + columns.index(name)
+                if len(sub_ids) == 1:
+                    expressions[idx] = Literal(mapping[sub_ids[0]])
+                else:
+                    expressions[idx] = Case(*(
+                            (table.id == i, mapping[i]) for i in sub_ids))
+            if id2new is not None:
+                expressions.append(
+                    Case(*((table.id == i, id2new[i]) for i in sub_ids)))
+            return table.select(
+                *expressions, where=reduce_ids(table.id, sub_ids))
+
+        # Keep the order of the original rows
+        old_ids = sorted(ids)
+        new_ids = database.nextids(
+            transaction.connection, cls._table, len(old_ids))
+        if new_ids:
+            id2new = dict(zip(old_ids, sorted(new_ids)))
+            for sub_ids in grouped_slice(old_ids):
+                sub_ids = list(sub_ids)
+                cursor.execute(*table.insert(
+                        insert_columns + [table.id],
+                        select(sub_ids, id2new)))
+        else:
+            id2new = {}
+            for id_ in old_ids:
+                if database.has_returning():
+                    cursor.execute(*table.insert(
+                            insert_columns, select([id_]), [table.id]))
+                    id2new[id_], = cursor.fetchone()
+                else:
+                    cursor.execute(*table.insert(
+                            insert_columns, select([id_])))
+                    id2new[id_] = database.lastid(cursor)
+        new_ids = [id2new[i] for i in ids]
+        transaction.create_records[cls.__name__].update(new_ids)
+
+        for name in one2many:
+            cls.__copy_one2many(name, id2new, default)
+        for name in many2many:
+            field = cls._fields[name]
+            Relation = field.get_relation()
+            origin = Relation._fields[field.origin]
+            to_create = []
+            for id_ in old_ids:
+                for target_id in values[id_][name]:
+                    if origin._type == 'reference':
+                        new_id = '%s,%s' % (cls.__name__, id2new[id_])
+                    else:
+                        new_id = id2new[id_]
+                    to_create.append({
+                            field.origin: new_id,
+                            field.target: target_id,
+                            })
+            if to_create:
+                Relation.create(to_create)
+
+        cls.__check_domain_rule(new_ids, 'create')
+        records = cls.browse(new_ids)
+        for sub_records in grouped_slice(
+                records, record_cache_size(transaction)):
+            cls._validate(sub_records)
+
+        cls.trigger_create(records)
+        return new_ids
+
+    @classmethod
+    def __copy_one2many(cls, name, id2new, default):
+        cursor = Transaction().connection.cursor()
+        field = cls._fields[name]
+        Target = field.get_target()
+        reverse = Target._fields[field.field]
+        prefix = name + '.'
+        default = {
+            n[len(prefix):]: v for n, v in default.items()
+            if n.startswith(prefix)}
+
+        def value(id_):
+            if reverse._type == 'reference':
+                return '%s,%s' % (cls.__name__, id2new[id_])
+            return id2new[id_]
+
+        children = defaultdict(list)
+        if (not issubclass(Target, ModelSQL)
+                or isinstance(reverse, fields.Function)):
+            for id_, child_ids in field.get(
+                    list(id2new), cls, name).items():
+                children[id_].extend(child_ids)
+        else:
+            target = Target.__table__()
+            for sub_ids in grouped_slice(sorted(id2new)):
+                if reverse._type == 'reference':
+                    sub_ids = ['%s,%s' % (cls.__name__, i) for i in sub_ids]
+                clause = [(field.field, 'in', list(sub_ids))]
+                if field.filter:
+                    clause.append(field.filter)
+                query = Target.search(clause, order=[], query=True)
+                cursor.execute(*target.select(
+                        target.id, Column(target, field.field),
+                        where=target.id.in_(query),
+                        order_by=target.id.asc))
+                for child_id, id_ in cursor:
+                    if reverse._type == 'reference':
+                        id_ = int(id_.split(',', 1)[1])
+                    children[id_].append(child_id)
+        if not children:
+            return
+
+        if (issubclass(Target, ModelSQL)
+                and Target.__copy_by_sql_supported(default)):
+            Target.__copy_by_sql(
+                list(chain(*children.values())), default,
+                remap={field.field: {
+                        c: value(i) for i, cs in children.items()
+                        for c in cs}})
+        else:
+            for id_ in sorted(children):
+                Target.copy(
+                    Target.browse(children[id_]),
+                    default={**default, field.field: value(id_)})
+
     @classmethod
     def read(cls, ids, fields_names):
         pool = Pool()
@@ -1745,6 +1991,29 @@ class ModelSQL(ModelStorage):
 
         return cls.browse([x['id'] for x in rows])
 
+    @classmethod
+    def search_iter(cls, domain, offset=0, limit=None, order=None):
+        transaction = Transaction()
+        if cls._history and transaction.context.get('_datetime'):
+            return super().search_iter(
+                domain, offset=offset, limit=limit, order=order)
+        query = cls.search(
+            domain, offset=offset, limit=limit, order=order, query=True)
+        cursor = transaction.database.stream_cursor(transaction.connection)
+        cursor.execute(*query)
+        size = record_cache_size(transaction)
+
+        def records():
+            try:
+                while True:
+                    rows = cursor.fetchmany(size)
+                    if not rows:
+                        break
+                    yield from cls.browse([r[0] for r in rows])
+            finally:
+                cursor.close()
+        return records()
+
     @classmethod
     def search_domain(cls, domain, active_test=True, tables=None):
         '''
@@ -1787,6 +2056,91 @@ class ModelSQL(ModelStorage):
                 <= transaction.context['_datetime'])
         return tables, expression
 
+    @classmethod
+    def _domain_violations(cls, domain, rows):
+        transaction = Transaction()
+        cursor = transaction.connection.cursor()
+        if cls._history and transaction.context.get('_datetime'):
+            return None
+
+        def compatible(domain):
+            if is_leaf(domain):
+                name, operator, value = domain[:3]
+                if not isinstance(value, DomainParameter):
+                    return True
+                field = cls._fields.get(name)
+                types = _domain_parameter_types.get(
+                    getattr(field, '_type', None))
+                if (not types
+                        or isinstance(field, fields.Function)
+                        or getattr(field, 'translate', False)
+                        or hasattr(cls, 'domain_%s' % name)):
+                    return False
+                for row in rows:
+                    parameter = row[value.index + 2]
+                    if (parameter is not None
+                            and (not isinstance(parameter, types)
+                                or isinstance(parameter, bool)
+                                or (field._type == 'date'
+                                    and isinstance(
+                                        parameter, datetime.datetime)))):
+                        return False
+                return True
+            return all(compatible(d) for d in domain if not isinstance(d, str))
+
+        def parametrized(domain):
+            if is_leaf(domain):
+                return isinstance(domain[2], DomainParameter)
+            return any(parametrized(d)
+                for d in domain if not isinstance(d, str))
+
+        if not rows or not compatible(domain):
+            return None
+
+        violations = set()
+        size = max(transaction.database.IN_MAX // len(rows[0]), 1)
+        for sub_rows in grouped_slice(rows, size):
+            sub_rows = list(sub_rows)
+            values = Values(sub_rows)
+            tables = {None: (cls.__table__(), None)}
+            table, _ = tables[None]
+
+            def convert(domain):
+                if not parametrized(domain):
+                    _, expression = cls.search_domain(
+                        domain, active_test=False, tables=tables)
+                    return expression
+                elif is_leaf(domain):
+                    name, operator, parameter = domain
+                    field = cls._fields[name]
+                    column = field._domain_column(
+                        operator, field.sql_column(table))
+                    value = field.sql_cast(
+                        Column(values, 'column%s' % (parameter.index + 3)))
+                    Operator = fields.SQL_OPERATORS[operator]
+                    expression = Operator(column, value)
+                    if operator == '=':
+                        expression |= (value == Null) & (column == Null)
+                    elif operator == '!=':
+                        expression |= (value == Null) & (column != Null)
+                    return expression
+                elif domain[0] == 'OR':
+                    return Or((convert(d) for d in domain[1:]))
+                else:
+                    return And((convert(d) for d in (
+                                domain[1:] if domain[0] == 'AND' else domain)))
+
+            with transaction.set_context(_check_access=False):
+                expression = convert(domain)
+            key, id_ = Column(values, 'column1'), Column(values, 'column2')
+            from_ = convert_from(None, tables).join(
+                values, condition=table.id == id_)
+            cursor.execute(*from_.select(key, id_, where=expression))
+            valids = {tuple(r) for r in cursor}
+            violations.update(
+                r[0] for r in sub_rows if tuple(r[:2]) not in valids)
+        return violations
+
     @classmethod
     def _rebuild_path(cls, field_name):
         "Rebuild path for the tree."
@@ -2037,6 +2391,22 @@ class ModelSQL(ModelStorage):
             database.lock(connection, cls._table)
 
 
+_domain_parameter_types = {
+    'integer': int,
+    'biginteger': int,
+    'many2one': int,
+    'float': (int, float, Decimal),
+    'numeric': (int, float, Decimal),
+    'char': str,
+    'text': str,
+    'selection': str,
+    'date': datetime.date,
+    'datetime': datetime.datetime,
+    'timestamp': datetime.datetime,
+    'time': datetime.time,
+    }
+
+
 def convert_from(table, tables):
     # Don't nested joins as SQLite doesn't support
     right, condition = tables[None]
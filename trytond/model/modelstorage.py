@@ -5,6 +5,7 @@ import base64
 import csv
 import datetime
 import decimal
+import logging
 import random
 import time
 from collections import defaultdict
@@ -19,7 +20,7 @@ from trytond.const import OPERATORS
 from trytond.exceptions import UserError
 from trytond.i18n import gettext, lazy_gettext
 from trytond.pool import Pool
-from trytond.pyson import PYSON, PYSONDecoder, PYSONEncoder
+from trytond.pyson import PYSON, Eval, PYSONDecoder, PYSONEncoder
 from trytond.rpc import RPC
 from trytond.tools import grouped_slice, is_instance_method, reduce_domain
 from trytond.tools.domain_inversion import domain_inversion, eval_domain
@@ -30,6 +31,8 @@ from . import fields
 from .descriptors import dualmethod
 from .model import Model
 
+logger = logging.getLogger(__name__)
+
 __all__ = ['ModelStorage', 'EvalEnvironment']
 _cache_field = config.getint('cache', 'field')
 _cache_count_timeout = config.getint(
@@ -99,6 +102,17 @@ def is_leaf(expression):
         and expression[1] in OPERATORS)  # TODO remove OPERATORS test
 
 
+class DomainParameter(object):
+    "Placeholder in a domain for a value depending on the record"
+    __slots__ = ('index',)
+
+    def __init__(self, index):
+        self.index = index
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, self.index)
+
+
 class ModelStorage(Model):
     """
     Define a model with storage capability in Tryton.
@@ -543,6 +557,12 @@ class ModelStorage(Model):
             return 0
         return []
 
+    @classmethod
+    def search_iter(cls, domain, offset=0, limit=None, order=None):
+        "Return an iterator over the records matching the domain"
+        return iter(cls.search(
+                domain, offset=offset, limit=limit, order=order))
+
     @classmethod
     def search_count(cls, domain, offset=0, limit=None):
         '''
@@ -766,13 +786,16 @@ class ModelStorage(Model):
 
     @classmethod
     def export_data(cls, records, fields_names, header=False):
+        return list(cls.export_data_iter(records, fields_names, header=header))
+
+    @classmethod
+    def export_data_iter(cls, records, fields_names, header=False):
+        "Yield the rows of export_data as the records are iterated"
         fields_names = [x.split('/') for x in fields_names]
-        data = []
         if header:
-            data.append(cls._convert_field_names(fields_names))
+            yield cls._convert_field_names(fields_names)
         for record in records:
-            data += cls.__export_row(record, fields_names)
-        return data
+            yield from cls.__export_row(record, fields_names)
 
     @classmethod
     def export_data_domain(
@@ -789,10 +812,17 @@ class ModelStorage(Model):
         '''
         pool = Pool()
 
+        # (relation, rec_name) -> id resolved in batch by prefetch
+        resolved = {}
+        # (module, fs_id) -> db_id resolved in batch by prefetch
+        resolved_xml_ids = {}
+
         @lru_cache(maxsize=1000)
         def get_many2one(relation, value, column):
             if not value:
                 return None
+            if (relation, value) in resolved:
+                return resolved[relation, value]
             Relation = pool.get(relation)
             res = Relation.search([
                 ('rec_name', '=', value),
@@ -821,6 +851,9 @@ class ModelStorage(Model):
             Relation = pool.get(relation)
             for word in next(csv.reader(value.splitlines(), delimiter=',',
                     quoting=csv.QUOTE_NONE, escapechar='\\')):
+                if (relation, word) in resolved:
+                    res.append(Relation(resolved[relation, word]))
+                    continue
                 res2 = Relation.search([
                     ('rec_name', '=', word),
                     ], limit=2)
@@ -858,6 +891,8 @@ class ModelStorage(Model):
                         value=value,
                         column=column,
                         **klass.__names__(field))) from e
+            if (relation, value) in resolved:
+                return '%s,%s' % (relation, resolved[relation, value])
             res = Relation.search([
                 ('rec_name', '=', value),
                 ], limit=2)
@@ -901,7 +936,9 @@ class ModelStorage(Model):
             for word in value:
                 try:
                     module, xml_id = word.rsplit('.', 1)
-                    db_id = ModelData.get_id(module, xml_id)
+                    db_id = resolved_xml_ids.get((module, xml_id))
+                    if db_id is None:
+                        db_id = ModelData.get_id(module, xml_id)
                 except (ValueError, KeyError) as e:
                     raise ImportDataError(
                         gettext('ir.msg_xml_id_syntax_error',
@@ -1078,11 +1115,88 @@ class ModelStorage(Model):
                     row[field].append(('create', create))
                 if write:
                     row[field].append(('write',) + tuple(write))
-            if prefix_len == 0:
-                for i in range(max(nbrmax, 1)):
-                    data.pop(0)
             return (row, nbrmax, translate)
 
+        def split_many2many(value):
+            return next(csv.reader(value.splitlines(), delimiter=',',
+                    quoting=csv.QUOTE_NONE, escapechar='\\'))
+
+        def prefetch(data, fields_def):
+            "Resolve in batch the relation values of all the lines"
+            rec_names, xml_ids = defaultdict(set), defaultdict(set)
+            paths = {(): (cls, fields_def)}
+            for i, field in enumerate(fields_names):
+                prefix, name = tuple(field[:-1]), field[-1]
+                if prefix not in paths:
+                    klass, klass_fields_def = paths[prefix[:-1]]
+                    Relation = pool.get(
+                        klass_fields_def[prefix[-1]]['relation'])
+                    paths[prefix] = Relation, Relation.fields_get()
+                klass, klass_fields_def = paths[prefix]
+                values = {
+                    line[i] for line in data
+                    if line[i] and isinstance(line[i], str)}
+                if name.endswith(':id'):
+                    ftype = klass_fields_def[name[:-3]]['type']
+                    for value in values:
+                        if ftype == 'many2many':
+                            words = split_many2many(value)
+                        elif ftype == 'reference':
+                            words = value.split(',', 1)[1:]
+                        else:
+                            words = [value]
+                        for word in words:
+                            if '.' in word:
+                                module, fs_id = word.rsplit('.', 1)
+                                xml_ids[module].add(fs_id)
+                    continue
+                elif ':lang=' in name:
+                    continue
+                ftype = klass_fields_def[name]['type']
+                if name == 'id':
+                    rec_names[klass.__name__].update(
+                        v for v in values if not v.isdigit())
+                elif ftype in {'many2one', 'one2one'}:
+                    rec_names[klass_fields_def[name]['relation']].update(
+                        values)
+                elif ftype == 'many2many':
+                    rec_names[klass_fields_def[name]['relation']].update(
+                        chain.from_iterable(map(split_many2many, values)))
+                elif ftype == 'reference':
+                    for value in values:
+                        if ',' in value:
+                            relation, value = value.split(',', 1)
+                            rec_names[relation].add(value)
+
+            for relation, values in rec_names.items():
+                try:
+                    Relation = pool.get(relation)
+                except KeyError:
+                    continue
+                rec_name = Relation._rec_name
+                # Only the default search on rec_name can be matched back
+                if (rec_name not in Relation._fields
+                        or getattr(Relation.search_rec_name, '__func__', None)
+                        is not ModelStorage.search_rec_name.__func__):
+                    continue
+                ids = defaultdict(list)
+                for sub_values in grouped_slice(values):
+                    for record in Relation.search([
+                                (rec_name, 'in', list(sub_values)),
+                                ]):
+                        ids[getattr(record, rec_name)].append(record.id)
+                for value, value_ids in ids.items():
+                    if len(value_ids) == 1:
+                        resolved[relation, value], = value_ids
+            for module, fs_ids in xml_ids.items():
+                for sub_fs_ids in grouped_slice(fs_ids):
+                    for model_data in ModelData.search([
+                                ('module', '=', module),
+                                ('fs_id', 'in', list(sub_fs_ids)),
+                                ]):
+                        resolved_xml_ids[module, model_data.fs_id] = (
+                            model_data.db_id)
+
         ModelData = pool.get('ir.model.data')
 
         len_fields_names = len(fields_names)
@@ -1090,12 +1204,19 @@ class ModelStorage(Model):
         fields_names = [x.split('/') for x in fields_names]
         fields_def = cls.fields_get()
 
+        prefetch(data, fields_def)
+        logger.info(
+            "import %s: %i relation values resolved",
+            cls.__name__, len(resolved) + len(resolved_xml_ids))
+
         to_create, to_create_translations = [], []
         to_write, to_write_translations = [], []
         languages = set()
-        while len(data):
-            (row, _, translate) = \
-                process_lines(data, [], fields_def)
+        position = 0
+        while position < len(data):
+            (row, nbrmax, translate) = \
+                process_lines(data, [], fields_def, position)
+            position += max(nbrmax, 1)
             if dispatch(to_create, to_write, row):
                 to_write_translations.append(translate)
             else:
@@ -1109,15 +1230,20 @@ class ModelStorage(Model):
                     cls.write(*chain(*filter(itemgetter(1),
                                 zip(([r] for r in records), translated))))
         count = 0
-        if to_create:
-            records = cls.create(to_create)
-            translate(records, to_create_translations)
+        total = len(to_create) + len(to_write) // 2
+        size = record_cache_size(Transaction())
+        for i in range(0, len(to_create), size):
+            records = cls.create(to_create[i:i + size])
+            translate(records, to_create_translations[i:i + size])
             count += len(records)
-        if to_write:
-            cls.write(*to_write)
-            records = sum(to_write[0:None:2], [])
-            translate(records, to_write_translations)
+            logger.info("import %s: %i/%i", cls.__name__, count, total)
+        for i in range(0, len(to_write) // 2, size):
+            sub_write = to_write[2 * i:2 * (i + size)]
+            cls.write(*sub_write)
+            records = sum(sub_write[0:None:2], [])
+            translate(records, to_write_translations[i:i + size])
             count += len(records)
+            logger.info("import %s: %i/%i", cls.__name__, count, total)
         return count
 
     @classmethod
@@ -1161,6 +1287,15 @@ class ModelStorage(Model):
     def validate(cls, records):
         pass
 
+    @classmethod
+    def _domain_violations(cls, domain, rows):
+        """Return the keys of the rows for which the record does not match
+        the domain or None if it can not be tested at once.
+
+        rows is a list of (key, id, parameter, ...) and domain contains a
+        DomainParameter for each parameter."""
+        return None
+
     @classmethod
     def validate_fields(cls, records, field_names):
         pass
@@ -1212,11 +1347,14 @@ class ModelStorage(Model):
 
             domains = defaultdict(lambda: defaultdict(list))
             if is_pyson(field.domain) or is_pyson(field.context):
+                # Keep only the records that may not be valid
+                to_check = filter_domain_violations(
+                    field, records, get_relation)
                 encoder = PYSONEncoder()
                 pyson_domain = encoder.encode(field.domain)
                 pyson_context = encoder.encode(field.context)
                 dict_domain = False
-                for record in records:
+                for record in to_check:
                     domain = _record_eval_pyson(
                         record, pyson_domain, encoded=True)
                     if isinstance(domain, dict):
@@ -1237,7 +1375,7 @@ class ModelStorage(Model):
                 count = in_max // 10
                 for context, ctx_domains in domains.items():
                     if (not dict_domain
-                            and len(ctx_domains) > len(records) * 0.5):
+                            and len(ctx_domains) > len(to_check) * 0.5):
                         new_domains = {}
                         for sub_domains in grouped_slice(
                                 list(ctx_domains.keys()), count):
@@ -1280,6 +1418,78 @@ class ModelStorage(Model):
                             validate_relation_domain(
                                 field, list(sub_records), Relation, sub_domain)
 
+        def parametrize_domain(domain):
+            """Return the domain with DomainParameter in place of the record
+            values and the list of these values or None if the domain does
+            not depend only on the record values"""
+            parameters = []
+
+            def parametrize(domain):
+                if is_leaf(domain):
+                    if not is_pyson(domain):
+                        return domain
+                    if len(domain) != 3 or is_pyson(domain[:2]):
+                        return
+                    name, operator, value = domain
+                    if (not isinstance(value, Eval)
+                            or '.' in name
+                            or operator not in _domain_parameter_operators
+                            or not isinstance(value._value, str)
+                            or value._value not in cls._fields
+                            or is_pyson(value._default)):
+                        return
+                    parameters.append(value)
+                    return (name, operator,
+                        DomainParameter(len(parameters) - 1))
+                elif isinstance(domain, (list, tuple)):
+                    result = []
+                    for sub_domain in domain:
+                        if isinstance(sub_domain, str):
+                            result.append(sub_domain)
+                            continue
+                        sub_domain = parametrize(sub_domain)
+                        if sub_domain is None:
+                            return
+                        result.append(sub_domain)
+                    return result
+
+            domain = parametrize(domain)
+            if domain is not None and parameters:
+                return domain, parameters
+
+        def filter_domain_violations(field, records, get_relation):
+            """Return the records that may not be valid by testing the
+            parametrized domain of all of them in one query per relation"""
+            if (field._type == 'reference'
+                    or is_pyson(field.context)
+                    or len(records) < 2):
+                return records
+            parametrized = parametrize_domain(field.domain)
+            if not parametrized:
+                return records
+            domain, parameters = parametrized
+            Relation = get_relation(None)
+            pyson_parameters = PYSONEncoder().encode(parameters)
+            rows, to_check = [], set()
+            for key, record in enumerate(records):
+                values = _record_eval_pyson(
+                    record, pyson_parameters, encoded=True)
+                if not all(isinstance(v, _domain_parameter_types)
+                        for v in values):
+                    to_check.add(key)
+                    continue
+                for relation in relation_domain(field, [record]):
+                    rows.append((key, relation.id, *values))
+            if rows:
+                # Use root user to skip access rules
+                with Transaction().set_context(field.context), \
+                        Transaction().set_user(0):
+                    violations = Relation._domain_violations(domain, rows)
+                if violations is None:
+                    return records
+                to_check.update(violations)
+            return [r for k, r in enumerate(records) if k in to_check]
+
         def relation_domain(field, records):
             relations = set()
             if field._type in {'many2one', 'one2one', 'reference'}:
@@ -2005,6 +2215,12 @@ class EvalEnvironment(dict):
         return bool(self._record)
 
 
+_domain_parameter_operators = {'=', '!=', '<', '<=', '>', '>='}
+_domain_parameter_types = (
+    type(None), int, float, Decimal, str,
+    datetime.date, datetime.time, datetime.timedelta)
+
+
 def _record_eval_pyson(record, source, encoded=False):
     transaction = Transaction()
     if not encoded:
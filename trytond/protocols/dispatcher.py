@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 # This file is part of Tryton.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
+import hashlib
 import logging
 import pydoc
 import time
@@ -17,8 +18,8 @@ from werkzeug.wrappers import Response
 from trytond import __version__, backend, security
 from trytond.config import config, get_hostname
 from trytond.exceptions import (
-    ConcurrencyException, LoginException, RateLimitException, UserError,
-    UserWarning)
+    ConcurrencyException, LoginException, RateLimitException, TrytonException,
+    UserError, UserWarning)
 from trytond.tools import is_instance_method
 from trytond.transaction import Transaction
 from trytond.worker import run_task
@@ -33,6 +34,7 @@ logger = logging.getLogger(__name__)
 ir_configuration = Table('ir_configuration')
 ir_lang = Table('ir_lang')
 ir_module = Table('ir_module')
+ir_cache = Table('ir_cache')
 res_user = Table('res_user')
 _MAX_LENGTH = 80
 
@@ -43,6 +45,7 @@ def rpc(request, database_name):
         'common.db.login': login,
         'common.db.logout': logout,
         'system.listMethods': list_method,
+        'system.multicall': multicall,
         'system.methodHelp': help_method,
         'system.methodSignature': lambda *a: 'signatures not supported',
         }
@@ -135,8 +138,9 @@ def list_method(request, pool):
     return methods
 
 
-def get_object_method(request, pool):
-    method = request.rpc_method
+def get_object_method(request, pool, method=None):
+    if method is None:
+        method = request.rpc_method
     type, _ = method.split('.', 1)
     name = '.'.join(method.split('.')[1:-1])
     method = method.split('.')[-1]
@@ -158,6 +162,161 @@ def _safe_repr(args, kwargs, short=False):
     return result[:_MAX_LENGTH] + ' [truncated]...)'
 
 
+def _fault(exception):
+    if isinstance(exception, TrytonException):
+        # Keep the arguments sent as error by the single call
+        return {
+            'faultCode': exception.code,
+            'faultString': str(exception),
+            'error': exception.args,
+            }
+    return {'faultCode': 255, 'faultString': str(exception)}
+
+
+@app.auth_required
+@with_pool
+def multicall(request, pool, calls):
+    """Run the calls in a single transaction
+    and return for each call a list with its result or a fault"""
+    user = request.user_id
+    session = None
+    if request.authorization.type == 'session':
+        session = request.authorization.get('session')
+
+    methods = []
+    for call in calls:
+        try:
+            obj, method = get_object_method(
+                request, pool, call['methodName'])
+            rpc = obj.__rpc__[method]
+        except Exception:
+            methods.append({
+                    'faultCode': HTTPStatus.FORBIDDEN.value,
+                    'faultString': HTTPStatus.FORBIDDEN.phrase,
+                    })
+        else:
+            methods.append(
+                (obj, method, rpc, tuple(call.get('params', []))))
+    calls = [m for m in methods if isinstance(m, tuple)]
+    readonly = all(rpc.readonly for _, _, rpc, _ in calls)
+
+    if session and any(rpc.fresh_session for _, _, rpc, _ in calls):
+        context = {'_request': request.context}
+        if not security.check_timeout(
+                pool.database_name, user, session, context=context):
+            abort(HTTPStatus.UNAUTHORIZED)
+
+    log_message = '%s.%s%s from %s@%s%s in %i ms'
+    retry = config.getint('database', 'retry')
+    for count in range(retry, -1, -1):
+        if count != retry:
+            time.sleep(0.02 * (retry - count))
+        with Transaction().start(pool.database_name, user,
+                readonly=readonly) as transaction:
+            results = []
+            try:
+                for call in methods:
+                    if not isinstance(call, tuple):
+                        results.append(call)
+                        continue
+                    obj, method, rpc, args = call
+                    log_args = _log_args(request, obj, method, args, {})
+                    started = time.monotonic()
+
+                    def duration():
+                        return (time.monotonic() - started) * 1000
+                    try:
+                        # Keep the transaction usable if the call fails
+                        with transaction.savepoint():
+                            result = _call(request, obj, method, rpc, args)
+                    except backend.DatabaseOperationalError:
+                        raise
+                    except (ConcurrencyException, UserError, UserWarning,
+                            LoginException) as exception:
+                        logger.info(
+                            log_message, *log_args, duration(),
+                            exc_info=logger.isEnabledFor(logging.DEBUG))
+                        results.append(_fault(exception))
+                    except Exception as exception:
+                        logger.exception(log_message, *log_args, duration())
+                        results.append(_fault(exception))
+                    else:
+                        logger.info(log_message, *log_args, duration())
+                        results.append([result])
+            except backend.DatabaseOperationalError:
+                if count and not readonly:
+                    transaction.rollback()
+                    logger.debug("Retry: %i", retry - count + 1)
+                    continue
+                raise
+            # Need to commit to unlock SQLite database
+            transaction.commit()
+        while transaction.tasks:
+            task_id = transaction.tasks.pop()
+            run_task(pool, task_id)
+        if session:
+            context = {'_request': request.context}
+            security.reset(pool.database_name, session, context=context)
+        return results
+
+
+def _log_args(request, obj, method, args, kwargs):
+    username = request.authorization.username
+    if isinstance(username, bytes):
+        username = username.decode('utf-8')
+    return (
+        obj.__name__, method,
+        _safe_repr(args, kwargs, not logger.isEnabledFor(logging.DEBUG)),
+        username, request.remote_addr, request.path)
+
+
+def _call(request, obj, method, rpc, args, kwargs=None):
+    "Call the method of obj in the current transaction"
+    transaction = Transaction()
+    c_args, c_kwargs, transaction.context, transaction.timestamp \
+        = rpc.convert(obj, *args, **(kwargs or {}))
+    transaction.context['_request'] = request.context
+    meth = getattr(obj, method)
+    if (rpc.instantiate is None
+            or not is_instance_method(obj, method)):
+        return rpc.result(meth(*c_args, **c_kwargs))
+    else:
+        assert rpc.instantiate == 0
+        inst = c_args.pop(0)
+        if hasattr(inst, method):
+            return rpc.result(meth(inst, *c_args, **c_kwargs))
+        else:
+            return [rpc.result(meth(i, *c_args, **c_kwargs))
+                for i in inst]
+
+
+def _etag(pool, obj, method, args, kwargs):
+    "Return the entity tag of the call in the current transaction"
+    transaction = Transaction()
+    User = pool.get('res.user')
+    cursor = transaction.connection.cursor()
+    cursor.execute(*ir_module.select(
+            ir_module.name, ir_module.state, ir_module.write_date,
+            order_by=ir_module.name))
+    modules = list(cursor)
+    cursor.execute(*ir_cache.select(
+            ir_cache.name, ir_cache.timestamp,
+            order_by=ir_cache.name))
+    timestamps = list(cursor)
+    key = repr((
+            __version__, pool.database_name, modules, timestamps,
+            transaction.user, User.get_groups(), transaction.language,
+            obj.__name__, method, args, kwargs))
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def _not_modified(request, etag):
+    "Return the entity tag matched by the request"
+    for tag in [etag, etag + '-gzip']:
+        if request.if_none_match.contains(tag):
+            return tag
+
+
 @app.auth_required
 @with_pool
 def _dispatch(request, pool, *args, **kwargs):
@@ -179,13 +338,7 @@ def _dispatch(request, pool, *args, **kwargs):
             abort(HTTPStatus.UNAUTHORIZED)
 
     log_message = '%s.%s%s from %s@%s%s in %i ms'
-    username = request.authorization.username
-    if isinstance(username, bytes):
-        username = username.decode('utf-8')
-    log_args = (
-        obj.__name__, method,
-        _safe_repr(args, kwargs, not logger.isEnabledFor(logging.DEBUG)),
-        username, request.remote_addr, request.path)
+    log_args = _log_args(request, obj, method, args, kwargs)
 
     def duration():
         return (time.monotonic() - started) * 1000
@@ -198,21 +351,16 @@ def _dispatch(request, pool, *args, **kwargs):
         with Transaction().start(pool.database_name, user,
                 readonly=rpc.readonly) as transaction:
             try:
-                c_args, c_kwargs, transaction.context, transaction.timestamp \
-                    = rpc.convert(obj, *args, **kwargs)
-                transaction.context['_request'] = request.context
-                meth = getattr(obj, method)
-                if (rpc.instantiate is None
-                        or not is_instance_method(obj, method)):
-                    result = rpc.result(meth(*c_args, **c_kwargs))
+                etag = not_modified = None
+                if rpc.readonly and rpc.etag:
+                    # Computed after the synchronization of the caches
+                    etag = _etag(pool, obj, method, args, kwargs)
+                if etag:
+                    not_modified = _not_modified(request, etag)
+                if not not_modified:
+                    result = _call(request, obj, method, rpc, args, kwargs)
                 else:
-                    assert rpc.instantiate == 0
-                    inst = c_args.pop(0)
-                    if hasattr(inst, method):
-                        result = rpc.result(meth(inst, *c_args, **c_kwargs))
-                    else:
-                        result = [rpc.result(meth(i, *c_args, **c_kwargs))
-                            for i in inst]
+                    result = None
             except backend.DatabaseOperationalError:
                 if count and not rpc.readonly:
                     transaction.rollback()
@@ -239,7 +387,13 @@ def _dispatch(request, pool, *args, **kwargs):
             security.reset(pool.database_name, session, context=context)
         logger.info(log_message, *log_args, duration())
         logger.debug('Result: %r', result)
-        response = app.make_response(request, result)
+        if not_modified:
+            response = Response(status=HTTPStatus.NOT_MODIFIED)
+            response.set_etag(not_modified)
+        else:
+            response = app.make_response(request, result)
+            if etag:
+                response.set_etag(etag)
         if rpc.readonly and rpc.cache:
             response.headers.extend(rpc.cache.headers())
         return response
@@ -2,9 +2,16 @@
 # this repository contains the full copyright notices and license terms.
 import base64
 import datetime
+import enum
 import json
+import uuid
 from decimal import Decimal
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 from werkzeug.exceptions import (
     BadRequest, Conflict, Forbidden, InternalServerError, Locked,
     TooManyRequests)
@@ -56,11 +63,16 @@ JSONDecoder.register('Decimal', lambda dct: Decimal(dct['decimal']))
 class JSONEncoder(json.JSONEncoder):
 
     serializers = {}
+    # Set when a serializer is registered for a type that orjson always
+    # encodes natively
+    _orjson_native = False
 
     @classmethod
     def register(cls, klass, encoder):
         assert klass not in cls.serializers
         cls.serializers[klass] = encoder
+        if issubclass(klass, (uuid.UUID, enum.Enum)):
+            cls._orjson_native = True
 
     def default(self, obj):
         marshaller = self.serializers.get(type(obj),
@@ -117,6 +129,69 @@ JSONEncoder.register(Decimal,
         })
 
 
+# The number of items above which a result is streamed by chunks
+_STREAM_SIZE = 1000
+
+if orjson:
+    # The subclasses and dataclasses are passed through to honor the
+    # registered serializers
+    _ORJSON_OPTION = (orjson.OPT_PASSTHROUGH_DATETIME
+        | orjson.OPT_PASSTHROUGH_SUBCLASS
+        | orjson.OPT_PASSTHROUGH_DATACLASS
+        | orjson.OPT_NON_STR_KEYS)
+
+    def _orjson_default(obj):
+        try:
+            serializer = JSONEncoder.serializers[type(obj)]
+        except KeyError:
+            # Encode the subclasses like the json module
+            if isinstance(obj, str):
+                return str.__str__(obj)
+            elif isinstance(obj, int):
+                return int.__int__(obj)
+            elif isinstance(obj, dict):
+                return dict(obj)
+            elif isinstance(obj, (list, tuple)):
+                return list(obj)
+            raise TypeError(
+                "Object of type %s is not JSON serializable"
+                % type(obj).__name__)
+        return serializer(obj)
+
+
+def dumps(obj):
+    """Return obj encoded as compact JSON bytes
+
+    NaN and infinity are encoded as null by orjson."""
+    if orjson and not JSONEncoder._orjson_native:
+        try:
+            return orjson.dumps(
+                obj, default=_orjson_default, option=_ORJSON_OPTION)
+        except orjson.JSONEncodeError:
+            # Fallback for the values not supported like big integers
+            pass
+    return json.dumps(
+        obj, cls=JSONEncoder, separators=(',', ':')).encode('utf-8')
+
+
+def dumps_iter(obj, size=1000):
+    "Yield obj encoded as compact JSON bytes by chunks of size items"
+    if not isinstance(obj, (list, tuple)) or len(obj) <= size:
+        yield dumps(obj)
+        return
+    yield b'['
+    for i in range(0, len(obj), size):
+        if i:
+            yield b','
+        yield dumps(obj[i:i + size])[1:-1]
+    yield b']'
+
+
+def loads(data):
+    "Return the object decoded from JSON data"
+    return json.loads(data, object_hook=JSONDecoder())
+
+
 class JSONRequest(Request):
     parsed_content_type = 'json'
 
@@ -124,10 +199,9 @@ class JSONRequest(Request):
     def parsed_data(self):
         if self.parsed_content_type in self.environ.get('CONTENT_TYPE', ''):
             try:
-                return json.loads(
+                return loads(
                     self.decoded_data.decode(
-                        self.charset, self.encoding_errors),
-                    object_hook=JSONDecoder())
+                        self.charset, self.encoding_errors))
             except Exception:
                 raise BadRequest('Unable to read JSON request')
         else:
@@ -171,6 +245,11 @@ class JSONProtocol:
                 response['error'] = (str(data), data.__format_traceback__)
             else:
                 response['result'] = data
+                if (isinstance(data, (list, tuple))
+                        and len(data) > _STREAM_SIZE):
+                    return Response(
+                        cls._stream(response),
+                        content_type='application/json')
         else:
             if isinstance(data, UserWarning):
                 return Conflict(data)
@@ -187,6 +266,16 @@ class JSONProtocol:
             elif isinstance(data, Exception):
                 return InternalServerError(data)
             response = data
-        return Response(json.dumps(
-                response, cls=JSONEncoder, separators=(',', ':')),
-            content_type='application/json')
+        if (isinstance(response, (list, tuple))
+                and len(response) > _STREAM_SIZE):
+            return Response(
+                dumps_iter(response, _STREAM_SIZE),
+                content_type='application/json')
+        return Response(dumps(response), content_type='application/json')
+
+    @classmethod
+    def _stream(cls, response):
+        "Yield the response with the large result encoded by chunks"
+        yield b'{"id":' + dumps(response['id']) + b',"result":'
+        yield from dumps_iter(response['result'], _STREAM_SIZE)
+        yield b'}'
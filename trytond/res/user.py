@@ -5,8 +5,10 @@
 import copy
 import datetime
 import hashlib
+import hmac
 import logging
 import mmap
+import os
 import random
 import re
 import string
@@ -27,7 +29,6 @@ from operator import attrgetter
 
 from passlib.context import CryptContext
 from sql import Literal, Null
-from sql.aggregate import Count
 from sql.conditionals import Case, Coalesce
 from sql.functions import CurrentTimestamp
 from sql.operators import Concat
@@ -63,6 +64,9 @@ logger = logging.getLogger(__name__)
 _has_password = 'password' in re.split('[,+]', config.get(
     'session', 'authentications', default='password'))
 
+# Key of the login cache only known by the process
+_login_cache_key = os.urandom(32)
+
 passlib_path = config.get('password', 'passlib')
 if passlib_path:
     CRYPT_CONTEXT = CryptContext.from_path(passlib_path)
@@ -156,6 +160,9 @@ class User(avatar_mixin(100, 'login'), DeactivableMixin, ModelSQL, ModelView):
     sessions = fields.Function(fields.Integer('Sessions'),
             'get_sessions')
     _get_groups_cache = Cache('res_user.get_groups', context=False)
+    _login_password_cache = Cache(
+        'res_user._login_password', context=False,
+        duration=config.getint('session', 'login_cache_timeout', default=60))
 
     @classmethod
     def __setup__(cls):
@@ -384,6 +391,7 @@ class User(avatar_mixin(100, 'login'), DeactivableMixin, ModelSQL, ModelView):
         all_users = []
         session_to_clear = []
         users_to_clear = []
+        login_cache_clear = False
         args = []
         for users, values in zip(actions, actions):
             all_users += users
@@ -392,11 +400,16 @@ class User(avatar_mixin(100, 'login'), DeactivableMixin, ModelSQL, ModelView):
             if values.keys() & {'active', 'password'}:
                 session_to_clear += users
                 users_to_clear += [u.login for u in users]
+            if values.keys() & {
+                    'active', 'login', 'password', 'password_hash'}:
+                login_cache_clear = True
 
         super(User, cls).write(*args)
 
         Session.clear(session_to_clear)
         UserDevice.clear(users_to_clear)
+        if login_cache_clear:
+            cls._login_password_cache.clear()
 
         # Clean cursor cache as it could be filled by domain_get
         for cache in Transaction().cache.values():
@@ -723,11 +736,19 @@ class User(avatar_mixin(100, 'login'), DeactivableMixin, ModelSQL, ModelView):
         if 'password' not in parameters:
             msg = gettext('res.msg_user_password', login=login)
             raise LoginException('password', msg, type='password')
+        cache_key = cls._login_password_cache_key(
+            login, parameters['password'])
+        if cache_key:
+            user_id = cls._login_password_cache.get(cache_key)
+            if user_id:
+                return user_id
         user_id, password_hash, password_reset = cls._get_login(login)
         if user_id and password_hash:
             password = parameters['password']
             valid, new_hash = cls.check_password(password, password_hash)
             if valid:
+                if cache_key:
+                    cls._login_password_cache.set(cache_key, user_id)
                 if new_hash:
                     logger.info("Update password hash for %s", user_id)
                     with Transaction().new_transaction() as transaction:
@@ -740,6 +761,15 @@ class User(avatar_mixin(100, 'login'), DeactivableMixin, ModelSQL, ModelView):
             if password_reset == parameters['password']:
                 return user_id
 
+    @classmethod
+    def _login_password_cache_key(cls, login, password):
+        "Return the key of the credentials in the cache or None if disabled"
+        if not cls._login_password_cache.duration or not password:
+            return
+        return hmac.new(
+            _login_cache_key, '\0'.join([login, password]).encode('utf-8'),
+            hashlib.sha256).hexdigest()
+
     @classmethod
     def hash_password(cls, password):
         '''Hash given password in the form
@@ -815,6 +845,11 @@ class LoginAttempt(ModelSQL):
     device_cookie = fields.Char("Device Cookie", strip=False)
     ip_address = fields.Char("IP Address")
     ip_network = fields.Char("IP Network")
+    # The attempts are counted in memory (or in the shared cache) and read
+    # from the table only when they are missing from the cache
+    _attempts_cache = Cache(
+        'res_user_login_attempt.attempts', size_limit=10000, context=False,
+        duration=config.getint('session', 'timeout'))
 
     @staticmethod
     def delay():
@@ -836,6 +871,47 @@ class LoginAttempt(ModelSQL):
             ip_network = ip_network.supernet(new_prefix=prefix)
         return ip_address, ip_network
 
+    @classmethod
+    def _attempts(cls, key):
+        "Return the timestamps of the attempts of key in the sliding window"
+        start = time.time() - config.getint('session', 'timeout')
+        attempts = cls._attempts_cache.get(key)
+        if attempts is None:
+            # The entry expired or was evicted
+            attempts = cls._attempts_from_table(key)
+            cls._attempts_cache.set(key, attempts)
+        return [t for t in attempts if t >= start]
+
+    @classmethod
+    def _attempts_from_table(cls, key):
+        "Return the timestamps of the attempts of key stored in the table"
+        cursor = Transaction().connection.cursor()
+        table = cls.__table__()
+        if key[0] == 'login':
+            _, login, device_cookie = key
+            where = ((table.login == login)
+                & (table.device_cookie == device_cookie))
+        else:
+            _, ip_network = key
+            where = table.ip_network == ip_network
+        cursor.execute(*table.select(table.create_date,
+                where=where & (table.create_date >= cls.delay()),
+                order_by=table.create_date.asc))
+        now, timestamp = datetime.datetime.now(), time.time()
+        attempts = []
+        for create_date, in cursor:
+            if isinstance(create_date, str):
+                create_date = datetime.datetime.fromisoformat(create_date)
+            attempts.append(timestamp - (now - create_date).total_seconds())
+        return attempts
+
+    @classmethod
+    def _add_attempt(cls, key, limit):
+        # Keep only enough attempts to exceed the limit
+        attempts = cls._attempts(key)[-limit:]
+        attempts.append(time.time())
+        cls._attempts_cache.set(key, attempts)
+
     def _login_size(func):
         @wraps(func)
         def wrapper(cls, login, *args, **kwargs):
@@ -845,11 +921,18 @@ class LoginAttempt(ModelSQL):
     @classmethod
     @_login_size
     def add(cls, login, device_cookie=None):
+        ip_address, ip_network = cls.ipaddress()
+        cls._add_attempt(
+            ('login', login, device_cookie),
+            config.getint('session', 'max_attempt', default=5) + 1)
+        cls._add_attempt(
+            ('ip_network', str(ip_network)),
+            config.getint('session', 'max_attempt_ip_network', default=300)
+            + 1)
+
         cursor = Transaction().connection.cursor()
         table = cls.__table__()
         cursor.execute(*table.delete(where=table.create_date < cls.delay()))
-
-        ip_address, ip_network = cls.ipaddress()
         cls.create([{
                     'login': login,
                     'device_cookie': device_cookie,
@@ -860,33 +943,31 @@ class LoginAttempt(ModelSQL):
     @classmethod
     @_login_size
     def remove(cls, login, device_cookie=None):
+        key = ('login', login, device_cookie)
+        if not cls._attempts(key):
+            return
+        cls._attempts_cache.set(key, [])
+
         cursor = Transaction().connection.cursor()
         table = cls.__table__()
         cursor.execute(*table.delete(
                 where=(table.login == login)
                 & (table.device_cookie == device_cookie)
                 ))
+        # Count again the network without the deleted attempts
+        _, ip_network = cls.ipaddress()
+        key = ('ip_network', str(ip_network))
+        cls._attempts_cache.set(key, cls._attempts_from_table(key))
 
     @classmethod
     @_login_size
     def count(cls, login, device_cookie=None):
-        cursor = Transaction().connection.cursor()
-        table = cls.__table__()
-        cursor.execute(*table.select(Count(Literal('*')),
-                where=(table.login == login)
-                & (table.device_cookie == device_cookie)
-                & (table.create_date >= cls.delay())))
-        return cursor.fetchone()[0]
+        return len(cls._attempts(('login', login, device_cookie)))
 
     @classmethod
     def count_ip(cls):
-        cursor = Transaction().connection.cursor()
-        table = cls.__table__()
         _, ip_network = cls.ipaddress()
-        cursor.execute(*table.select(Count(Literal('*')),
-                where=(table.ip_network == str(ip_network))
-                & (table.create_date >= cls.delay())))
-        return cursor.fetchone()[0]
+        return len(cls._attempts(('ip_network', str(ip_network))))
 
     del _login_size
 
@@ -17,13 +17,15 @@ class RPC(object):
     check_access: If access right must be checked
     fresh_session: If a fresh session is required
     unique: Check instances are unique
+    etag: If the result is invalidated only by clearing a Cache
     '''
 
     __slots__ = ('readonly', 'instantiate', 'result', 'check_access',
-        'fresh_session', 'unique', 'cache')
+        'fresh_session', 'unique', 'cache', 'etag')
 
     def __init__(self, readonly=True, instantiate=None, result=None,
-            check_access=True, fresh_session=False, unique=True, cache=None):
+            check_access=True, fresh_session=False, unique=True, cache=None,
+            etag=False):
         self.readonly = readonly
         self.instantiate = instantiate
         if result is None:
@@ -37,6 +39,7 @@ class RPC(object):
             if not isinstance(cache, RPCCache):
                 cache = RPCCache(**cache)
         self.cache = cache
+        self.etag = etag
 
     def convert(self, obj, *args, **kwargs):
         args = list(args)
@@ -77,19 +77,26 @@ def logout(dbname, user, session, context=None):
 
 
 def check(dbname, user, session, context=None):
-    for count in range(config.getint('database', 'retry'), -1, -1):
-        with Transaction().start(dbname, user, context=context) as transaction:
-            pool = _get_pool(dbname)
-            Session = pool.get('ir.session')
-            try:
-                find = Session.check(user, session)
-                break
-            except backend.DatabaseOperationalError:
-                if count:
-                    continue
-                raise
-            finally:
-                transaction.commit()
+    find = None
+    if dbname in Pool.database_list():
+        Session = Pool(dbname).get('ir.session')
+        # Avoid to start a transaction for an already checked session
+        find = Session.check_cached(dbname, user, session) or None
+    if not find:
+        for count in range(config.getint('database', 'retry'), -1, -1):
+            with Transaction().start(
+                    dbname, user, context=context) as transaction:
+                pool = _get_pool(dbname)
+                Session = pool.get('ir.session')
+                try:
+                    find = Session.check(user, session)
+                    break
+                except backend.DatabaseOperationalError:
+                    if count:
+                        continue
+                    raise
+                finally:
+                    transaction.commit()
     if find is None:
         logger.error("session failed for '%s' from '%s' on database '%s'",
             user, _get_remote_addr(context), dbname)
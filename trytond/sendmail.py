@@ -132,6 +132,12 @@ class SMTPDataManager(object):
     def abort(self, trans):
         self._finish()
 
+    def savepoint(self, trans):
+        return len(self.queue)
+
+    def rollback_savepoint(self, trans, state):
+        del self.queue[state:]
+
     def tpc_begin(self, trans):
         pass
 
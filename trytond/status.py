@@ -34,6 +34,7 @@ def processing(request):
 
 def log():
     from trytond.cache import Cache
+    from trytond.worker import stats as task_stats
     msg = []
     now = time.perf_counter()
     for process in sorted(status.copy().values(), key=lambda p: p.start_time):
@@ -45,6 +46,7 @@ def log():
         'id': '%s@%s' % (os.getpid(), platform.node()),
         'status': msg,
         'caches': list(Cache.stats()),
+        'tasks': list(task_stats()),
         }
 
 
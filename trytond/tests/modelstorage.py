@@ -154,6 +154,19 @@ class ModelStorageRelationDomain2Target(ModelSQL):
         'test.modelstorage.relation_domain.target', "Relation 2")
 
 
+class ModelStorageRelationParameterDomain(ModelSQL):
+    "Model stored containing a relation field with a parametrized domain"
+    __name__ = 'test.modelstorage.relation_parameter_domain'
+    value = fields.Char("Value")
+    relation = fields.Many2One(
+        'test.modelstorage.relation_domain.target', "Relation",
+        domain=['OR',
+            ('value', '=', Eval('value')),
+            ('value', '=', 'any'),
+            ],
+        depends=['value'])
+
+
 class ModelStorageEvalEnvironment(ModelStorage_):
     "Model for EvalEnvironment"
     __name__ = 'test.modelstorage.eval_environment'
@@ -187,5 +200,6 @@ def register(module):
         ModelStorageRelationMultiDomainTarget,
         ModelStorageRelationDomain2,
         ModelStorageRelationDomain2Target,
+        ModelStorageRelationParameterDomain,
         ModelStorageEvalEnvironment,
         module=module, type_='model')
@@ -1,12 +1,19 @@
 # This file is part of Tryton.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
+import datetime
+import http.client
+import json
 import os
+import socket
+import threading
 import time
 import unittest
 from unittest.mock import patch
 
 from trytond import backend, bus
-from trytond.bus import Bus, _MessageQueue, notify
+from trytond.bus import (
+    Bus, BusServer, SelectorBus, _batches, _MessageQueue, notify)
+from trytond.pool import Pool
 from trytond.tests.test_tryton import (
     DB_NAME, activate_module, with_transaction)
 from trytond.transaction import Transaction
@@ -63,6 +70,48 @@ class MessageQueueTestCase(unittest.TestCase):
 
         self.assertEqual(content, {'message_id': 10})
 
+    def test_get_next_size(self):
+        "Testing get_next when the queue is over the size"
+        with patch('time.time', self._time):
+            mq = _MessageQueue(60, size=5)
+            for x in range(15):
+                mq.append('channel', {'message_id': x})
+            channel, content = mq.get_next({'channel'}, 0)
+
+        self.assertEqual(content, {'message_id': 10})
+        self.assertEqual(len(mq._messages), 5)
+        self.assertEqual(len(mq._ids), 5)
+
+    def test_get_next_other_channel(self):
+        "Testing get_next with message id from other channel"
+        with patch('time.time', self._time):
+            mq = _MessageQueue(60)
+            for x in range(15):
+                mq.append('odd' if x % 2 else 'even', {'message_id': x})
+            channel, content = mq.get_next({'odd'}, 10)
+
+        self.assertEqual(content, {'message_id': 11})
+
+    def test_get_next_unknown_channel(self):
+        "Testing get_next with unknown channel"
+        with patch('time.time', self._time):
+            mq = _MessageQueue(60)
+            for x in range(15):
+                mq.append('channel', {'message_id': x})
+            channel, content = mq.get_next({'unknown'}, 10)
+
+        self.assertEqual((channel, content), (None, None))
+
+    def test_get_next_expire_channel(self):
+        "Testing get_next removes expired channels"
+        with patch('time.time', self._time):
+            mq = _MessageQueue(5)
+            mq.append('old', {'message_id': 0})
+            for x in range(1, 15):
+                mq.append('channel', {'message_id': x})
+
+        self.assertNotIn('old', mq._channels)
+
     def test_get_next_message_id_None(self):
         "Testing get_next when not specifying a message"
         with patch('time.time', self._time):
@@ -74,8 +123,30 @@ class MessageQueueTestCase(unittest.TestCase):
         self.assertEqual(content, {'message_id': 10})
 
 
+class BatchesTestCase(unittest.TestCase):
+    "Test batches of payloads"
+
+    def test_batches(self):
+        "Test batches fit in size"
+        payloads = ['a' * 3, 'b' * 3, 'c' * 3]
+
+        self.assertEqual(
+            list(_batches(payloads, 9)), [['aaa', 'bbb'], ['ccc']])
+
+    def test_batches_larger(self):
+        "Test batches with payload larger than size"
+        payloads = ['a' * 10, 'b']
+
+        self.assertEqual(list(_batches(payloads, 5)), [['a' * 10], ['b']])
+
+    def test_batches_empty(self):
+        "Test batches without payload"
+        self.assertEqual(list(_batches([], 5)), [])
+
+
 class BusTestCase(unittest.TestCase):
     "Test Bus"
+    Bus = Bus
 
     @classmethod
     def setUpClass(cls):
@@ -97,12 +168,12 @@ class BusTestCase(unittest.TestCase):
 
     def tearDown(self):
         pid = os.getpid()
-        if (pid, DB_NAME) in Bus._queues:
-            with Bus._queues_lock[pid]:
-                Bus._queues[pid, DB_NAME]['timeout'] = 0
-                listener = Bus._queues[pid, DB_NAME]['listener']
+        if (pid, DB_NAME) in self.Bus._queues:
+            with self.Bus._queues_lock[pid]:
+                self.Bus._queues[pid, DB_NAME]['timeout'] = 0
+                listener = self.Bus._queues[pid, DB_NAME]['listener']
             listener.join()
-        Bus._messages.clear()
+        self.Bus._messages.clear()
 
     @with_transaction()
     def test_notify(self):
@@ -112,14 +183,14 @@ class BusTestCase(unittest.TestCase):
     @unittest.skipIf(backend.name == 'sqlite', 'SQLite has not channel')
     def test_subscribe_nothing(self):
         "Test subscribe with nothing"
-        response = Bus.subscribe(DB_NAME, ['user:1'])
+        response = self.Bus.subscribe(DB_NAME, ['user:1'])
 
         self.assertEqual(response, {'message': None, 'channel': None})
 
     @unittest.skipIf(backend.name == 'sqlite', 'SQLite has not channel')
     def test_subscribe_message(self):
         "Test subscribe with message"
-        Bus.subscribe(DB_NAME, ['user:1'])
+        self.Bus.subscribe(DB_NAME, ['user:1'])
 
         transaction = Transaction()
         with transaction.start(DB_NAME, 1):
@@ -127,7 +198,7 @@ class BusTestCase(unittest.TestCase):
             transaction.commit()
         # Let the listen thread registers the message
         time.sleep(1)
-        response = Bus.subscribe(DB_NAME, ['user:1'])
+        response = self.Bus.subscribe(DB_NAME, ['user:1'])
 
         self.assertTrue(response['message'].pop('message_id'))
         self.assertEqual(response, {
@@ -139,3 +210,168 @@ class BusTestCase(unittest.TestCase):
                     },
                 'channel': 'user:1',
                 })
+
+    @unittest.skipIf(backend.name == 'sqlite', 'SQLite has not channel')
+    def test_subscribe_messages(self):
+        "Test subscribe with many messages in the same transaction"
+        self.Bus.subscribe(DB_NAME, ['user:1'])
+
+        transaction = Transaction()
+        with transaction.start(DB_NAME, 1):
+            for i in range(3):
+                notify("Test %s" % i, user=1)
+            transaction.commit()
+        time.sleep(1)
+        titles = []
+        last_message = None
+        for i in range(3):
+            response = self.Bus.subscribe(DB_NAME, ['user:1'], last_message)
+            last_message = response['message']['message_id']
+            titles.append(response['message']['title'])
+
+        self.assertEqual(titles, ["Test 0", "Test 1", "Test 2"])
+
+    @unittest.skipIf(backend.name == 'sqlite', 'SQLite has not channel')
+    def test_subscribe_large_message(self):
+        "Test subscribe with a message larger than a notification"
+        self.Bus.subscribe(DB_NAME, ['user:1'])
+        body = "Message" * 2000
+
+        transaction = Transaction()
+        with transaction.start(DB_NAME, 1):
+            notify("Test", body, user=1)
+            transaction.commit()
+        time.sleep(1)
+        response = self.Bus.subscribe(DB_NAME, ['user:1'])
+
+        self.assertEqual(response['message']['body'], body)
+
+    @with_transaction()
+    def test_message_clean(self):
+        "Test clean bus messages"
+        pool = Pool()
+        BusMessage = pool.get('ir.bus.message')
+        BusMessage.create([{'payload': '{}'}])
+
+        BusMessage.clean(datetime.datetime.max)
+
+        self.assertEqual(BusMessage.search([], count=True), 0)
+
+
+class SelectorBusTestCase(BusTestCase):
+    "Test Selector Bus"
+    Bus = SelectorBus
+
+    def tearDown(self):
+        pid = os.getpid()
+        with self.Bus._queues_lock[pid]:
+            if (pid, DB_NAME) in self.Bus._queues:
+                self.Bus._queues[pid, DB_NAME]['timeout'] = 0
+        while (pid, DB_NAME) in self.Bus._queues:
+            time.sleep(0.1)
+        self.Bus._messages.clear()
+
+    def test_subscribe_listener(self):
+        "Test subscribe uses a single listener"
+        pid = os.getpid()
+        self.Bus.subscribe(DB_NAME, ['user:1'])
+        listener = self.Bus._hubs[pid]['listener']
+
+        self.Bus.subscribe(DB_NAME, ['user:1'])
+
+        self.assertIs(self.Bus._hubs[pid]['listener'], listener)
+        self.assertTrue(listener.is_alive())
+
+
+class _ParkBus:
+    "Bus parking all the subscriptions"
+
+    def __init__(self):
+        self.events = []
+
+    def _park(self, database, channels, last_message, event):
+        self.events.append(event)
+
+    def _unpark(self, database, channels, last_message, triggered):
+        return SelectorBus.create_response(
+            'user:1' if triggered else None,
+            {'type': 'test'} if triggered else None)
+
+
+def _application(environ, start_response):
+    if environ['PATH_INFO'] == '/%s/bus' % DB_NAME:
+        environ['trytond.bus.park'](DB_NAME, {'user:1'}, None)
+        start_response('200 OK', [('Content-Type', 'application/json')])
+    else:
+        start_response('404 NOT FOUND', [])
+    return [b'']
+
+
+class BusServerTestCase(unittest.TestCase):
+    "Test Bus Server"
+
+    def setUp(self):
+        self.bus = _ParkBus()
+        self.server = BusServer(_application, self.bus, threads=1)
+        sock = socket.socket()
+        sock.bind(('localhost', 0))
+        sock.listen()
+        self.addCleanup(sock.close)
+        self.port = sock.getsockname()[1]
+        thread = threading.Thread(target=self.server.serve, args=(sock,))
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self.server.stop)
+
+    def request(self, path):
+        conn = http.client.HTTPConnection('localhost', self.port, timeout=5)
+        self.addCleanup(conn.close)
+        conn.request(
+            'POST', path, body=b'{}',
+            headers={'Content-Type': 'application/json'})
+        return conn
+
+    def wait_parked(self, count):
+        for _ in range(50):
+            if len(self.bus.events) >= count:
+                break
+            time.sleep(0.1)
+        self.assertEqual(len(self.bus.events), count)
+
+    def test_parked(self):
+        "Test subscriptions parked without holding a thread"
+        conns = [self.request('/%s/bus' % DB_NAME) for _ in range(3)]
+        self.wait_parked(3)
+
+        for event in self.bus.events:
+            event.set()
+
+        for conn in conns:
+            response = conn.getresponse()
+            self.assertEqual(response.status, 200)
+            self.assertEqual(
+                response.getheader('Content-Type'), 'application/json')
+            self.assertEqual(json.loads(response.read()), {
+                    'channel': 'user:1',
+                    'message': {'type': 'test'},
+                    })
+
+    def test_parked_timeout(self):
+        "Test parked subscription timed out"
+        with patch.object(bus, '_long_polling_timeout', 0.1):
+            conn = self.request('/%s/bus' % DB_NAME)
+            response = conn.getresponse()
+
+        self.assertEqual(response.status, 200)
+        self.assertEqual(json.loads(response.read()), {
+                'channel': None,
+                'message': None,
+                })
+
+    def test_not_parked(self):
+        "Test answer of the application"
+        conn = self.request('/foo')
+        response = conn.getresponse()
+
+        self.assertEqual(response.status, 404)
+        self.assertEqual(self.bus.events, [])
@@ -4,6 +4,7 @@
 import datetime as dt
 import time
 import unittest
+from unittest.mock import patch
 
 from trytond import backend
 from trytond import cache as cache_mod
@@ -15,6 +16,7 @@ from trytond.transaction import Transaction
 
 cache = MemoryCache('test.cache')
 cache_expire = MemoryCache('test.cache_expire', duration=1)
+cache_no_context = MemoryCache('test.cache_no_context', context=False)
 
 
 class CacheTestCase(unittest.TestCase):
@@ -171,6 +173,46 @@ class MemoryCacheTestCase(unittest.TestCase):
         self.addCleanup(transaction3.stop)
         self.assertEqual(cache.get('foo'), None)
 
+    def test_memory_cache_delete(self):
+        "Test MemoryCache delete"
+        # Ensure sync is performed before setting
+        with Transaction().start(DB_NAME, USER):
+            pass
+        with Transaction().start(DB_NAME, USER):
+            cache_no_context.set('foo', 'bar')
+            cache_no_context.set('bar', 'foo')
+        with Transaction().start(DB_NAME, USER) as transaction:
+            cache_no_context.delete('foo')
+            self.assertEqual(cache_no_context.get('foo'), None)
+            commit_time = dt.datetime.now()
+            transaction.commit()
+        self.wait_cache_sync(after=commit_time)
+
+        with Transaction().start(DB_NAME, USER):
+            self.assertEqual(cache_no_context.get('foo'), None)
+            self.assertEqual(cache_no_context.get('bar'), 'foo')
+
+    @with_transaction()
+    def test_memory_cache_peek(self):
+        "Test MemoryCache peek"
+        cache_no_context.set('foo', 'bar')
+
+        with patch.object(cache_mod, '_clear_timeout', 0), \
+                patch.object(backend.Database, 'has_channel',
+                    return_value=True):
+            self.assertEqual(cache_no_context.peek(DB_NAME, 'foo'), 'bar')
+            self.assertEqual(cache_no_context.peek(DB_NAME, 'bar'), None)
+            self.assertEqual(cache_no_context.peek('unknown', 'foo'), None)
+
+    @with_transaction()
+    def test_memory_cache_peek_not_notified(self):
+        "Test MemoryCache peek without notifications"
+        cache_no_context.set('foo', 'bar')
+
+        self.assertEqual(cache_no_context.peek(DB_NAME, 'foo'), None)
+        self.assertEqual(cache_no_context.peek(DB_NAME, 'bar'), None)
+        self.assertEqual(cache_no_context.peek('unknown', 'foo'), None)
+
     @with_transaction()
     def test_memory_cache_expire(self):
         "Test expired cache"
@@ -201,6 +243,10 @@ class MemoryCacheChannelTestCase(MemoryCacheTestCase):
     def test_memory_cache_sync(self):
         super().test_memory_cache_sync()
 
+    @unittest.skip("Cache notified with channel")
+    def test_memory_cache_peek_not_notified(self):
+        super().test_memory_cache_peek_not_notified()
+
 
 class LRUDictTestCase(unittest.TestCase):
     "Test LRUDict"
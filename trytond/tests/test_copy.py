@@ -2,8 +2,9 @@
 # This file is part of Tryton.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
 import unittest
+from unittest.mock import patch
 
-from trytond.model import fields
+from trytond.model import ModelStorage, fields
 from trytond.model.exceptions import AccessError
 from trytond.pool import Pool
 from trytond.tests.test_tryton import activate_module, with_transaction
@@ -127,6 +128,94 @@ class CopyTestCase(unittest.TestCase):
         self.assertListEqual(
             [x.name for x in record_copy.one2many], ["New Target"])
 
+    @with_transaction()
+    def test_one2many_by_sql(self):
+        "Test copy one2many by SQL"
+        pool = Pool()
+        One2many = pool.get('test.copy.one2many')
+        Target = pool.get('test.copy.one2many.target')
+
+        records = One2many.create([{
+                    'name': "Test %s" % i,
+                    'one2many': [('create', [
+                                {'name': "Target %s.1" % i},
+                                {'name': "Target %s.2" % i},
+                                ])],
+                    } for i in range(3)])
+
+        with patch.object(ModelStorage, 'copy') as copy:
+            copies = One2many.copy(
+                records[::-1], default={'one2many.name': "Copy"})
+            copy.assert_not_called()
+
+        self.assertEqual(
+            [c.name for c in copies], [r.name for r in records[::-1]])
+        for record, record_copy in zip(records[::-1], copies):
+            self.assertNotEqual(record_copy.id, record.id)
+            self.assertEqual(record_copy.create_uid.id, Transaction().user)
+            self.assertIsNone(record_copy.write_date)
+            self.assertEqual(
+                [t.name for t in record_copy.one2many], ["Copy", "Copy"])
+            self.assertFalse(
+                set(record_copy.one2many) & set(record.one2many))
+        self.assertEqual(Target.search([], count=True), 12)
+
+    @with_transaction()
+    def test_one2many_by_sql_without_nextids(self):
+        "Test copy one2many by SQL without new ids from the database"
+        pool = Pool()
+        One2many = pool.get('test.copy.one2many')
+        database = Transaction().database
+
+        records = One2many.create([{
+                    'name': "Test %s" % i,
+                    'one2many': [('create', [
+                                {'name': "Target %s" % i},
+                                ])],
+                    } for i in range(3)])
+
+        with patch.object(database, 'nextids', return_value=None):
+            copies = One2many.copy(records)
+
+        self.assertEqual(
+            [c.name for c in copies], [r.name for r in records])
+        for record, record_copy in zip(records, copies):
+            self.assertNotIn(record_copy, records)
+            self.assertEqual(
+                [t.name for t in record_copy.one2many],
+                [t.name for t in record.one2many])
+            self.assertNotEqual(record_copy.one2many, record.one2many)
+
+    @with_transaction()
+    def test_reference_default_by_sql(self):
+        "Test copy by SQL with a record as reference default"
+        pool = Pool()
+        One2many = pool.get('test.copy.one2many_reference')
+        Target = pool.get('test.copy.one2many_reference.target')
+
+        record1, record2 = One2many.create([{}, {}])
+        target, = Target.create([{'one2many': str(record1)}])
+
+        with patch.object(ModelStorage, 'copy') as copy:
+            target_copy, = Target.copy(
+                [target], default={'one2many': record2})
+            copy.assert_not_called()
+
+        self.assertEqual(target_copy.one2many, record2)
+
+    @with_transaction()
+    def test_copy_callable_not_by_sql(self):
+        "Test copy with default callable is not by SQL"
+        pool = Pool()
+        Copy = pool.get('test.copy')
+        record = Copy(name="Name")
+        record.save()
+
+        with patch.object(
+                ModelStorage, 'copy', return_value=[]) as copy:
+            Copy.copy([record], default={'name': lambda d: d['name']})
+            copy.assert_called_once()
+
     @with_transaction()
     def test_many2many(self):
         'Test copy many2many'
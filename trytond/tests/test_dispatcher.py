@@ -0,0 +1,189 @@
+# This file is part of Tryton.  The COPYRIGHT file at the top level of this
+# repository contains the full copyright notices and license terms.
+
+import base64
+import json
+import unittest
+
+from werkzeug.test import Client
+from werkzeug.wrappers import Response
+
+from trytond.pool import Pool
+from trytond.tests.test_tryton import DB_NAME, activate_module, drop_db
+from trytond.transaction import Transaction
+from trytond.wsgi import app
+
+
+class DispatcherTestCase(unittest.TestCase):
+    "Test Dispatcher"
+
+    @classmethod
+    def setUpClass(cls):
+        drop_db()
+        activate_module(['ir', 'res'])
+        pool = Pool(DB_NAME)
+        with Transaction().start(DB_NAME, 0):
+            User = pool.get('res.user')
+            admin, = User.search([('login', '=', 'admin')])
+            admin.password = 'password'
+            admin.save()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        drop_db()
+
+    def post(self, method, *params, headers=None):
+        c = Client(app, Response)
+        return c.post(
+            '/%s/' % DB_NAME,
+            data=json.dumps({
+                    'id': 1,
+                    'method': method,
+                    'params': params,
+                    }),
+            content_type='application/json',
+            headers={
+                'Authorization': (
+                    b'Basic ' + base64.b64encode(b'admin:password')),
+                **(headers or {}),
+                })
+
+    def call(self, method, *params):
+        response = self.post(method, *params)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.data)['result']
+
+    def test_multicall(self):
+        "Test multicall"
+        result = self.call('system.multicall', [{
+                    'methodName': 'model.res.user.search_count',
+                    'params': [[('login', '=', 'admin')], {}],
+                    }, {
+                    'methodName': 'model.res.user.search',
+                    'params': [[('login', '=', 'admin')], 0, None, None, {}],
+                    }])
+
+        self.assertEqual(result[0], [1])
+        self.assertEqual(len(result[1][0]), 1)
+
+    def test_multicall_forbidden(self):
+        "Test multicall with forbidden method"
+        result = self.call('system.multicall', [{
+                    'methodName': 'model.res.user.search_count',
+                    'params': [[], {}],
+                    }, {
+                    'methodName': 'model.res.user.__init__',
+                    'params': [{}],
+                    }])
+
+        self.assertEqual(len(result), 2)
+        self.assertEqual(result[1]['faultCode'], 403)
+
+    def test_multicall_error(self):
+        "Test multicall with failing call"
+        result = self.call('system.multicall', [{
+                    'methodName': 'model.res.user.search_count',
+                    'params': [[('foo', '=', 'bar')], {}],
+                    }, {
+                    'methodName': 'model.res.user.search_count',
+                    'params': [[], {}],
+                    }])
+
+        self.assertIn('faultString', result[0])
+        self.assertGreater(result[1][0], 0)
+
+    def test_multicall_user_error(self):
+        "Test multicall with user error"
+        result = self.call('system.multicall', [{
+                    'methodName': 'model.res.user.create',
+                    'params': [[{'login': 'admin', 'name': "Admin"}], {}],
+                    }])
+
+        fault, = result
+        self.assertEqual(fault['faultCode'], 1)
+        self.assertEqual(fault['error'][0], 'UserError')
+        message, description, domain = fault['error'][1]
+        self.assertTrue(message)
+
+    def test_multicall_write(self):
+        "Test multicall with write"
+        result = self.call('system.multicall', [{
+                    'methodName': 'model.res.user.create',
+                    'params': [[{'login': 'foo', 'name': "Foo"}], {}],
+                    }, {
+                    'methodName': 'model.res.user.search_count',
+                    'params': [[('login', '=', 'foo')], {}],
+                    }])
+
+        self.assertEqual(len(result[0][0]), 1)
+        self.assertEqual(result[1], [1])
+
+    def test_etag(self):
+        "Test cacheable call has an entity tag"
+        response = self.post(
+            'model.res.user.fields_view_get', None, 'form', {})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers['ETag'])
+        self.assertIn('X-Tryton-Cache', response.headers)
+
+    def test_etag_not_cacheable(self):
+        "Test not cacheable call has no entity tag"
+        response = self.post('model.res.user.search_count', [], {})
+
+        self.assertNotIn('ETag', response.headers)
+
+    def test_etag_cache_not_invalidated(self):
+        "Test cacheable call not invalidated by a cache has no entity tag"
+        response = self.post('model.res.user.default_get', [], {})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('X-Tryton-Cache', response.headers)
+        self.assertNotIn('ETag', response.headers)
+
+    def test_etag_not_modified(self):
+        "Test cacheable call not modified"
+        response = self.post(
+            'model.res.user.fields_view_get', None, 'form', {})
+        etag = response.headers['ETag']
+
+        response = self.post(
+            'model.res.user.fields_view_get', None, 'form', {},
+            headers={'If-None-Match': etag})
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers['ETag'], etag)
+        self.assertEqual(response.data, b'')
+
+    def test_etag_arguments(self):
+        "Test entity tag depends on the arguments"
+        response = self.post(
+            'model.res.user.fields_view_get', None, 'form', {})
+        etag = response.headers['ETag']
+
+        response = self.post(
+            'model.res.user.fields_view_get', None, 'tree', {},
+            headers={'If-None-Match': etag})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_etag_cache_cleared(self):
+        "Test entity tag changes when a cache is cleared"
+        response = self.post(
+            'model.res.user.fields_view_get', None, 'form', {})
+        etag = response.headers['ETag']
+
+        with Transaction().start(DB_NAME, 0) as transaction:
+            pool = Pool()
+            View = pool.get('ir.ui.view')
+            View._view_get_cache.clear()
+            transaction.commit()
+
+        response = self.post(
+            'model.res.user.fields_view_get', None, 'form', {},
+            headers={'If-None-Match': etag})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
@@ -450,3 +450,19 @@ class ExportDataTestCase(unittest.TestCase):
             ExportData.export_data_domain(
                 [('boolean', '=', True)], ['boolean'], header=True),
             [["Boolean"], [True]])
+
+    @with_transaction()
+    def test_export_data_iter(self):
+        "Test export_data_iter"
+        pool = Pool()
+        ExportData = pool.get('test.export_data')
+        records = ExportData.create([{
+                    'boolean': True,
+                    }, {
+                    'boolean': False,
+                    }])
+
+        rows = ExportData.export_data_iter(iter(records), ['boolean'], True)
+
+        self.assertEqual(next(rows), ["Boolean"])
+        self.assertEqual(list(rows), [[True], [False]])
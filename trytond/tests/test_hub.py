@@ -0,0 +1,228 @@
+# This file is part of Tryton.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+import json
+import os
+import selectors
+import socket
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+from trytond import backend, hub
+from trytond.tests.test_tryton import DB_NAME, activate_module
+from trytond.transaction import Transaction
+
+
+class HubPathMixin:
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, hub.address)
+        patcher = patch.object(hub, '_path', return_value=self.path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+@unittest.skipIf(not hasattr(socket, 'AF_UNIX'), "AF_UNIX not available")
+class HubClientTestCase(HubPathMixin, unittest.TestCase):
+    "Test Hub Client"
+
+    def serve(self, reply):
+        "Serve one subscription with the reply"
+        server = socket.socket(socket.AF_UNIX)
+        server.bind(self.path)
+        server.listen()
+        self.addCleanup(server.close)
+        requests = []
+
+        def accept():
+            sock, _ = server.accept()
+            with sock:
+                data = b''
+                while b'\n' not in data:
+                    data += sock.recv(1024)
+                requests.append(json.loads(data))
+                sock.sendall(reply)
+                sock.recv(1024)
+        thread = threading.Thread(target=accept, daemon=True)
+        thread.start()
+        self.addCleanup(thread.join)
+        return requests
+
+    def test_connection_poll(self):
+        "Test poll of connection"
+        reader, writer = socket.socketpair()
+        self.addCleanup(writer.close)
+        conn = hub.Connection(reader)
+        self.addCleanup(conn.close)
+
+        conn.poll()
+        writer.sendall(b'{"channel":"foo","payload":"bar"}\n{"chan')
+        selector = selectors.DefaultSelector()
+        selector.register(conn, selectors.EVENT_READ)
+        selector.select(timeout=1)
+        conn.poll()
+
+        self.assertEqual(conn.notifies, [hub.Notify('foo', 'bar')])
+
+    def test_connection_poll_closed(self):
+        "Test poll of connection closed"
+        reader, writer = socket.socketpair()
+        conn = hub.Connection(reader)
+        self.addCleanup(conn.close)
+        writer.close()
+
+        with self.assertRaises(ConnectionError):
+            conn.poll()
+
+    def test_connect_no_hub(self):
+        "Test connect without hub"
+        self.assertIsNone(hub.connect(DB_NAME, 'channel'))
+
+    def test_connect(self):
+        "Test connect"
+        requests = self.serve(b'\n{"channel":"channel","payload":"foo"}\n')
+
+        conn = hub.connect(DB_NAME, 'channel')
+        conn.close()
+
+        self.assertEqual(
+            requests, [{'database': DB_NAME, 'channel': 'channel'}])
+        self.assertEqual(conn.notifies, [hub.Notify('channel', 'foo')])
+
+    def test_connect_refused(self):
+        "Test connect refused by the hub"
+        self.serve(b'no channel\n')
+
+        with self.assertLogs('trytond.hub', 'WARNING'):
+            conn = hub.connect(DB_NAME, 'channel')
+
+        self.assertIsNone(conn)
+
+
+class HubBufferTestCase(unittest.TestCase):
+    "Test Hub output buffers"
+
+    def setUp(self):
+        super().setUp()
+        self.hub = hub.Hub()
+        self.addCleanup(self.hub.selector.close)
+        self.sock, self.peer = socket.socketpair()
+        self.addCleanup(self.sock.close)
+        self.addCleanup(self.peer.close)
+        self.sock.setblocking(False)
+        self.hub.inputs[self.sock] = b''
+        self.hub.outputs[self.sock] = bytearray()
+        self.hub.selector.register(self.sock, selectors.EVENT_READ, 'client')
+
+    def test_send(self):
+        "Test send to a client"
+        self.assertTrue(self.hub._send(self.sock, b'foo'))
+
+        self.assertEqual(self.peer.recv(1024), b'foo\n')
+        self.assertEqual(
+            self.hub.selector.get_key(self.sock).events,
+            selectors.EVENT_READ)
+
+    def test_send_pending(self):
+        "Test send to a client which does not receive"
+        line = b'x' * 1024
+        while not self.hub.outputs[self.sock]:
+            self.hub._send(self.sock, line)
+
+        self.assertEqual(
+            self.hub.selector.get_key(self.sock).events,
+            selectors.EVENT_READ | selectors.EVENT_WRITE)
+
+        self.peer.setblocking(False)
+        try:
+            while self.peer.recv(65536):
+                pass
+        except BlockingIOError:
+            pass
+        self.hub._flush(self.sock)
+
+        self.assertFalse(self.hub.outputs[self.sock])
+        self.assertEqual(
+            self.hub.selector.get_key(self.sock).events,
+            selectors.EVENT_READ)
+
+    def test_send_drop(self):
+        "Test drop the client exceeding the buffer"
+        self.hub.max_buffer = 4096
+        line = b'x' * 1024
+
+        with self.assertLogs('trytond.hub', 'WARNING'):
+            while self.hub._send(self.sock, line):
+                pass
+
+        self.assertNotIn(self.sock, self.hub.outputs)
+        self.assertEqual(self.sock.fileno(), -1)
+
+
+@unittest.skipIf(not hasattr(socket, 'AF_UNIX'), "AF_UNIX not available")
+class HubStaleTestCase(HubPathMixin, unittest.TestCase):
+    "Test Hub stale socket"
+
+    def test_remove_stale(self):
+        "Test remove stale socket"
+        with socket.socket(socket.AF_UNIX) as server:
+            server.bind(self.path)
+
+        hub._remove_stale(self.path)
+
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_remove_stale_listening(self):
+        "Test remove stale socket with a hub listening"
+        server = socket.socket(socket.AF_UNIX)
+        self.addCleanup(server.close)
+        server.bind(self.path)
+        server.listen()
+
+        with self.assertRaises(OSError):
+            hub._remove_stale(self.path)
+
+        self.assertTrue(os.path.exists(self.path))
+
+    def test_remove_stale_missing(self):
+        "Test remove stale socket without file"
+        hub._remove_stale(self.path)
+
+        self.assertFalse(os.path.exists(self.path))
+
+
+@unittest.skipIf(not hasattr(socket, 'AF_UNIX'), "AF_UNIX not available")
+@unittest.skipIf(backend.name == 'sqlite', 'SQLite has not channel')
+class HubTestCase(HubPathMixin, unittest.TestCase):
+    "Test Hub"
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        activate_module('ir')
+
+    def test_relay(self):
+        "Test relay notification"
+        thread = threading.Thread(
+            target=hub.Hub().serve, args=(self.path, 1), daemon=True)
+        thread.start()
+        while not os.path.exists(self.path):
+            thread.join(0.01)
+
+        conn = hub.connect(DB_NAME, 'test_hub')
+        self.addCleanup(conn.close)
+        transaction = Transaction()
+        with transaction.start(DB_NAME, 0) as transaction:
+            cursor = transaction.connection.cursor()
+            cursor.execute('NOTIFY "test_hub", %s', ('foo',))
+            transaction.commit()
+        selector = selectors.DefaultSelector()
+        selector.register(conn, selectors.EVENT_READ)
+        selector.select(timeout=5)
+        conn.poll()
+
+        self.assertEqual(conn.notifies, [hub.Notify('test_hub', 'foo')])
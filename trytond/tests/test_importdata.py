@@ -4,6 +4,7 @@
 import datetime as dt
 import unittest
 from decimal import Decimal
+from unittest.mock import patch
 
 from trytond.model.exceptions import ImportDataError
 from trytond.pool import Pool
@@ -296,6 +297,24 @@ class ImportDataTestCase(unittest.TestCase):
         self.assertEqual(
             Many2one.import_data(['many2one'], [['Test'], ['Test']]), 2)
 
+    @with_transaction()
+    def test_many2one_batch(self):
+        "Test many2one values are resolved in batch"
+        pool = Pool()
+        Many2one = pool.get('test.import_data.many2one')
+        Target = pool.get('test.import_data.many2one.target')
+        targets = Target.create([{'name': str(i)} for i in range(5)])
+
+        with patch.object(Target, 'search', wraps=Target.search) as search:
+            count = Many2one.import_data(
+                ['many2one'], [[str(i)] for i in range(5)] * 2)
+
+        self.assertEqual(count, 10)
+        self.assertEqual(search.call_count, 1)
+        self.assertEqual(
+            [r.many2one for r in Many2one.search([], order=[('id', 'ASC')])],
+            targets * 2)
+
     @with_transaction()
     def test_many2one_invalid(self):
         "Test many2one invalid value"
@@ -540,6 +559,21 @@ class ImportDataTestCase(unittest.TestCase):
         record, = Binary.search([])
         self.assertEqual(record.data, b'data')
 
+    @with_transaction(context={'_record_cache_size': 2})
+    def test_batch(self):
+        "Test import in batch"
+        pool = Pool()
+        Char = pool.get('test.import_data.char')
+        data = [[str(i)] for i in range(5)]
+
+        count = Char.import_data(['char'], data)
+
+        self.assertEqual(count, 5)
+        self.assertEqual(
+            sorted(r.char for r in Char.search([])),
+            [str(i) for i in range(5)])
+        self.assertEqual(len(data), 5)
+
     @with_transaction()
     def test_update_id(self):
         "Test update with ID"
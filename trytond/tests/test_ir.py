@@ -12,6 +12,8 @@ except ImportError:
 
 from dateutil.relativedelta import relativedelta
 
+from trytond import backend, security
+from trytond import cache as cache_mod
 from trytond.config import config
 from trytond.pool import Pool
 from trytond.pyson import Eval, If, PYSONEncoder
@@ -19,7 +21,7 @@ from trytond.tools import timezone
 from trytond.transaction import Transaction
 
 from .test_tryton import (
-    ModuleTestCase, activate_module, drop_db, with_transaction)
+    DB_NAME, ModuleTestCase, activate_module, drop_db, with_transaction)
 
 
 class IrTestCase(ModuleTestCase):
@@ -434,6 +436,20 @@ class IrCronTestCase(unittest.TestCase):
             cron.compute_next_call(datetime.datetime(2021, 12, 31, 5, 0)),
             datetime.datetime(2022, 1, 1, 6, 0))
 
+    @with_transaction()
+    def test_scheduling_seconds(self):
+        "Test scheduling every seconds"
+        cron = self._get_cron()
+        cron.interval_number = 30
+        cron.interval_type = 'seconds'
+        cron.minute = 10
+        cron.hour = 1
+
+        self.assertEqual(
+            cron.compute_next_call(
+                datetime.datetime(2021, 12, 31, 5, 0, 50, 42)),
+            datetime.datetime(2021, 12, 31, 5, 1, 20))
+
     @unittest.skipIf(not zoneinfo, "dateutil does not compute correctly")
     @with_transaction()
     def test_scheduling_on_dst_change(self):
@@ -462,5 +478,265 @@ class IrCronTestCase(unittest.TestCase):
             cron.compute_next_call(datetime.datetime(2022, 11, 6, 7, 30)),
             datetime.datetime(2022, 11, 6, 8, 30))
 
+    @with_transaction()
+    def test_session_check(self):
+        "Test checking session"
+        pool = Pool()
+        Session = pool.get('ir.session')
+        transaction = Transaction()
+
+        key = Session.new()
+
+        self.assertIs(Session.check(transaction.user, key), True)
+        self.assertIs(Session.check(transaction.user, 'foo'), None)
+
+    @with_transaction()
+    def test_session_check_cache(self):
+        "Test checking session uses the cache"
+        pool = Pool()
+        Session = pool.get('ir.session')
+        transaction = Transaction()
+        key = Session.new()
+        Session.check(transaction.user, key)
+
+        with patch.object(Session, 'search') as search:
+            self.assertIs(Session.check(transaction.user, key), True)
+            search.assert_not_called()
+
+    @with_transaction()
+    def test_session_check_deleted(self):
+        "Test checking deleted session"
+        pool = Pool()
+        Session = pool.get('ir.session')
+        transaction = Transaction()
+        key = Session.new()
+        Session.check(transaction.user, key)
+
+        Session.remove(key)
+
+        self.assertIs(Session.check(transaction.user, key), None)
+
+    @with_transaction()
+    def test_session_check_other_deleted(self):
+        "Test checking session after deleting another session"
+        pool = Pool()
+        Session = pool.get('ir.session')
+        transaction = Transaction()
+        key1 = Session.new()
+        key2 = Session.new()
+        Session.check(transaction.user, key1)
+        Session.check(transaction.user, key2)
+
+        Session.remove(key1)
+
+        with patch.object(Session, 'search') as search:
+            self.assertIs(Session.check(transaction.user, key2), True)
+            search.assert_not_called()
+
+    @with_transaction()
+    def test_session_check_cached(self):
+        "Test checking cached session without transaction"
+        pool = Pool()
+        Session = pool.get('ir.session')
+        transaction = Transaction()
+        user = transaction.user
+        key = Session.new()
+
+        self.assertIs(Session.check_cached(DB_NAME, user, key), False)
+        Session.check(user, key)
+        with patch.object(cache_mod, '_clear_timeout', 0), \
+                patch.object(backend.Database, 'has_channel',
+                    return_value=True):
+            self.assertIs(Session.check_cached(DB_NAME, user, key), True)
+
+            with patch.object(Transaction, 'start') as start:
+                self.assertEqual(security.check(DB_NAME, user, key), user)
+                start.assert_not_called()
+
+    @with_transaction()
+    def test_session_check_cached_not_notified(self):
+        "Test checking cached session without notifications"
+        pool = Pool()
+        Session = pool.get('ir.session')
+        transaction = Transaction()
+        user = transaction.user
+        key = Session.new()
+        Session.check(user, key)
+
+        with patch.object(cache_mod, '_clear_timeout', 1):
+            self.assertIs(Session.check_cached(DB_NAME, user, key), False)
+
+    @with_transaction()
+    def test_session_check_expired(self):
+        "Test checking expired session"
+        pool = Pool()
+        Session = pool.get('ir.session')
+        table = Session.__table__()
+        cursor = Transaction().connection.cursor()
+        transaction = Transaction()
+        max_age = datetime.timedelta(
+            seconds=config.getint('session', 'max_age'))
+        key = Session.new()
+        session, = Session.search([('key', '=', key)])
+        cursor.execute(*table.update(
+                [table.create_date],
+                [datetime.datetime.now() - max_age * 2],
+                where=table.id == session.id))
+
+        self.assertIs(Session.check(transaction.user, key), False)
+        self.assertEqual(Session.search([('key', '=', key)]), [session])
+
+    @with_transaction()
+    def test_session_clean(self):
+        "Test cleaning sessions"
+        pool = Pool()
+        Session = pool.get('ir.session')
+        table = Session.__table__()
+        cursor = Transaction().connection.cursor()
+        now = datetime.datetime.now()
+        max_age = datetime.timedelta(
+            seconds=config.getint('session', 'max_age'))
+        timeout = datetime.timedelta(
+            seconds=config.getint('session', 'timeout'))
+
+        Session.delete(Session.search([]))
+        old, timed_out, written, valid = Session.create([{}] * 4)
+        for session, create_date, write_date in [
+                (old, now - max_age - timeout, None),
+                (timed_out, now - timeout * 2, None),
+                (written, now - timeout * 2, now - timeout * 3 / 2),
+                (valid, now - timeout * 2, now)]:
+            cursor.execute(*table.update(
+                    [table.create_date, table.write_date],
+                    [create_date, write_date],
+                    where=table.id == session.id))
+
+        Session.clean()
+
+        self.assertEqual(Session.search([]), [valid])
+
+    @with_transaction()
+    def test_error_clean(self):
+        "Test cleaning errors"
+        pool = Pool()
+        Error = pool.get('ir.error')
+        Cron = pool.get('ir.cron')
+        cron, = Cron.search([], limit=1)
+        error, = Error.create([{
+                    'origin': str(cron),
+                    'message': "Error",
+                    }])
+
+        Error.clean(date=datetime.datetime.now() - datetime.timedelta(1))
+        self.assertEqual(Error.search([]), [error])
+
+        Error.clean(date=datetime.datetime.now() + datetime.timedelta(1))
+        self.assertEqual(Error.search([]), [])
+
+    @with_transaction()
+    def test_claim(self):
+        "Test claiming due crons"
+        pool = Pool()
+        Cron = pool.get('ir.cron')
+        db_name = Transaction().database.name
+        now = datetime.datetime.now()
+
+        Cron.write(Cron.search([]), {'active': False})
+        cron1, cron2, _ = Cron.create([{
+                    'interval_number': 1,
+                    'interval_type': 'days',
+                    'method': 'ir.queue|clean',
+                    'next_call': now - datetime.timedelta(hours=1),
+                    }, {
+                    'interval_number': 1,
+                    'interval_type': 'days',
+                    'method': 'ir.error|clean',
+                    'next_call': None,
+                    }, {
+                    'interval_number': 1,
+                    'interval_type': 'days',
+                    'method': 'ir.error|clean',
+                    'next_call': now + datetime.timedelta(hours=1),
+                    }])
+
+        claimed1 = Cron._claim(now)
+        self.addCleanup(Cron._release, db_name, claimed1)
+        claimed2 = Cron._claim(now)
+        self.addCleanup(Cron._release, db_name, claimed2)
+
+        self.assertEqual([claimed1, claimed2], [cron2, cron1])
+        self.assertIsNone(Cron._claim(now))
+
+        Cron._release(db_name, claimed1)
+        self.assertEqual(Cron._claim(now), cron2)
+        self.assertIsNone(Cron._claim(now, exclude=[cron2.id]))
+
+    @with_transaction()
+    def test_enqueue(self):
+        "Test pushing due crons into the queue"
+        pool = Pool()
+        Cron = pool.get('ir.cron')
+        Queue = pool.get('ir.queue')
+        transaction = Transaction()
+        self.addCleanup(transaction.tasks.clear)
+        now = datetime.datetime.now()
+
+        Cron.write(Cron.search([]), {'active': False})
+        due, later = Cron.create([{
+                    'interval_number': 1,
+                    'interval_type': 'hours',
+                    'method': 'ir.queue|clean',
+                    'next_call': now - datetime.timedelta(minutes=1),
+                    }, {
+                    'interval_number': 1,
+                    'interval_type': 'days',
+                    'method': 'ir.error|clean',
+                    'next_call': now + datetime.timedelta(minutes=10),
+                    }])
+
+        next_call = Cron._enqueue(now)
+        self.assertEqual(next_call, later.next_call)
+        self.assertEqual(due.next_call, due.compute_next_call(now))
+        task, = Queue.browse(transaction.tasks)
+        self.assertEqual(task.name, 'cron')
+        self.assertEqual(task.data['method'], 'run_once')
+        self.assertEqual(task.data['instances'], (due.id,))
+
+        Cron.write([due], {'next_call': now})
+        Cron._enqueue(now)
+        self.assertEqual(transaction.tasks, [task.id])
+
+    @with_transaction()
+    def test_enqueue_many(self):
+        "Test pushing many due crons into the queue"
+        pool = Pool()
+        Cron = pool.get('ir.cron')
+        Queue = pool.get('ir.queue')
+        transaction = Transaction()
+        self.addCleanup(transaction.tasks.clear)
+        now = datetime.datetime.now()
+
+        Cron.write(Cron.search([]), {'active': False})
+        cron1, cron2 = Cron.create([{
+                    'interval_number': 1,
+                    'interval_type': 'hours',
+                    'method': 'ir.queue|clean',
+                    'next_call': now - datetime.timedelta(minutes=1),
+                    }, {
+                    'interval_number': 1,
+                    'interval_type': 'days',
+                    'method': 'ir.error|clean',
+                    'next_call': now - datetime.timedelta(minutes=1),
+                    }])
+
+        Cron._enqueue(now)
+        task1, task2 = Queue.browse(transaction.tasks)
+        self.assertEqual(task1.data['instances'], (cron1.id,))
+        self.assertEqual(task2.data['instances'], (cron2.id,))
+
+        Cron.write([cron1, cron2], {'next_call': now})
+        Cron._enqueue(now)
+        self.assertEqual(transaction.tasks, [task1.id, task2.id])
+
 
 del ModuleTestCase
@@ -712,6 +712,35 @@ class ModelSQLTestCase(unittest.TestCase):
         self.assertIn('UNION', str(Model.search(domain, query=True)))
         self.assertNotIn('UNION', str(query_without_split))
 
+    @with_transaction()
+    def test_search_iter(self):
+        "Test search_iter"
+        pool = Pool()
+        Model = pool.get('test.modelsql.search.or2union')
+        Model.create([{'name': str(i)} for i in range(10)])
+        domain = [('name', '!=', '5')]
+        order = [('name', 'DESC')]
+
+        self.assertEqual(
+            list(Model.search_iter(domain, order=order)),
+            Model.search(domain, order=order))
+        self.assertEqual(
+            list(Model.search_iter(domain, offset=2, limit=3, order=order)),
+            Model.search(domain, offset=2, limit=3, order=order))
+
+    @with_transaction(context={'_record_cache_size': 3})
+    def test_search_iter_batch(self):
+        "Test search_iter by batch"
+        pool = Pool()
+        Model = pool.get('test.modelsql.search.or2union')
+        Model.create([{'name': str(i)} for i in range(10)])
+
+        records = list(Model.search_iter([], order=[('name', 'ASC')]))
+
+        self.assertEqual(
+            [r.name for r in records], [str(i) for i in range(10)])
+        self.assertLessEqual(len(records[0]._ids), 3)
+
     @with_transaction()
     def test_search_or_to_union_order_eager_field(self):
         """
@@ -6,6 +6,7 @@ import unittest
 from trytond.model import EvalEnvironment
 from trytond.model.exceptions import (
     AccessError, DomainValidationError, RequiredValidationError)
+from trytond.model.modelstorage import DomainParameter
 from trytond.pool import Pool
 from trytond.tests.test_tryton import activate_module, with_transaction
 from trytond.transaction import Transaction
@@ -508,6 +509,69 @@ class ModelStorageTestCase(unittest.TestCase):
         self.assertTrue(
             cm.exception.domain[1]['relation2']['relation_fields']['value'])
 
+    @with_transaction()
+    def test_relation_parameter_domain(self):
+        "Test valid relation with parametrized domain"
+        pool = Pool()
+        Model = pool.get('test.modelstorage.relation_parameter_domain')
+        Target = pool.get('test.modelstorage.relation_domain.target')
+
+        targets = Target.create(
+            [{'value': str(i)} for i in range(10)]
+            + [{'value': 'any'}, {'value': None}])
+
+        Model.create(
+            [{'value': t.value, 'relation': t.id} for t in targets]
+            + [{'value': 'foo', 'relation': targets[-2].id}])
+
+    @with_transaction()
+    def test_relation_parameter_domain_invalid(self):
+        "Test invalid relation with parametrized domain"
+        pool = Pool()
+        Model = pool.get('test.modelstorage.relation_parameter_domain')
+        Target = pool.get('test.modelstorage.relation_domain.target')
+
+        targets = Target.create([{'value': str(i)} for i in range(10)])
+
+        with self.assertRaises(DomainValidationError) as cm:
+            Model.create(
+                [{'value': t.value, 'relation': t.id} for t in targets]
+                + [{'value': '1', 'relation': targets[2].id}])
+        self.assertEqual(cm.exception.domain[0], ['OR',
+                ['value', '=', '1'], ['value', '=', 'any']])
+        self.assertTrue(cm.exception.domain[1]['value'])
+
+    @with_transaction()
+    def test_domain_violations(self):
+        "Test domain violations"
+        pool = Pool()
+        Target = pool.get('test.modelstorage.relation_domain.target')
+
+        target1, target2 = Target.create([{'value': 'a'}, {'value': None}])
+
+        violations = Target._domain_violations(
+            [('value', '=', DomainParameter(0))], [
+                (0, target1.id, 'a'),
+                (1, target1.id, 'b'),
+                (2, target2.id, None),
+                (3, target2.id, 'a'),
+                ])
+
+        self.assertEqual(violations, {1, 3})
+
+    @with_transaction()
+    def test_domain_violations_incompatible(self):
+        "Test domain violations with incompatible parameter"
+        pool = Pool()
+        Target = pool.get('test.modelstorage.relation_domain.target')
+
+        target, = Target.create([{'value': 'a'}])
+
+        violations = Target._domain_violations(
+            [('value', '=', DomainParameter(0))], [(0, target.id, 1)])
+
+        self.assertIsNone(violations)
+
     @with_transaction()
     def test_check_xml_record_without_record(self):
         "Test check_xml_record without record"
@@ -4,9 +4,14 @@
 import datetime
 import json
 import unittest
+import uuid
 from decimal import Decimal
+from unittest.mock import patch
 
-from trytond.protocols.jsonrpc import JSONDecoder, JSONEncoder, JSONRequest
+from trytond.protocols import jsonrpc
+from trytond.protocols.jsonrpc import (
+    JSONDecoder, JSONEncoder, JSONProtocol, JSONRequest, dumps, dumps_iter,
+    loads)
 from trytond.protocols.xmlrpc import XMLRequest, client
 from trytond.tools.immutabledict import ImmutableDict
 
@@ -73,6 +78,103 @@ class JSONTestCase(DumpsLoadsMixin, unittest.TestCase):
                 object_hook=JSONDecoder()), value)
 
 
+class JSONCodecTestCase(DumpsLoadsMixin, unittest.TestCase):
+    "Test JSON codec"
+
+    def dumps_loads(self, value):
+        self.assertEqual(loads(dumps(value)), value)
+
+    def test_dumps_compact(self):
+        "Test dumps is compact"
+        self.assertEqual(dumps({'foo': [1, 2]}), b'{"foo":[1,2]}')
+
+    def test_dumps_int_keys(self):
+        "Test dumps with integer keys"
+        self.assertEqual(loads(dumps({1: 'foo'})), {'1': 'foo'})
+
+    def test_dumps_unknown(self):
+        "Test dumps unknown type"
+        with self.assertRaises(TypeError):
+            dumps(object())
+
+    def test_dumps_subclass(self):
+        "Test dumps subclass without serializer"
+        class Str(str):
+            def __str__(self):
+                return 'bar'
+
+        class Int(int):
+            pass
+
+        self.assertEqual(
+            loads(dumps([Str('foo'), Int(1), ImmutableDict(a=(1, 2))])),
+            ['foo', 1, {'a': [1, 2]}])
+
+    def test_dumps_registered_subclass(self):
+        "Test dumps subclass with registered serializer"
+        class Str(str):
+            pass
+
+        JSONEncoder.register(Str, lambda o: {'__class__': 'Str'})
+        self.addCleanup(JSONEncoder.serializers.pop, Str)
+
+        value = loads(dumps({'foo': Str('bar')}))
+
+        if jsonrpc.orjson:
+            self.assertEqual(value, {'foo': {'__class__': 'Str'}})
+        else:
+            # The json module encodes the subclasses of str natively
+            self.assertEqual(value, {'foo': 'bar'})
+
+    def test_dumps_registered_uuid(self):
+        "Test dumps UUID with registered serializer"
+        class UUID(uuid.UUID):
+            pass
+
+        patcher = patch.object(JSONEncoder, '_orjson_native', False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        JSONEncoder.register(UUID, lambda o: {'__class__': 'UUID'})
+        self.addCleanup(JSONEncoder.serializers.pop, UUID)
+
+        self.assertEqual(
+            loads(dumps(UUID(int=1))), {'__class__': 'UUID'})
+
+    def test_dumps_iter(self):
+        "Test dumps_iter"
+        value = [{'id': i, 'date': datetime.date.today()} for i in range(10)]
+
+        self.assertEqual(b''.join(dumps_iter(value, 3)), dumps(value))
+
+    def test_dumps_iter_small(self):
+        "Test dumps_iter with small value"
+        self.assertEqual(list(dumps_iter([1, 2], 3)), [b'[1,2]'])
+
+    def test_response_stream(self):
+        "Test response with large result is streamed"
+        request = JSONRequest.from_values(
+            data=b'{"id": 1, "method": "method", "params": []}',
+            content_type='text/json',
+            )
+        result = list(range(jsonrpc._STREAM_SIZE + 1))
+
+        response = JSONProtocol.response(result, request)
+
+        self.assertTrue(response.is_streamed)
+        self.assertEqual(
+            json.loads(response.get_data()), {'id': 1, 'result': result})
+
+
+class JSONCodecStdlibTestCase(JSONCodecTestCase):
+    "Test JSON codec without C encoder"
+
+    def setUp(self):
+        super().setUp()
+        patcher = patch.object(jsonrpc, 'orjson', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
 class XMLTestCase(DumpsLoadsMixin, unittest.TestCase):
     'Test XML'
 
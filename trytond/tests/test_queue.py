@@ -0,0 +1,609 @@
+# This file is part of Tryton.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+import datetime as dt
+import os
+import threading
+import unittest
+from unittest.mock import ANY, Mock, call, patch
+
+from trytond import backend
+from trytond.pool import Pool
+from trytond.tools import delete_by_chunk
+from trytond.transaction import Transaction
+from trytond.worker import TaskList, TaskStat, pull, run_task, run_tasks
+
+from .test_tryton import DB_NAME, activate_module, with_transaction
+
+
+class QueueTestCase(unittest.TestCase):
+    "Test Queue"
+
+    @classmethod
+    def setUpClass(cls):
+        activate_module('ir')
+
+    def _push(self, name='default', priority=None):
+        pool = Pool()
+        Queue = pool.get('ir.queue')
+        return Queue.push(name, priority=priority, data={
+                'model': 'res.user',
+                'method': 'read',
+                'user': 0,
+                'context': {},
+                'instances': [],
+                'args': [],
+                'kwargs': {},
+                })
+
+    @with_transaction()
+    def test_pull(self):
+        "Test pull a task"
+        pool = Pool()
+        Queue = pool.get('ir.queue')
+        transaction = Transaction()
+
+        task_id = self._push()
+
+        self.assertEqual(
+            Queue.pull(transaction.database, transaction.connection),
+            ([task_id], None))
+        self.assertEqual(
+            Queue.pull(transaction.database, transaction.connection),
+            ([], None))
+
+    @with_transaction()
+    def test_pull_limit(self):
+        "Test pull many tasks"
+        pool = Pool()
+        Queue = pool.get('ir.queue')
+        transaction = Transaction()
+
+        task_ids = [self._push() for _ in range(3)]
+
+        pulled, _ = Queue.pull(
+            transaction.database, transaction.connection, limit=2)
+        self.assertEqual(len(pulled), 2)
+        pulled2, _ = Queue.pull(
+            transaction.database, transaction.connection, limit=2)
+        self.assertEqual(len(pulled2), 1)
+        self.assertEqual(sorted(pulled + pulled2), task_ids)
+        self.assertTrue(all(t.dequeued_at for t in Queue.browse(task_ids)))
+
+    @with_transaction()
+    def test_pull_name(self):
+        "Test pull tasks of a queue"
+        pool = Pool()
+        Queue = pool.get('ir.queue')
+        transaction = Transaction()
+
+        self._push('default')
+        task_id = self._push('other')
+
+        self.assertEqual(
+            Queue.pull(
+                transaction.database, transaction.connection,
+                name='other', limit=10),
+            ([task_id], None))
+
+    @with_transaction()
+    def test_pull_exclude(self):
+        "Test pull tasks excluding queues"
+        pool = Pool()
+        Queue = pool.get('ir.queue')
+        transaction = Transaction()
+
+        task_id = self._push('default')
+        self._push('other')
+
+        self.assertEqual(
+            Queue.pull(
+                transaction.database, transaction.connection,
+                exclude=['other'], limit=10),
+            ([task_id], None))
+
+    @with_transaction()
+    def test_pull_priority(self):
+        "Test pull tasks by priority"
+        pool = Pool()
+        Queue = pool.get('ir.queue')
+        transaction = Transaction()
+
+        self._push(priority=-10)
+        task_id = self._push(priority=10)
+        self._push()
+
+        self.assertEqual(
+            Queue.pull(transaction.database, transaction.connection),
+            ([task_id], None))
+
+    @with_transaction()
+    def test_caller_priority(self):
+        "Test caller with priority"
+        pool = Pool()
+        Queue = pool.get('ir.queue')
+        User = pool.get('res.user')
+
+        with Transaction().set_context(queue_priority=5):
+            task_id, = User.__queue__.read(User.search([]))
+
+        task = Queue(task_id)
+        self.assertEqual(task.priority, 5)
+
+    @with_transaction()
+    def test_caller_coalesce(self):
+        "Test caller with coalesce"
+        pool = Pool()
+        Queue = pool.get('ir.queue')
+        User = pool.get('res.user')
+        user1, user2 = User.create([{'login': 'a'}, {'login': 'b'}])
+
+        with Transaction().set_context(queue_coalesce=True):
+            task_id, = User.__queue__.read([user1])
+            other_id, = User.__queue__.read([user2])
+            same_id, = User.__queue__.read([user2, user1])
+            args_id, = User.__queue__.read([user1], ['login'])
+
+        self.assertEqual(other_id, task_id)
+        self.assertEqual(same_id, task_id)
+        self.assertNotEqual(args_id, task_id)
+        task = Queue(task_id)
+        self.assertEqual(task.data['instances'], (user1.id, user2.id))
+
+    @with_transaction()
+    def test_push_coalesce_dequeued(self):
+        "Test push with coalesce does not merge dequeued task"
+        pool = Pool()
+        Queue = pool.get('ir.queue')
+        transaction = Transaction()
+        data = {
+            'model': 'res.user',
+            'method': 'read',
+            'user': 0,
+            'context': {},
+            'args': [],
+            'kwargs': {},
+            }
+
+        task_id = Queue.push(
+            'default', dict(data, instances=[1]), coalesce=True)
+        Queue.pull(transaction.database, transaction.connection)
+        other_id = Queue.push(
+            'default', dict(data, instances=[1]), coalesce=True)
+
+        self.assertNotEqual(other_id, task_id)
+
+    @with_transaction()
+    def test_push_coalesce_size(self):
+        "Test push with coalesce limited in size"
+        pool = Pool()
+        Queue = pool.get('ir.queue')
+        data = {
+            'model': 'res.user',
+            'method': 'read',
+            'user': 0,
+            'context': {},
+            'args': [],
+            'kwargs': {},
+            }
+
+        task_id = Queue.push(
+            'default', dict(data, instances=[1, 2]), coalesce=3)
+        same_id = Queue.push(
+            'default', dict(data, instances=[1, 3]), coalesce=3)
+        other_id = Queue.push(
+            'default', dict(data, instances=[4]), coalesce=3)
+
+        self.assertEqual(same_id, task_id)
+        self.assertNotEqual(other_id, task_id)
+        self.assertEqual(Queue(task_id).data['instances'], (1, 2, 3))
+        self.assertEqual(Queue(other_id).data['instances'], (4,))
+
+    @with_transaction()
+    def test_run_coalesce(self):
+        "Test run merges the pending tasks with the same key"
+        pool = Pool()
+        Queue = pool.get('ir.queue')
+        User = pool.get('res.user')
+        user1, user2 = User.create([{'login': 'a'}, {'login': 'b'}])
+        data = {
+            'model': 'res.user',
+            'method': 'write',
+            'user': 0,
+            'context': {},
+            'args': ({'name': "Coalesced"},),
+            'kwargs': {},
+            }
+        key = Queue._coalesce_key(data)
+        task1, task2 = Queue.create([{
+                    'name': 'default',
+                    'data': dict(data, instances=[user1.id]),
+                    'key': key,
+                    }, {
+                    'name': 'default',
+                    'data': dict(data, instances=[user2.id]),
+                    'key': key,
+                    }])
+
+        task1.run()
+
+        self.assertEqual(user1.name, "Coalesced")
+        self.assertEqual(user2.name, "Coalesced")
+        self.assertTrue(task2.finished_at)
+
+    @with_transaction()
+    def test_run_coalesce_single_instance(self):
+        "Test run does not merge the pending task with a single instance"
+        pool = Pool()
+        Queue = pool.get('ir.queue')
+        User = pool.get('res.user')
+        user1, user2, user3 = User.create(
+            [{'login': 'a'}, {'login': 'b'}, {'login': 'c'}])
+        data = {
+            'model': 'res.user',
+            'method': 'write',
+            'user': 0,
+            'context': {},
+            'args': ({'name': "Coalesced"},),
+            'kwargs': {},
+            }
+        key = Queue._coalesce_key(data)
+        task1, task2, task3 = Queue.create([{
+                    'name': 'default',
+                    'data': dict(data, instances=[user1.id]),
+                    'key': key,
+                    }, {
+                    'name': 'default',
+                    'data': dict(data, instances=user2.id),
+                    'key': key,
+                    }, {
+                    'name': 'default',
+                    'data': dict(data, instances=[user3.id]),
+                    'key': key,
+                    }])
+
+        task1.run()
+
+        self.assertEqual(user1.name, "Coalesced")
+        self.assertNotEqual(user2.name, "Coalesced")
+        self.assertEqual(user3.name, "Coalesced")
+        self.assertFalse(task2.finished_at)
+        self.assertTrue(task3.finished_at)
+
+    @with_transaction()
+    def test_summary(self):
+        "Test summary"
+        pool = Pool()
+        Queue = pool.get('ir.queue')
+        transaction = Transaction()
+
+        self._push('default')
+        self._push('default')
+        self._push('other')
+        Queue.pull(transaction.database, transaction.connection, limit=2)
+
+        default, other = Queue.summary()
+        self.assertEqual(default['name'], 'default')
+        self.assertEqual(default['count'], 2)
+        self.assertEqual(default['pending'], 0)
+        self.assertEqual(default['running'], 2)
+        self.assertEqual(default['done'], 0)
+        self.assertIsNotNone(default['latency'])
+        self.assertIsNone(default['duration'])
+        self.assertEqual(other['name'], 'other')
+        self.assertEqual(other['pending'], 1)
+        self.assertEqual(Queue.summary(names=['other']), [other])
+
+    @with_transaction()
+    def test_clean(self):
+        "Test clean"
+        pool = Pool()
+        Queue = pool.get('ir.queue')
+        transaction = Transaction()
+        now = dt.datetime.now()
+
+        Queue.delete(Queue.search([]))
+        old = Queue(self._push())
+        old.finished_at = now - dt.timedelta(2)
+        old.save()
+        pending = Queue(self._push())
+        done = Queue(self._push())
+        done.finished_at = now
+        done.save()
+
+        with patch.object(transaction, 'commit') as commit:
+            Queue.clean(now - dt.timedelta(1))
+
+        commit.assert_not_called()
+        self.assertEqual(Queue.search([], order=[('id', 'ASC')]), [
+                pending, done])
+
+    @with_transaction()
+    def test_delete_by_chunk(self):
+        "Test delete by chunk"
+        pool = Pool()
+        Queue = pool.get('ir.queue')
+        table = Queue.__table__()
+        transaction = Transaction()
+
+        Queue.delete(Queue.search([]))
+        task_id, *_ = [self._push(name) for name in ['a', 'b', 'b', 'b']]
+
+        with patch.object(transaction, 'commit') as commit:
+            count = delete_by_chunk(table, table.name == 'b', size=2)
+
+        self.assertEqual(count, 3)
+        self.assertEqual(commit.call_count, 1)
+        self.assertEqual(Queue.search([]), [Queue(task_id)])
+
+    @with_transaction()
+    def test_delete_by_chunk_savepoint(self):
+        "Test delete by chunk inside a savepoint"
+        pool = Pool()
+        Queue = pool.get('ir.queue')
+        table = Queue.__table__()
+        transaction = Transaction()
+
+        Queue.delete(Queue.search([]))
+        task_id, *_ = [self._push(name) for name in ['a', 'b', 'b', 'b']]
+
+        with patch.object(transaction, 'commit') as commit, \
+                transaction.savepoint():
+            count = delete_by_chunk(table, table.name == 'b', size=2)
+
+        self.assertEqual(count, 3)
+        commit.assert_not_called()
+        self.assertEqual(Queue.search([]), [Queue(task_id)])
+
+    def test_run_tasks(self):
+        "Test run tasks in the same transaction"
+        pool = Pool(DB_NAME)
+        Queue = pool.get('ir.queue')
+        User = pool.get('res.user')
+
+        def push(user, method, *args):
+            return Queue.push('default', {
+                    'model': 'res.user',
+                    'method': method,
+                    'user': 0,
+                    'context': {},
+                    'instances': [user.id],
+                    'args': args,
+                    'kwargs': {},
+                    })
+
+        with Transaction().start(DB_NAME, 0):
+            user1, user2 = User.create([
+                    {'login': 'batch1'}, {'login': 'batch2'}])
+            task_ids = [
+                push(user1, 'write', {'name': "Batch"}),
+                push(user2, 'write', {'unknown': "Batch"}),
+                push(user2, 'write', {'name': "Batch"}),
+                ]
+
+        with self.assertLogs('trytond.worker', 'CRITICAL'):
+            run_tasks(DB_NAME, task_ids)
+
+        with Transaction().start(DB_NAME, 0):
+            self.addCleanup(self._clean, [user1.id, user2.id], task_ids)
+            user1, user2 = User.browse([user1.id, user2.id])
+            self.assertEqual(user1.name, "Batch")
+            self.assertEqual(user2.name, "Batch")
+            done, failed, done2 = Queue.browse(task_ids)
+            self.assertTrue(done.finished_at)
+            self.assertFalse(failed.finished_at)
+            self.assertTrue(done2.finished_at)
+
+    def test_run_task_retry_search(self):
+        "Test run task retries when the first search fails"
+        pool = Pool(DB_NAME)
+        Queue = pool.get('ir.queue')
+        User = pool.get('res.user')
+
+        with Transaction().start(DB_NAME, 0):
+            user, = User.create([{'login': 'retry'}])
+            task_id = Queue.push('default', {
+                    'model': 'res.user',
+                    'method': 'write',
+                    'user': 0,
+                    'context': {},
+                    'instances': [user.id],
+                    'args': ({'name': "Retried"},),
+                    'kwargs': {},
+                    })
+
+        search = Queue.search
+        calls = []
+
+        def search_failing(*args, **kwargs):
+            calls.append(args)
+            if len(calls) == 1:
+                raise backend.DatabaseOperationalError
+            return search(*args, **kwargs)
+
+        with patch.object(Queue, 'search', side_effect=search_failing), \
+                patch('trytond.worker.logger') as logger:
+            run_task(DB_NAME, task_id)
+        logger.critical.assert_not_called()
+
+        with Transaction().start(DB_NAME, 0):
+            self.addCleanup(self._clean, [user.id], [task_id])
+            self.assertEqual(User(user.id).name, "Retried")
+            self.assertTrue(Queue(task_id).finished_at)
+            self.assertEqual(len(calls), 2)
+
+    def _clean(self, user_ids, task_ids):
+        pool = Pool(DB_NAME)
+        Queue = pool.get('ir.queue')
+        User = pool.get('res.user')
+        with Transaction().start(DB_NAME, 0):
+            User.write(User.browse(user_ids), {'active': False})
+            Queue.delete(Queue.browse(task_ids))
+
+
+class TaskStatTestCase(unittest.TestCase):
+    "Test TaskStat"
+
+    def test_stats(self):
+        "Test stats"
+        stat = TaskStat()
+
+        stat.start(2)
+        stat.finish(1)
+        stat.start(4)
+        stat.finish(
+            3, expected_at=dt.datetime.now() - dt.timedelta(1), failed=True)
+        stat.retry()
+        stat.reschedule()
+
+        self.assertEqual(stat.stats(), {
+                'done': 1,
+                'failed': 1,
+                'retried': 1,
+                'rescheduled': 1,
+                'missed': 1,
+                'latency': 3,
+                'latency_max': 4,
+                'duration': 2,
+                'duration_max': 3,
+                'rate': 2,
+                })
+
+    def test_rate(self):
+        "Test rate on the window"
+        stat = TaskStat()
+
+        stat.finish(1)
+        stat._finished[0] -= stat.window + 1
+
+        self.assertEqual(stat.rate(), 0)
+
+
+class TaskListTestCase(unittest.TestCase):
+    "Test TaskList"
+
+    def test_free(self):
+        "Test free slots"
+        tasks = TaskList(2)
+
+        tasks.start()
+        self.assertEqual(tasks.free(), 1)
+        tasks.done()
+        self.assertEqual(tasks.free(), 2)
+
+    def test_wait(self):
+        "Test wait for a free slot"
+        tasks = TaskList(1)
+        tasks.start()
+
+        timer = threading.Timer(0.01, tasks.done)
+        timer.start()
+        tasks.wait()
+        timer.join()
+
+        self.assertEqual(tasks.free(), 1)
+
+
+class PullTestCase(unittest.TestCase):
+    "Test pull of worker"
+
+    def _queue(self, *results):
+        queue = Mock()
+        queue.database.name = 'db'
+        queue.pull.side_effect = list(results)
+        return queue
+
+    def test_pull(self):
+        "Test pull without limits"
+        queue = self._queue(([1, 2], 10))
+        tasks = TaskList(4)
+
+        self.assertEqual(pull(queue, tasks, 4), (True, 10))
+
+        queue.pull.assert_called_once_with(None, limit=4, exclude=[])
+        self.assertEqual(tasks.free(), 2)
+        self.assertEqual(tasks.count(('db', 'db')), 2)
+
+    def test_pull_size(self):
+        "Test pull by batch"
+        queue = self._queue(([1, 2, 3], None))
+        tasks = TaskList(4)
+
+        self.assertEqual(pull(queue, tasks, 2, size=2), (True, None))
+
+        queue.pull.assert_called_once_with(None, limit=4, exclude=[])
+        self.assertEqual(queue.run.call_args_list, [
+                call([1, 2], callback=ANY),
+                call([3], callback=ANY),
+                ])
+        self.assertEqual(tasks.free(), 2)
+
+    def test_pull_limits(self):
+        "Test pull with limits per queue name"
+        queue = self._queue(([1], None), ([2, 3], None))
+        tasks = TaskList(4)
+        tasks.start(('db', 'db'), ('queue', 'email'))
+
+        self.assertEqual(
+            pull(queue, tasks, 3, limits={'email': 2}), (True, None))
+
+        self.assertEqual(queue.pull.call_args_list, [
+                call('email', limit=1, exclude=None),
+                call(None, limit=2, exclude=['email']),
+                ])
+        self.assertEqual(tasks.count(('queue', 'email')), 2)
+
+    def test_pull_limits_reached(self):
+        "Test pull with limit reached"
+        queue = self._queue()
+        tasks = TaskList(4)
+        tasks.start(('db', 'db'), ('queue', 'email'))
+
+        self.assertEqual(
+            pull(queue, tasks, 3, names=['email'], limits={'email': 1}),
+            (False, None))
+
+        queue.pull.assert_not_called()
+
+    def test_pull_names(self):
+        "Test pull with names"
+        queue = self._queue(([1], None), ([], 5))
+        tasks = TaskList(4)
+
+        self.assertEqual(
+            pull(queue, tasks, 3, names=['email', 'default'],
+                limits={'email': 2, 'other': 1}),
+            (True, 5))
+
+        self.assertEqual(queue.pull.call_args_list, [
+                call('email', limit=2, exclude=None),
+                call(['default'], limit=2, exclude=['email']),
+                ])
+
+    def test_pull_limits_database_named_as_queue(self):
+        "Test pull with limits on a database named as a queue"
+        queue = self._queue(([1], None), ([2, 3], None))
+        queue.database.name = 'email'
+        tasks = TaskList(4)
+
+        self.assertEqual(
+            pull(queue, tasks, 3, limits={'email': 2}), (True, None))
+
+        self.assertEqual(queue.pull.call_args_list, [
+                call('email', limit=2, exclude=None),
+                call(None, limit=2, exclude=['email']),
+                ])
+        self.assertEqual(tasks.count(('queue', 'email')), 1)
+        self.assertEqual(tasks.count(('db', 'email')), 3)
+
+    def test_done_wakeup(self):
+        "Test done wakes up for limited keys"
+        tasks = TaskList(4, wakeup=[('queue', 'email')])
+        self.addCleanup(tasks.close)
+        tasks.start(('db', 'db'), ('queue', 'email'))
+        tasks.start(('db', 'db'))
+
+        tasks.done((('db', 'db'),))
+        with self.assertRaises(BlockingIOError):
+            os.read(tasks.fileno(), 1)
+        tasks.done((('db', 'db'), ('queue', 'email')))
+        self.assertEqual(os.read(tasks.fileno(), 1), b'\0')
@@ -4,10 +4,12 @@
 import base64
 import json
 import unittest
+from unittest.mock import patch
 
 from werkzeug.test import Client
 from werkzeug.wrappers import Response
 
+from trytond.ir import routes
 from trytond.pool import Pool
 from trytond.tests.test_tryton import DB_NAME, activate_module, drop_db
 from trytond.transaction import Transaction
@@ -196,3 +198,69 @@ class RoutesTestCase(unittest.TestCase):
         self.assertEqual(response_std.status_code, 200)
         self.assertEqual(response_locale.status_code, 200)
         self.assertNotEqual(response_std.data, response_locale.data)
+
+    def test_data_stream(self):
+        "Test GET data streamed"
+        c = Client(app, Response)
+
+        response = c.get(
+            self.data_url('ir.lang'), headers=self.auth_headers,
+            query_string=[('f', 'code'), ('f', 'name'), ('o', 'code')])
+        response_stream = c.get(
+            self.data_url('ir.lang'), headers=self.auth_headers,
+            query_string=[
+                ('f', 'code'), ('f', 'name'), ('o', 'code'), ('stream', 1)])
+
+        self.assertEqual(response_stream.status_code, 200)
+        self.assertNotIn('Content-Length', response_stream.headers)
+        self.assertEqual(response_stream.data, response.data)
+
+    def test_data_stream_page(self):
+        "Test GET data streamed with page"
+        c = Client(app, Response)
+
+        response = c.get(
+            self.data_url('ir.lang'), headers=self.auth_headers,
+            query_string=[
+                ('f', 'code'), ('s', 5), ('p', 1), ('o', 'code'),
+                ('stream', 1)])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data.splitlines()), 5 + 1)
+
+    def test_data_stream_ids(self):
+        "Test GET data streamed with ids"
+        c = Client(app, Response)
+
+        response = c.get(
+            self.data_url('res.user'), headers=self.auth_headers,
+            query_string=[
+                ('f', 'name'), ('d', json.dumps([1])), ('stream', 1)])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, b'Nom\r\nAdministrator\r\n')
+
+    def test_data_stream_close(self):
+        "Test closing the data stream releases its transaction"
+        c = Client(app, Response)
+        transactions = list(Transaction._local.transactions)
+
+        with patch.object(routes, 'STREAM_CHUNK_SIZE', 1):
+            response = c.get(
+                self.data_url('ir.lang'), headers=self.auth_headers,
+                query_string=[('f', 'code'), ('stream', 1)], buffered=False)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(Transaction._local.transactions, transactions)
+            response.close()
+
+        self.assertEqual(Transaction._local.transactions, transactions)
+
+    def test_data_stream_wrong_field(self):
+        "Test GET data streamed with wrong field"
+        c = Client(app, Response)
+
+        response = c.get(
+            self.data_url('res.user'), headers=self.auth_headers,
+            query_string=[('f', 'foo'), ('stream', 1)])
+
+        self.assertEqual(response.status_code, 400)
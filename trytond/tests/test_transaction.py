@@ -3,7 +3,9 @@
 import unittest
 from unittest.mock import Mock
 
-from trytond.tests.test_tryton import CONTEXT, DB_NAME, USER, activate_module
+from trytond.pool import Pool
+from trytond.tests.test_tryton import (
+    CONTEXT, DB_NAME, USER, activate_module, with_transaction)
 from trytond.transaction import Transaction
 
 
@@ -18,6 +20,36 @@ def empty_transaction(*args, **kwargs):
         return True
 
 
+class _QueueDataManager:
+
+    def __init__(self):
+        self.queue = []
+
+    def put(self, value):
+        self.queue.append(value)
+
+    def savepoint(self, trans):
+        return len(self.queue)
+
+    def rollback_savepoint(self, trans, state):
+        del self.queue[state:]
+
+    def tpc_begin(self, trans):
+        pass
+
+    def commit(self, trans):
+        pass
+
+    def tpc_vote(self, trans):
+        pass
+
+    def tpc_finish(self, trans):
+        self.queue = []
+
+    def tpc_abort(self, trans):
+        self.queue = []
+
+
 class TransactionTestCase(unittest.TestCase):
     'Test the Transaction Context manager'
 
@@ -121,3 +153,74 @@ class TransactionTestCase(unittest.TestCase):
         dm.tpc_vote.assert_not_called()
         dm.tpc_abort.assert_called_once_with(transaction)
         dm.tpc_finish.assert_not_called()
+
+    @with_transaction()
+    def test_savepoint(self):
+        "Test savepoint"
+        pool = Pool()
+        Model = pool.get('test.model')
+        transaction = Transaction()
+
+        with transaction.savepoint():
+            record, = Model.create([{'name': "Kept"}])
+
+        self.assertEqual(Model.search([]), [record])
+
+    @with_transaction()
+    def test_savepoint_rollback(self):
+        "Test savepoint rollback"
+        pool = Pool()
+        Model = pool.get('test.model')
+        transaction = Transaction()
+        dm = Mock()
+        record, = Model.create([{'name': "Kept"}])
+
+        with self.assertRaises(ValueError):
+            with transaction.savepoint():
+                Model.create([{'name': "Rollbacked"}])
+                Model.write([record], {'name': "Changed"})
+                transaction.join(dm)
+                raise ValueError
+
+        self.assertEqual(Model.search([]), [record])
+        self.assertEqual(record.name, "Kept")
+        self.assertEqual(
+            transaction.create_records[Model.__name__], {record.id})
+        dm.tpc_abort.assert_called_once_with(transaction)
+        self.assertNotIn(dm, transaction._datamanagers)
+
+    @with_transaction()
+    def test_savepoint_rollback_datamanager(self):
+        "Test savepoint rollback restores the data managers joined before"
+        transaction = Transaction()
+        dm = transaction.join(_QueueDataManager())
+        dm.put('kept')
+
+        with self.assertRaises(ValueError):
+            with transaction.savepoint():
+                dm.put('rollbacked')
+                raise ValueError
+
+        self.assertEqual(dm.queue, ['kept'])
+        self.assertIn(dm, transaction._datamanagers)
+
+    @with_transaction()
+    def test_savepoint_datamanager_not_supported(self):
+        "Test savepoint with data manager without savepoint support"
+        transaction = Transaction()
+        dm = Mock(spec=['tpc_begin', 'commit', 'tpc_vote', 'tpc_finish',
+                'tpc_abort'])
+        transaction.join(dm)
+
+        with self.assertRaises(NotImplementedError):
+            with transaction.savepoint():
+                pass
+
+    @with_transaction()
+    def test_savepoint_commit(self):
+        "Test commit inside savepoint"
+        transaction = Transaction()
+
+        with transaction.savepoint():
+            with self.assertRaises(RuntimeError):
+                transaction.commit()
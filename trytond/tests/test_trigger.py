@@ -5,7 +5,8 @@ import datetime
 import unittest
 from itertools import combinations
 
-from trytond.ir.exceptions import TriggerConditionError
+from trytond.ir.exceptions import (
+    TriggerConditionError, TriggerDomainError)
 from trytond.model.exceptions import SQLConstraintError
 from trytond.pool import Pool
 from trytond.pyson import Eval, PYSONEncoder
@@ -73,6 +74,14 @@ class TriggerTestCase(unittest.TestCase):
             [condition_values])
         transaction.rollback()
 
+        # check_domain
+        for domain in ['=', '"foo"']:
+            domain_values = values.copy()
+            domain_values['domain'] = domain
+            self.assertRaises(TriggerDomainError, Trigger.create,
+                [domain_values])
+            transaction.rollback()
+
         # Restart the cache on the get_triggers method of ir.trigger
         Trigger._get_triggers_cache.clear()
 
@@ -479,3 +488,201 @@ class TriggerTestCase(unittest.TestCase):
 
         # Restart the cache on the get_triggers method of ir.trigger
         Trigger._get_triggers_cache.clear()
+
+    @with_transaction()
+    def test_log_clean(self):
+        "Test cleaning trigger logs"
+        pool = Pool()
+        Model = pool.get('ir.model')
+        Trigger = pool.get('ir.trigger')
+        TriggerLog = pool.get('ir.trigger.log')
+        now = datetime.datetime.now()
+
+        model, = Model.search([
+                ('model', '=', 'test.triggered'),
+                ])
+        values = {
+            'name': 'Test',
+            'model': model.id,
+            'on_time': True,
+            'condition': 'true',
+            'action': 'test.trigger_action|trigger',
+            }
+        limited, delayed, unlimited = Trigger.create([
+                dict(values, limit_number=1),
+                dict(values, minimum_time_delay=datetime.timedelta(1)),
+                values,
+                ])
+        logs = TriggerLog.create([
+                {'trigger': t.id, 'record_id': 1}
+                for t in [limited, delayed, unlimited]])
+        kept = logs[:2]
+
+        TriggerLog.clean(date=now - datetime.timedelta(1))
+        self.assertEqual(TriggerLog.search([]), logs)
+
+        TriggerLog.clean(date=now + datetime.timedelta(1))
+        self.assertEqual(TriggerLog.search([]), kept)
+
+    @with_transaction()
+    def test_log_clean_default(self):
+        "Test cleaning trigger logs keeps recent logs by default"
+        pool = Pool()
+        Model = pool.get('ir.model')
+        Trigger = pool.get('ir.trigger')
+        TriggerLog = pool.get('ir.trigger.log')
+
+        model, = Model.search([
+                ('model', '=', 'test.triggered'),
+                ])
+        trigger, = Trigger.create([{
+                    'name': 'Test',
+                    'model': model.id,
+                    'on_time': True,
+                    'condition': 'true',
+                    'action': 'test.trigger_action|trigger',
+                    }])
+        log, = TriggerLog.create([{'trigger': trigger.id, 'record_id': 1}])
+
+        TriggerLog.clean()
+        self.assertEqual(TriggerLog.search([]), [log])
+
+    @with_transaction()
+    def test_on_time_domain(self):
+        "Test on_time with domain"
+        pool = Pool()
+        Model = pool.get('ir.model')
+        Trigger = pool.get('ir.trigger')
+        Triggered = pool.get('test.triggered')
+
+        model, = Model.search([
+                ('model', '=', 'test.triggered'),
+                ])
+
+        trigger, = Trigger.create([{
+                    'name': 'Test',
+                    'model': model.id,
+                    'on_time': True,
+                    'condition': 'true',
+                    'domain': PYSONEncoder().encode([
+                            ('name', '=', Eval('context', {}).get(
+                                    'name', 'Bar')),
+                            ]),
+                    'action': 'test.trigger_action|trigger',
+                    }])
+
+        triggered, _ = Triggered.create([{
+                    'name': 'Bar',
+                    }, {
+                    'name': 'Foo',
+                    }])
+        Trigger.trigger_time()
+        self.assertEqual(TRIGGER_LOGS, [([triggered], trigger)])
+        TRIGGER_LOGS.pop()
+
+        # Domain with condition
+        condition = PYSONEncoder().encode(
+            Eval('self', {}).get('name') == 'Foo')
+        Trigger.write([trigger], {
+                'condition': condition,
+                })
+        Trigger.trigger_time()
+        self.assertEqual(TRIGGER_LOGS, [])
+
+        # Restart the cache on the get_triggers method of ir.trigger
+        Trigger._get_triggers_cache.clear()
+
+    @with_transaction()
+    def test_trigger_action_domain(self):
+        "Test trigger action with domain"
+        pool = Pool()
+        Model = pool.get('ir.model')
+        Trigger = pool.get('ir.trigger')
+        Triggered = pool.get('test.triggered')
+
+        model, = Model.search([
+                ('model', '=', 'test.triggered'),
+                ])
+
+        trigger, = Trigger.create([{
+                    'name': 'Test',
+                    'model': model.id,
+                    'on_create': True,
+                    'condition': 'true',
+                    'domain': PYSONEncoder().encode([
+                            ('name', '=', 'Bar'),
+                            ]),
+                    'action': 'test.trigger_action|trigger',
+                    }])
+
+        triggered, _ = Triggered.create([{
+                    'name': 'Bar',
+                    }, {
+                    'name': 'Foo',
+                    }])
+        self.run_tasks()
+        self.assertEqual(TRIGGER_LOGS, [([triggered], trigger)])
+        TRIGGER_LOGS.pop()
+
+        # Restart the cache on the get_triggers method of ir.trigger
+        Trigger._get_triggers_cache.clear()
+
+    @with_transaction()
+    def test_trigger_action_domain_inactive(self):
+        "Test trigger action with domain on inactive record"
+        pool = Pool()
+        Model = pool.get('ir.model')
+        Trigger = pool.get('ir.trigger')
+        Triggered = pool.get('test.triggered')
+
+        model, = Model.search([
+                ('model', '=', 'test.triggered'),
+                ])
+
+        trigger, = Trigger.create([{
+                    'name': 'Test',
+                    'model': model.id,
+                    'on_write': True,
+                    'condition': PYSONEncoder().encode(
+                        ~Eval('self', {}).get('active')),
+                    'domain': PYSONEncoder().encode([
+                            ('name', '=', 'Bar'),
+                            ]),
+                    'action': 'test.trigger_action|trigger',
+                    }])
+
+        triggered, = Triggered.create([{
+                    'name': 'Bar',
+                    }])
+        Triggered.write([triggered], {'active': False})
+        self.run_tasks()
+        self.assertEqual(TRIGGER_LOGS, [([triggered], trigger)])
+        TRIGGER_LOGS.pop()
+
+        # Restart the cache on the get_triggers method of ir.trigger
+        Trigger._get_triggers_cache.clear()
+
+    @with_transaction()
+    def test_exceeded_record_ids(self):
+        "Test exceeded record ids are restricted to the ids"
+        pool = Pool()
+        Model = pool.get('ir.model')
+        Trigger = pool.get('ir.trigger')
+        TriggerLog = pool.get('ir.trigger.log')
+
+        model, = Model.search([
+                ('model', '=', 'test.triggered'),
+                ])
+        trigger, = Trigger.create([{
+                    'name': 'Test',
+                    'model': model.id,
+                    'on_time': True,
+                    'condition': 'true',
+                    'limit_number': 1,
+                    'action': 'test.trigger_action|trigger',
+                    }])
+        TriggerLog.create([
+                {'trigger': trigger.id, 'record_id': i} for i in [1, 2]])
+
+        self.assertEqual(trigger._exceeded_record_ids([1, 3]), {1})
+        self.assertEqual(trigger._exceeded_record_ids([1, 2]), {1, 2})
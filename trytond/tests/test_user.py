@@ -2,11 +2,13 @@
 # repository contains the full copyright notices and license terms.
 import datetime
 import os
+import time
 import unittest
 from contextlib import contextmanager
 from unittest.mock import ANY, Mock, patch
 
 from trytond.config import config
+from trytond.exceptions import RateLimitException
 from trytond.pool import Pool
 from trytond.res import user as user_module
 from trytond.res.user import PasswordError
@@ -85,6 +87,41 @@ class UserTestCase(unittest.TestCase):
         self.create_user('user', '12345')
         self.check_user('user', '12345')
 
+    @with_transaction()
+    def test_login_password_cache(self):
+        "Test login password uses the cache"
+        pool = Pool()
+        User = pool.get('res.user')
+        self.create_user('user', '12345')
+        user_id = User.get_login('user', {'password': '12345'})
+
+        with patch.object(User, 'check_password') as check_password:
+            self.assertEqual(
+                User.get_login('user', {'password': '12345'}), user_id)
+            check_password.assert_not_called()
+
+    @with_transaction()
+    def test_login_password_cache_wrong(self):
+        "Test login password cache with wrong password"
+        pool = Pool()
+        User = pool.get('res.user')
+        self.create_user('user', '12345')
+        User.get_login('user', {'password': '12345'})
+
+        self.assertFalse(User.get_login('user', {'password': '123456'}))
+
+    @with_transaction()
+    def test_login_password_cache_changed(self):
+        "Test login password cache after password change"
+        pool = Pool()
+        User = pool.get('res.user')
+        user = self.create_user('user', '12345')
+        User.get_login('user', {'password': '12345'})
+
+        User.write([user], {'password': '67890'})
+
+        self.assertFalse(User.get_login('user', {'password': '12345'}))
+
     @with_transaction()
     def test_read_password_hash(self):
         "Test password_hash can not be read"
@@ -243,6 +280,73 @@ class UserTestCase(unittest.TestCase):
         self.check_user('user', '12345')
         self.assertEqual(LoginAttempt.count('user', None), 1)
 
+    @with_transaction()
+    def test_login_attempt_in_memory(self):
+        "Test login attempts are counted without the table"
+        pool = Pool()
+        LoginAttempt = pool.get('res.user.login.attempt')
+        table = LoginAttempt.__table__()
+        cursor = Transaction().connection.cursor()
+
+        LoginAttempt.add('user')
+        cursor.execute(*table.delete())
+
+        self.assertEqual(LoginAttempt.count('user'), 1)
+        self.assertEqual(LoginAttempt.count_ip(), 1)
+
+    @with_transaction()
+    def test_login_attempt_evicted(self):
+        "Test login attempts are read from the table when evicted"
+        pool = Pool()
+        LoginAttempt = pool.get('res.user.login.attempt')
+
+        LoginAttempt.add('user')
+        LoginAttempt.add('user')
+
+        with patch.object(
+                LoginAttempt._attempts_cache, 'get', return_value=None):
+            self.assertEqual(LoginAttempt.count('user'), 2)
+            self.assertEqual(LoginAttempt.count_ip(), 2)
+
+    @with_transaction()
+    def test_login_attempt_remove(self):
+        "Test remove login attempts"
+        pool = Pool()
+        LoginAttempt = pool.get('res.user.login.attempt')
+
+        LoginAttempt.add('user')
+        LoginAttempt.add('other')
+        LoginAttempt.remove('user')
+
+        self.assertEqual(LoginAttempt.count('user'), 0)
+        self.assertEqual(LoginAttempt.count('other'), 1)
+        self.assertEqual(LoginAttempt.count_ip(), 1)
+
+    @with_transaction()
+    def test_login_attempt_window(self):
+        "Test login attempts are counted in the window"
+        pool = Pool()
+        LoginAttempt = pool.get('res.user.login.attempt')
+        timeout = config.getint('session', 'timeout')
+
+        LoginAttempt.add('user')
+        with patch('time.time', return_value=time.time() + timeout + 1):
+            self.assertEqual(LoginAttempt.count('user'), 0)
+
+    @with_transaction()
+    def test_login_attempt_rate_limit(self):
+        "Test login attempts rate limit"
+        pool = Pool()
+        User = pool.get('res.user')
+        LoginAttempt = pool.get('res.user.login.attempt')
+        self.create_user('user', '12345')
+
+        for _ in range(config.getint('session', 'max_attempt') + 1):
+            LoginAttempt.add('user')
+
+        with self.assertRaises(RateLimitException):
+            User.get_login('user', {'password': '12345'})
+
     @with_transaction()
     def test_bad_authentication_valid_cookie(self):
         "Test the logging of log in attempts with a valid cookie"
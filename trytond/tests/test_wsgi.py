@@ -1,12 +1,14 @@
 # This file is part of Tryton.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
 
+import gzip
 import unittest
 from unittest.mock import Mock, sentinel
 
 from werkzeug.test import Client
 from werkzeug.wrappers import Response
 
+from trytond.config import config
 from trytond.exceptions import TrytonException
 from trytond.wsgi import TrytondWSGI
 
@@ -110,3 +112,111 @@ class WSGIAppTestCase(unittest.TestCase):
 
         self.assertEqual(next(response.response), b'baz')
         self.assertEqual(response.status, "418 I'M A TEAPOT")
+
+
+class WSGICompressionTestCase(unittest.TestCase):
+    "Test WSGI compression"
+
+    def setUp(self):
+        super().setUp()
+        self.app = TrytondWSGI()
+        self.client = Client(self.app, Response)
+        self.data = b'{"result": [%s]}' % b','.join(
+            b'"foo"' for _ in range(1000))
+
+    def route(self, response):
+        @self.app.route('/test')
+        def _route(request):
+            return response
+
+    def test_compress(self):
+        "Test response is compressed"
+        self.route(Response(self.data, mimetype='application/json'))
+
+        response = self.client.get(
+            '/test', headers=[('Accept-Encoding', 'gzip, deflate')])
+
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(response.headers['Vary'], 'Accept-Encoding')
+        self.assertLess(
+            int(response.headers['Content-Length']), len(self.data))
+        self.assertEqual(gzip.decompress(response.get_data()), self.data)
+
+    def test_compress_stream(self):
+        "Test streamed response is compressed"
+        self.route(Response(
+                iter([self.data, self.data]), mimetype='application/json'))
+
+        response = self.client.get(
+            '/test', headers=[('Accept-Encoding', 'gzip')])
+
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertNotIn('Content-Length', response.headers)
+        self.assertEqual(
+            gzip.decompress(response.get_data()), self.data + self.data)
+
+    def test_compress_etag(self):
+        "Test entity tag of compressed response"
+        response = Response(self.data, mimetype='application/json')
+        response.set_etag('foo')
+        self.route(response)
+
+        response = self.client.get(
+            '/test', headers=[('Accept-Encoding', 'gzip')])
+
+        self.assertEqual(response.get_etag(), ('foo-gzip', False))
+
+    def test_compress_not_accepted(self):
+        "Test response is not compressed if not accepted"
+        self.route(Response(self.data, mimetype='application/json'))
+
+        response = self.client.get(
+            '/test', headers=[('Accept-Encoding', 'gzip;q=0')])
+
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(response.get_data(), self.data)
+
+    def test_compress_small(self):
+        "Test small response is not compressed"
+        self.route(Response(b'{}', mimetype='application/json'))
+
+        response = self.client.get(
+            '/test', headers=[('Accept-Encoding', 'gzip')])
+
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.get_data(), b'{}')
+
+    def test_compress_binary(self):
+        "Test binary response is not compressed"
+        self.route(Response(self.data, mimetype='application/pdf'))
+
+        response = self.client.get(
+            '/test', headers=[('Accept-Encoding', 'gzip')])
+
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertNotIn('Vary', response.headers)
+
+    def test_compress_encoded(self):
+        "Test encoded response is not compressed again"
+        data = gzip.compress(self.data)
+        self.route(Response(
+                data, mimetype='application/json',
+                headers=[('Content-Encoding', 'gzip')]))
+
+        response = self.client.get(
+            '/test', headers=[('Accept-Encoding', 'gzip')])
+
+        self.assertEqual(response.get_data(), data)
+
+    def test_compress_disabled(self):
+        "Test response is not compressed when disabled"
+        self.route(Response(self.data, mimetype='application/json'))
+        level = config.get('web', 'compression_level')
+        config.set('web', 'compression_level', '0')
+        self.addCleanup(config.set, 'web', 'compression_level', level)
+
+        response = self.client.get(
+            '/test', headers=[('Accept-Encoding', 'gzip')])
+
+        self.assertNotIn('Content-Encoding', response.headers)
@@ -1,6 +1,6 @@
 # This file is part of Tryton.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
-from trytond.model import ModelSQL, fields
+from trytond.model import DeactivableMixin, ModelSQL, fields
 from trytond.pool import Pool, PoolMeta
 
 TRIGGER_LOGS = []
@@ -16,7 +16,7 @@ class Trigger(metaclass=PoolMeta):
             ('test.trigger_action|trigger', "Test Trigger"))
 
 
-class Triggered(ModelSQL):
+class Triggered(DeactivableMixin, ModelSQL):
     'Triggered'
     __name__ = 'test.triggered'
     name = fields.Char('Name')
@@ -7,11 +7,11 @@ except ImportError:
 
 from .decimal_ import decistmt
 from .misc import (
-    escape_wildcard, file_open, find_dir, find_path, firstline,
-    get_smtp_server, grouped_slice, is_full_text, is_instance_method,
-    lstrip_wildcard, reduce_domain, reduce_ids, remove_forbidden_chars,
-    resolve, rstrip_wildcard, slugify, sortable_values, sql_pairing,
-    strip_wildcard, unescape_wildcard)
+    delete_by_chunk, escape_wildcard, file_open, find_dir, find_path,
+    firstline, get_smtp_server, grouped_slice, is_full_text,
+    is_instance_method, lstrip_wildcard, reduce_domain, reduce_ids,
+    remove_forbidden_chars, resolve, rstrip_wildcard, slugify,
+    sortable_values, sql_pairing, strip_wildcard, unescape_wildcard)
 
 
 class ClassProperty(property):
@@ -34,6 +34,7 @@ __all__ = [
     cached_property,
     cursor_dict,
     decistmt,
+    delete_by_chunk,
     escape_wildcard,
     file_open,
     find_dir,
@@ -189,6 +189,31 @@ def grouped_slice(records, count=None):
         yield islice(records, i, i + count)
 
 
+def delete_by_chunk(table, where, size=None):
+    """Delete the rows of table matching where by chunks of size rows
+    and commit the transaction between each chunk unless it is inside a
+    savepoint.
+    Return the number of deleted rows."""
+    from trytond.config import config
+    from trytond.transaction import Transaction
+    if size is None:
+        size = config.getint('database', 'clean_size', default=10000)
+    size = max(1, size)
+    transaction = Transaction()
+    cursor = transaction.connection.cursor()
+    count = 0
+    while True:
+        cursor.execute(*table.delete(
+                where=table.id.in_(
+                    table.select(table.id, where=where, limit=size))))
+        count += cursor.rowcount
+        if cursor.rowcount < size:
+            break
+        if not transaction._savepoints:
+            transaction.commit()
+    return count
+
+
 def is_instance_method(cls, method):
     for klass in cls.__mro__:
         type_ = klass.__dict__.get(method)
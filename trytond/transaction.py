@@ -3,6 +3,8 @@
 import logging
 import time
 from collections import defaultdict
+from contextlib import contextmanager
+from itertools import count
 from threading import local
 
 from sql import Flavor
@@ -14,6 +16,7 @@ _cache_transaction = config.getint('cache', 'transaction')
 _cache_model = config.getint('cache', 'model')
 _cache_record = config.getint('cache', 'record')
 logger = logging.getLogger(__name__)
+_savepoint_ids = count()
 
 
 def record_cache_size(transaction):
@@ -136,6 +139,7 @@ class Transaction(object):
         self.timestamp = {}
         self.counter = 0
         self._datamanagers = []
+        self._savepoints = 0
         if database_name:
             from trytond.cache import Cache
             try:
@@ -231,6 +235,8 @@ class Transaction(object):
 
     def commit(self):
         from trytond.cache import Cache
+        if self._savepoints:
+            raise RuntimeError("Can not commit inside a savepoint")
         try:
             if self._datamanagers:
                 for datamanager in self._datamanagers:
@@ -265,6 +271,58 @@ class Transaction(object):
         Cache.rollback(self)
         self.connection.rollback()
 
+    @contextmanager
+    def savepoint(self):
+        "Rollback the changes of the block if it raises an exception"
+        for datamanager in self._datamanagers:
+            if not hasattr(datamanager, 'savepoint'):
+                raise NotImplementedError(
+                    "%r does not support savepoint" % datamanager)
+        name = 'savepoint_%s' % next(_savepoint_ids)
+        self.database.savepoint(self.connection, name)
+        records = [
+            {k: set(v) for k, v in records.items()}
+            for records in [
+                self.create_records, self.delete_records,
+                self.trigger_records]]
+        check_warnings = set(self.check_warnings)
+        timestamp = (
+            dict(self.timestamp) if self.timestamp is not None else None)
+        datamanagers = [
+            (datamanager, datamanager.savepoint(self))
+            for datamanager in self._datamanagers]
+        atexit = len(self._atexit)
+        tasks = len(self.tasks)
+        self._savepoints += 1
+        try:
+            yield
+        except BaseException:
+            self.database.rollback_savepoint(self.connection, name)
+            for cache in self.cache.values():
+                cache.clear()
+            self.counter += 1
+            joined = [d for d, _ in datamanagers]
+            for datamanager in self._datamanagers:
+                if datamanager not in joined:
+                    datamanager.tpc_abort(self)
+            for datamanager, state in datamanagers:
+                datamanager.rollback_savepoint(self, state)
+            for current, previous in zip([
+                        self.create_records, self.delete_records,
+                        self.trigger_records], records):
+                current.clear()
+                current.update(previous)
+            self.check_warnings = check_warnings
+            self.timestamp = timestamp
+            self._datamanagers = joined
+            del self._atexit[atexit:]
+            del self.tasks[tasks:]
+            raise
+        else:
+            self.database.release_savepoint(self.connection, name)
+        finally:
+            self._savepoints -= 1
+
     def join(self, datamanager):
         try:
             idx = self._datamanagers.index(datamanager)
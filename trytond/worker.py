@@ -2,12 +2,18 @@
 # this repository contains the full copyright notices and license terms.
 import datetime as dt
 import logging
+import math
+import os
 import random
 import selectors
 import signal
+import threading
 import time
+from collections import Counter, defaultdict, deque
+from functools import partial
 from multiprocessing import Pool as MPool
 from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
 
 from sql import Flavor
 
@@ -16,10 +22,13 @@ from trytond.config import config
 from trytond.exceptions import UserError, UserWarning
 from trytond.pool import Pool
 from trytond.status import processing
+from trytond.tools import grouped_slice
 from trytond.transaction import Transaction
 
 __all__ = ['work']
 logger = logging.getLogger(__name__)
+tasks_per_transaction = config.getint(
+    'queue', 'tasks_per_transaction', default=1)
 
 
 class Queue(object):
@@ -28,25 +37,224 @@ class Queue(object):
         self.connection = self.database.get_connection(autocommit=True)
         self.mpool = mpool
 
-    def pull(self, name=None):
+    def pull(self, name=None, limit=1, exclude=None):
         database_list = Pool.database_list()
         pool = Pool(self.database.name)
         if self.database.name not in database_list:
             with Transaction().start(self.database.name, 0, readonly=True):
                 pool.init()
         Queue = pool.get('ir.queue')
-        return Queue.pull(self.database, self.connection, name=name)
+        return Queue.pull(
+            self.database, self.connection, name=name, limit=limit,
+            exclude=exclude)
 
-    def run(self, task_id):
-        return self.mpool.apply_async(run_task, (self.database.name, task_id))
+    def run(self, task_ids, callback=None):
+        return self.mpool.apply_async(
+            run_tasks, (self.database.name, task_ids),
+            callback=callback, error_callback=callback)
 
 
-class TaskList(list):
-    def filter(self):
-        for t in list(self):
-            if t.ready():
-                self.remove(t)
-        return self
+class TaskList(object):
+    "Count the running tasks and notify when one is done"
+
+    def __init__(self, size, wakeup=()):
+        self.size = size
+        self.running = 0
+        # The keys are tuples ('db', name) or ('queue', name) to not mix
+        # a database with a queue of the same name
+        self.counts = Counter()
+        # The keys for which the selector must be woken up when a task is done
+        self.wakeup = set(wakeup)
+        self._condition = threading.Condition()
+        self._read, self._write = os.pipe()
+        os.set_blocking(self._read, False)
+        os.set_blocking(self._write, False)
+
+    def fileno(self):
+        return self._read
+
+    def close(self):
+        os.close(self._read)
+        os.close(self._write)
+
+    def free(self):
+        with self._condition:
+            return self.size - self.running
+
+    def count(self, key):
+        with self._condition:
+            return self.counts[key]
+
+    def start(self, *keys):
+        with self._condition:
+            self.running += 1
+            self.counts.update(keys)
+
+    def done(self, keys=(), result=None):
+        with self._condition:
+            self.running -= 1
+            self.counts.subtract(keys)
+            self._condition.notify()
+        if self.wakeup.intersection(keys):
+            try:
+                os.write(self._write, b'\0')
+            except BlockingIOError:
+                pass
+
+    def clear(self):
+        "Consume the wake up notifications"
+        try:
+            while os.read(self._read, 1024):
+                pass
+        except BlockingIOError:
+            pass
+
+    def wait(self):
+        "Wait until a slot is free"
+        with self._condition:
+            while self.running >= self.size:
+                self._condition.wait()
+
+
+class TaskStat(object):
+    "Statistics of the tasks of a queue calling the same method"
+    window = 60  # seconds to compute the throughput
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.done = 0
+        self.failed = 0
+        self.retried = 0
+        self.rescheduled = 0
+        self.missed = 0
+        self.latency = 0
+        self.latency_max = 0
+        self.duration = 0
+        self.duration_max = 0
+        self._finished = deque()
+
+    def start(self, latency):
+        "Record the latency in seconds between the enqueue and the start"
+        with self._lock:
+            self.latency += latency
+            self.latency_max = max(self.latency_max, latency)
+
+    def finish(self, duration, expected_at=None, failed=False):
+        "Record the duration in seconds of the task"
+        now = time.monotonic()
+        with self._lock:
+            if failed:
+                self.failed += 1
+            else:
+                self.done += 1
+            if expected_at and dt.datetime.now() > expected_at:
+                self.missed += 1
+            self.duration += duration
+            self.duration_max = max(self.duration_max, duration)
+            self._finished.append(now)
+            self._trim(now)
+
+    def retry(self):
+        with self._lock:
+            self.retried += 1
+
+    def reschedule(self):
+        with self._lock:
+            self.rescheduled += 1
+
+    def _trim(self, now):
+        while self._finished and self._finished[0] < now - self.window:
+            self._finished.popleft()
+
+    def rate(self):
+        "Return the number of tasks finished per minute"
+        with self._lock:
+            self._trim(time.monotonic())
+            return len(self._finished) * 60 / self.window
+
+    def stats(self):
+        rate = self.rate()
+        with self._lock:
+            count = self.done + self.failed
+            return {
+                'done': self.done,
+                'failed': self.failed,
+                'retried': self.retried,
+                'rescheduled': self.rescheduled,
+                'missed': self.missed,
+                'latency': self.latency / count if count else 0,
+                'latency_max': self.latency_max,
+                'duration': self.duration / count if count else 0,
+                'duration_max': self.duration_max,
+                'rate': rate,
+                }
+
+
+_task_stats = defaultdict(TaskStat)
+
+
+def task_latency(task):
+    "Return the seconds between the enqueue (or schedule) and now"
+    latency = dt.datetime.now() - (task.scheduled_at or task.enqueued_at)
+    return max(latency.total_seconds(), 0)
+
+
+def task_stat(database_name, task):
+    "Return the statistics for the task"
+    return _task_stats[
+        database_name, task.name,
+        '%s.%s' % (task.data['model'], task.data['method'])]
+
+
+def stats():
+    "Yield the statistics of the tasks run by the process"
+    for (database_name, name, method), stat in list(_task_stats.items()):
+        yield dict(
+            stat.stats(), database=database_name, name=name, method=method)
+
+
+def get_limits():
+    "Return the maximum number of concurrent tasks per queue name"
+    limits = {}
+    if config.has_section('queue concurrency'):
+        for name in config.options('queue concurrency'):
+            limits[name] = config.getint('queue concurrency', name)
+    return limits
+
+
+def pull(queue, tasks, limit, names=None, limits=None, size=1):
+    """Pull tasks from the queue and run them by batch of size for at most
+    limit slots without exceeding the limits per queue name.
+    Return if tasks have been pulled and the next timeout."""
+    database_name = queue.database.name
+    limits = limits or {}
+    pulled, timeout = 0, None
+
+    def run(keys, name, limit, exclude=None):
+        nonlocal pulled, timeout
+        task_ids, next_ = queue.pull(
+            name, limit=limit * size, exclude=exclude)
+        if next_ is not None:
+            timeout = min(next_, timeout) if timeout is not None else next_
+        for sub_ids in grouped_slice(task_ids, count=size):
+            tasks.start(*keys)
+            queue.run(list(sub_ids), callback=partial(tasks.done, keys))
+            pulled += 1
+
+    limited = [n for n in limits if not names or n in names]
+    for name in limited:
+        free = min(
+            limit - pulled, limits[name] - tasks.count(('queue', name)))
+        if free > 0:
+            run((('db', database_name), ('queue', name)), name, free)
+    if names:
+        others = [n for n in names if n not in limits]
+    else:
+        others = None
+    if limit > pulled and (others or not names):
+        run((('db', database_name),), others, limit - pulled,
+            exclude=limited)
+    return bool(pulled), timeout
 
 
 def work(options):
@@ -57,30 +265,60 @@ def work(options):
         processes = options.processes or cpu_count()
     except NotImplementedError:
         processes = 1
-    logger.info("start %d workers", processes)
-    mpool = MPool(
-        processes, initializer, (options.database_names,),
-        options.maxtasksperchild)
+    if options.threads:
+        logger.info("start %d worker threads", processes)
+        # The threads share the pools, caches and connections of the process
+        initializer(options.database_names, worker=False)
+        mpool = ThreadPool(processes)
+    else:
+        logger.info("start %d workers", processes)
+        mpool = MPool(
+            processes, initializer, (options.database_names,),
+            options.maxtasksperchild)
     queues = [Queue(name, mpool) for name in options.database_names]
+    limits = get_limits()
+    weights = {
+        q.database.name: max(
+            config.getint('queue weight', q.database.name, default=1), 1)
+        for q in queues}
+    total_weight = sum(weights.values())
+
+    def load(queue):
+        name = queue.database.name
+        return tasks.count(('db', name)) / weights[name]
 
-    tasks = TaskList()
+    tasks = TaskList(
+        processes, wakeup=[('queue', name) for name in limits])
     selector = selectors.DefaultSelector()
+    selector.register(tasks, selectors.EVENT_READ)
     for queue in queues:
         selector.register(queue.connection, selectors.EVENT_READ)
     try:
         while True:
             timeout = options.timeout
-            while len(tasks.filter()) >= processes:
-                time.sleep(0.1)
-            for queue in queues:
-                task_id, next_ = queue.pull(options.name)
+            tasks.wait()
+            pulled = False
+            # Serve first the databases with the lowest weighted load
+            for queue in sorted(queues, key=load):
+                free = tasks.free()
+                if not free:
+                    break
+                # Claim at most the share of the database
+                name = queue.database.name
+                share = math.ceil(processes * weights[name] / total_weight)
+                limit = min(
+                    free, max(share - tasks.count(('db', name)), 1))
+                has_pulled, next_ = pull(
+                    queue, tasks, limit, names=options.names, limits=limits,
+                    size=tasks_per_transaction)
                 if next_ is not None:
                     timeout = min(next_, timeout)
-                if task_id:
-                    tasks.append(queue.run(task_id))
-                    break
-            else:
+                pulled |= has_pulled
+            if not pulled:
                 for key, _ in selector.select(timeout=timeout):
+                    if key.fileobj is tasks:
+                        tasks.clear()
+                        continue
                     connection = key.fileobj
                     connection.poll()
                     while connection.notifies:
@@ -89,6 +327,7 @@ def work(options):
         mpool.close()
     finally:
         selector.close()
+        tasks.close()
 
 
 def initializer(database_names, worker=True):
@@ -105,13 +344,79 @@ def initializer(database_names, worker=True):
     return pools
 
 
-def run_task(pool, task_id):
+def get_pool(pool):
     if not isinstance(pool, Pool):
         database_list = Pool.database_list()
         pool = Pool(pool)
         if pool.database_name not in database_list:
             with Transaction().start(pool.database_name, 0, readonly=True):
                 pool.init()
+    return pool
+
+
+def run_tasks(pool, task_ids):
+    """Run the tasks with the same method in the same transaction
+    and retry alone those which failed."""
+    if len(task_ids) == 1:
+        return run_task(pool, task_ids[0])
+    pool = get_pool(pool)
+    Queue = pool.get('ir.queue')
+
+    with Transaction().start(pool.database_name, 0, readonly=True):
+        groups = defaultdict(list)
+        for task in Queue.search(
+                [('id', 'in', task_ids)], order=[('id', 'ASC')]):
+            groups[task.data['model'], task.data['method']].append(task.id)
+
+    failed = []
+    for group_ids in groups.values():
+        failed.extend(run_batch(pool, group_ids))
+    for task_id in failed:
+        run_task(pool, task_id)
+
+
+def run_batch(pool, task_ids):
+    "Run the tasks in the same transaction and return the failed ids"
+    Queue = pool.get('ir.queue')
+    started = time.monotonic()
+    name = '<Tasks %s@%s>' % (
+        ', '.join(map(str, task_ids)), pool.database_name)
+    done, failed = [], []
+    try:
+        with Transaction().start(pool.database_name, 0) as transaction:
+            for task in Queue.browse(task_ids):
+                stat = task_stat(pool.database_name, task)
+                latency = task_latency(task)
+                task_started = time.monotonic()
+                try:
+                    with transaction.savepoint(), \
+                            processing('<Task %s@%s>' % (
+                                    task.id, pool.database_name)):
+                        task.run()
+                except Exception:
+                    stat.retry()
+                    failed.append(task.id)
+                else:
+                    done.append((
+                            stat, latency, task.expected_at,
+                            time.monotonic() - task_started))
+    except Exception:
+        logger.info(
+            "%s failed to commit, retrying alone", name,
+            exc_info=logger.isEnabledFor(logging.DEBUG))
+        for stat, *_ in done:
+            stat.retry()
+        return task_ids
+    for stat, latency, expected_at, duration in done:
+        stat.start(latency)
+        stat.finish(duration, expected_at=expected_at)
+    logger.info(
+        "%s in %i ms", name, (time.monotonic() - started) * 1000)
+    return failed
+
+
+def run_task(pool, task_id):
+    pool = get_pool(pool)
     Queue = pool.get('ir.queue')
     Error = pool.get('ir.error')
 
@@ -120,6 +425,7 @@ def run_task(pool, task_id):
     started = time.monotonic()
     name = '<Task %s@%s>' % (task_id, pool.database_name)
     retry = config.getint('database', 'retry')
+    stat = expected_at = None
     try:
         for count in range(retry, -1, -1):
             if count != retry:
@@ -131,6 +437,10 @@ def run_task(pool, task_id):
                     except ValueError:
                         # the task was rollbacked, nothing to do
                         break
+                    if stat is None:
+                        stat = task_stat(pool.database_name, task)
+                        stat.start(task_latency(task))
+                        expected_at = task.expected_at
                     with processing(name):
                         task.run()
                     break
@@ -138,13 +448,20 @@ def run_task(pool, task_id):
                     if count:
                         transaction.rollback()
                         logger.debug("Retry: %i", retry - count + 1)
+                        if stat:
+                            stat.retry()
                         continue
                     raise
                 except (UserError, UserWarning) as e:
                     Error.log(task, e)
                     raise
+        if stat:
+            stat.finish(duration() / 1000, expected_at=expected_at)
         logger.info("%s in %i ms", name, duration())
     except backend.DatabaseOperationalError:
+        if stat:
+            stat.finish(
+                duration() / 1000, expected_at=expected_at, failed=True)
         logger.info(
             "%s failed after %i ms, retrying", name, duration(),
             exc_info=logger.isEnabledFor(logging.DEBUG))
@@ -162,14 +479,24 @@ def run_task(pool, task_id):
                     duration = dt.timedelta(seconds=2 * retry)
                 duration = max(duration, dt.timedelta(hours=1))
                 scheduled_at = dt.datetime.now() + duration * random.random()
-                Queue.push(task.name, task.data, scheduled_at=scheduled_at)
+                Queue.push(
+                    task.name, task.data, scheduled_at=scheduled_at,
+                    priority=task.priority)
+                if stat:
+                    stat.reschedule()
         except Exception:
             logger.critical(
                 "rescheduling %s failed", name, exc_info=True)
     except (UserError, UserWarning):
+        if stat:
+            stat.finish(
+                duration() / 1000, expected_at=expected_at, failed=True)
         logger.info(
             "%s failed after %i ms", name, duration(),
             exc_info=logger.isEnabledFor(logging.DEBUG))
     except Exception:
+        if stat:
+            stat.finish(
+                duration() / 1000, expected_at=expected_at, failed=True)
         logger.critical(
             "%s failed after %i ms", name, duration(), exc_info=True)
@@ -8,6 +8,7 @@ import posixpath
 import sys
 import traceback
 import urllib.parse
+import zlib
 
 try:
     from http import HTTPStatus
@@ -49,6 +50,13 @@ __all__ = ['TrytondWSGI', 'app']
 
 logger = logging.getLogger(__name__)
 
+COMPRESSIBLE_MIMETYPES = {
+    'application/javascript',
+    'application/json',
+    'application/xml',
+    'image/svg+xml',
+    }
+
 
 class Base64Converter(BaseConverter):
 
@@ -159,6 +167,37 @@ class TrytondWSGI(object):
                     response = Response(data)
         return response
 
+    def compress_response(self, request, response):
+        "Compress the response with gzip if the client accepts it"
+        level = config.getint('web', 'compression_level')
+        if (not level
+                or not isinstance(response, Response)
+                or response.status_code < 200
+                or response.status_code in {
+                    HTTPStatus.NO_CONTENT,
+                    HTTPStatus.PARTIAL_CONTENT,
+                    HTTPStatus.NOT_MODIFIED}
+                or 'Content-Encoding' in response.headers
+                or not _compressible(response.mimetype)):
+            return response
+        response.vary.add('Accept-Encoding')
+        if not request.accept_encodings['gzip']:
+            return response
+        if response.is_streamed:
+            response.response = _gzip(response.iter_encoded(), level)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < config.getint('web', 'compression_min_size'):
+                return response
+            response.set_data(b''.join(_gzip([data], level)))
+        response.headers['Content-Encoding'] = 'gzip'
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            # A strong entity tag must differ per content coding
+            response.set_etag(etag + '-gzip')
+        return response
+
     def wsgi_app(self, environ, start_response):
         for cls in self.protocols:
             if cls.content_type in environ.get('CONTENT_TYPE', ''):
@@ -192,10 +231,11 @@ class TrytondWSGI(object):
                 response = self.make_response(request, data)
             else:
                 response = data
+        response = self.compress_response(request, response)
 
         if origin and isinstance(response, Response):
             response.headers['Access-Control-Allow-Origin'] = origin
-            response.headers['Vary'] = 'Origin'
+            response.vary.add('Origin')
             method = request.headers.get('Access-Control-Request-Method')
             if method:
                 response.headers['Access-Control-Allow-Methods'] = method
@@ -210,6 +250,22 @@ class TrytondWSGI(object):
         return self.wsgi_app(environ, start_response)
 
 
+def _compressible(mimetype):
+    # The binary formats are already compressed or do not compress well
+    return (mimetype.startswith('text/')
+        or mimetype in COMPRESSIBLE_MIMETYPES
+        or mimetype.endswith(('+json', '+xml')))
+
+
+def _gzip(chunks, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
 class SharedDataMiddlewareIndex(SharedDataMiddleware):
     def __call__(self, environ, start_response):
         if environ['REQUEST_METHOD'] not in {'GET', 'HEAD'}: